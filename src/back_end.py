@@ -1,16 +1,24 @@
 # back_end.py
 import subprocess
 import re
-import io
-import json
 import os
 import logging
 import shutil
-import pexpect
 import sys
 import ipaddress # <<< MÓDULO IMPORTADO PARA VALIDAÇÃO DE IP
+import errno
+from config_store import ConfigStore
+from route_index import RouteIndex, migrate_config, needs_migration, ROUTES_SCHEMA_VERSION
+from tunnel_monitor import TunnelMonitor
+from reconnect import ReconnectSupervisor
+from timing import Timeline, timed
 
 
+# Policy routing: as rotas da VPN ficam numa tabela própria, escolhida por uma
+# `ip rule` antes da tabela main; desconectar vira um único flush da tabela.
+POLICY_ROUTE_TABLE = 115     # O mesmo número do protocolo das rotas (RTPROT_SNX_CONNECT)
+POLICY_RULE_PRIORITY = 5115  # Antes da regra da main (32766)
+
 # --- Exceções Customizadas ---
 # É uma boa prática criar exceções específicas para o seu domínio.
 # Isso torna o tratamento de erros no Controller muito mais claro.
@@ -34,39 +42,6 @@ class DependencyError(VpnError):
     """Raised for errors related to system dependencies."""
     pass
 
-# --- Classe de Utilitários (Dependência Interna do Model) ---
-class Utils:
-    """Utility functions for reading/writing JSON configuration."""
-    def __init__(self):
-        config_dir = os.path.join(os.path.expanduser("~"), ".config", "snx-connect")
-        os.makedirs(config_dir, exist_ok=True)
-        self.config_file = os.path.join(config_dir, "snx-data.json")
-
-    def read_json(self):
-        try:
-            with open(self.config_file, "r") as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
-
-    def write_json(self, data):
-        with open(self.config_file, "w") as f:
-            json.dump(data, f, indent=4)
-
-    def extract_ip_addresses(self, nslookup_output_lines):
-        ips = set()
-        address_pattern = re.compile(r"^\s*Address:\s*([0-9a-fA-F.:]+)")
-        for i, line in enumerate(nslookup_output_lines):
-            if line.lstrip().startswith("Name:"):
-                if i + 1 < len(nslookup_output_lines):
-                    next_line = nslookup_output_lines[i + 1]
-                    match = address_pattern.match(next_line)
-                    if match:
-                        ip = match.group(1)
-                        if ":" not in ip: # Filtra endereços IPv6
-                            ips.add(ip)
-        return list(ips)
-
 # --- O Model Principal ---
 class VpnManager:
     """
@@ -76,13 +51,75 @@ class VpnManager:
     """
     def __init__(self):
         self.logger = logging.getLogger(self.__class__.__name__)
-        self.utils = Utils()
-        self.office_mode_ip = self.utils.read_json().get("ip")
+        self.config = ConfigStore.default()
+        self._migrate_config()
+        self.office_mode_ip = self.config.get("ip")
         self.server = None
         self.username = None
         self.password = None
         self.keep_info = False
-        self.monitor_process = None
+        self.monitor = TunnelMonitor()
+        self.monitor.add_listener(self._on_tunnel_state_changed)
+        self.reconnect_listeners = []
+        self.timeline = Timeline()
+        self.reconnector = ReconnectSupervisor(self._run_reconnect_attempt, on_event=self._on_reconnect_event)
+        # Roda cada tentativa de reconexão; o Controller troca por uma tarefa
+        # na mesma fila do login (ver set_reconnect_runner).
+        self.reconnect_runner = lambda attempt, cancelled: attempt()
+        # Helper privilegiado e resolvedor DNS são criados no primeiro uso,
+        # para não pesarem na inicialização da aplicação.
+        self._privileged = None
+        self._resolver = None
+        self._refresher = None
+        # Aplica as mudanças vindas do agendador de DNS; o Controller troca por
+        # um despacho na fila de rotas (ver set_route_dispatcher).
+        self.route_dispatch = lambda fn, *args: fn(*args)
+        self._index = None
+        self._index_revision = None  # revisão da seção "routes" da config usada no índice
+        self._route_table = None  # (chave, RouteTable), ver _current_route_table
+
+    @property
+    def privileged(self):
+        if self._privileged is None:
+            from privileged_helper import PrivilegedSession
+            self._privileged = PrivilegedSession()
+        return self._privileged
+
+    @privileged.setter
+    def privileged(self, session):
+        self._privileged = session
+
+    @property
+    def resolver(self):
+        if self._resolver is None:
+            from dns_resolver import DnsResolver
+            tunnel_dns = self.config.get("tunnelDns") or {}
+            if tunnel_dns.get("servers"):
+                # DNS do túnel em paralelo; o do sistema resolve o que eles não conhecem
+                self._resolver = DnsResolver(
+                    tunnel_dns["servers"], tunnel_dns.get("search") or None,
+                    race=True, fallback=DnsResolver(),
+                )
+            else:
+                self._resolver = DnsResolver()
+        return self._resolver
+
+    @resolver.setter
+    def resolver(self, resolver):
+        self._resolver = resolver
+
+    @property
+    def route_refresher(self):
+        if self._refresher is None:
+            from route_refresh import RouteRefresher
+            # Pelo atributo a cada chamada: o resolvedor muda quando o DNS do túnel muda
+            self._refresher = RouteRefresher(lambda name: self.resolver.resolve(name), self._on_domain_changed)
+        return self._refresher
+
+    def stop_privileged_session(self):
+        """Ends the privileged helper, if one was started. Installed routes stay."""
+        if self._privileged is not None:
+            self._privileged.stop()
 
     # --- Dependency Management ---
     def check_dependencies(self):
@@ -92,14 +129,6 @@ class VpnManager:
             "pkexec_installed": shutil.which("pkexec") is not None,
         }
     
-    def set_keep_routes(self, keep):
-        """Sets whether to keep routes on disconnect."""
-        data = self.utils.read_json()
-        print(f"Setting keep routes to: {keep}")
-        data["keepAddr"] = keep
-        self.utils.write_json(data)
-        self.logger.info(f"Keep routes set to: {keep}")
-
     def install_snx(self):
         """Attempts to install SNX using the local script. Synchronous."""
         self.logger.info("Attempting to install SNX via local script...")
@@ -124,95 +153,207 @@ class VpnManager:
         
 
 
-    def _start_monitor_process(self):
-        """Lança o script de monitorização em segundo plano."""
-        if self.monitor_process and self.monitor_process.poll() is None:
-            self.logger.info("Monitor process is already running.")
-            return
-
-        try:
-            script_dir = os.path.dirname(os.path.abspath(__file__))
-            monitor_script_path = os.path.join(script_dir, 'background_monitor.py')
+    # --- Tunnel Monitoring ---
+    def add_tunnel_listener(self, listener):
+        """Registers `listener(connected)`, called from the monitor thread on every tunnel transition."""
+        self.monitor.add_listener(listener)
 
-            if not os.path.exists(monitor_script_path):
-                self.logger.error("background_monitor.py not found. Cannot start monitoring.")
-                return
+    def remove_tunnel_listener(self, listener):
+        self.monitor.remove_listener(listener)
 
-            # Usamos Popen para lançar o script como um processo filho.
-            self.monitor_process = subprocess.Popen(['python3', monitor_script_path])
-            self.logger.info(f"Background monitor process started with PID: {self.monitor_process.pid}")
-        except Exception as e:
-            self.logger.error(f"Failed to start background monitor: {e}")
-
-    def _stop_monitor_process(self):
-        """Encontra e termina o processo de monitorização em segundo plano."""
-        if self.monitor_process and self.monitor_process.poll() is None:
-            self.logger.info(f"Stopping background monitor process with PID: {self.monitor_process.pid}")
-            self.monitor_process.terminate() # Envia um sinal de terminação
-            self.monitor_process = None
+    def _on_tunnel_state_changed(self, connected):
+        if connected:
+            self.logger.info("VPN tunnel is up again.")
         else:
-            self.logger.info("No active monitor process to stop.")
+            self.logger.warning("VPN tunnel dropped.")
+            if self.get_auto_reconnect() and self.server:
+                self.reconnector.trigger()
+
+    # --- Auto Reconnect ---
+    def get_auto_reconnect(self):
+        return self.config.get("autoReconnect", False)
+
+    def set_auto_reconnect(self, enabled):
+        """Sets whether a dropped tunnel is reconnected automatically."""
+        self.logger.info(f"Setting auto reconnect to: {enabled}")
+        self.config.set("autoReconnect", enabled)
+        if not enabled:
+            self.reconnector.cancel(wait=False)
+
+    def set_reconnect_runner(self, runner):
+        """
+        `runner(attempt, cancelled)` runs one reconnect attempt and returns
+        when it's over, raising its error; `cancelled()` tells whether the
+        recovery was stopped meanwhile (default: runs it inline).
+        """
+        self.reconnect_runner = runner
+
+    def cancel_reconnect(self):
+        """Stops a running automatic reconnect without waiting for it."""
+        self.reconnector.cancel(wait=False)
+
+    def get_connect_timings(self, limit=None):
+        """
+        Returns the last connect traces: {"started_at", "duration", "ok", "error",
+        "attrs": {"server"}, "spans": [{"name", "offset", "duration", "ok"}]}.
+        """
+        return self.timeline.history("connect", limit)
+
+    def get_connect_timing_summary(self):
+        """Per-phase connect statistics, grouped by server."""
+        return self.timeline.summary("connect", group_by="server")
+
+    def get_reconnect_history(self):
+        """Returns the last incidents as dicts with attempts, state, error and time_to_recovery."""
+        return self.reconnector.history()
+
+    def add_reconnect_listener(self, listener):
+        """Registers `listener(event)`, called from the reconnect thread."""
+        if listener not in self.reconnect_listeners:
+            self.reconnect_listeners.append(listener)
+
+    def _on_reconnect_event(self, event):
+        for listener in list(self.reconnect_listeners):
+            listener(event)
+
+    def _run_reconnect_attempt(self):
+        self.reconnect_runner(self._reconnect, self.reconnector.is_cancelled)
+
+    def _reconnect(self):
+        """One reconnect attempt, reusing the parameters of the dropped session."""
+        if self.reconnector.is_cancelled():
+            return  # O usuário desconectou enquanto a tentativa esperava na fila
+        # Encerra a sessão antiga, senão o snx responde "Another session" com o túnel caído.
+        subprocess.run(["snx", "-d"], capture_output=True, text=True)
+        self.connect(self.server, self.username, self.password, self.keep_info)
+        if not self.config.get("keepAddr", False):
+            # As rotas da sessão continuam no índice: reinstala todas num único lote.
+            self._reconcile_after_connect()
 
     # --- Connection Logic ---
     def connect(self, server, username, password, keep_info):
         """Connects to the VPN. This is a blocking, synchronous method."""
-        self.server = server
-        self.username = username
-        self.password = password
-        self.keep_info = keep_info
-        
-        self._start_monitor_process()
-        if not all([server, username, password]):
-            raise ConnectionError("Server, username, and password must be provided.")
-        
-        command = f"snx -s {server} -u {username}"
-        try:
-            child = pexpect.spawn(command, encoding='utf-8', logfile=sys.stdout)
-            
-            child.expect("[Pp]assword:", timeout=15)
-            child.sendline(password)
-            
-            index = child.expect(['accept?', 'Office', pexpect.EOF], timeout=30)
-            
-            if index == 0: # 'accept?'
-                child.sendline("y")
-                child_index = child.expect(['Office','denied'], timeout=20)
-                if child_index == 1: # 'denied'
-                    raise ConnectionError("Connection denied by SNX. Check your credentials or server settings.")
-                elif child_index == 0: # 'Office'
-                    self.logger.info("Accepted connection request.")
-                    result = self.get_ip_and_connect(child.buffer,None)
-                    return result
-                    
-            elif index == 2: # EOF
-                raise ConnectionError("SNX process ended unexpectedly after password.")
-            
-            else: # 'Office'
-                self.logger.info("Connected to SNX without needing to accept terms.")
-                result = self.get_ip_and_connect(child.buffer, None)
-                return result
-            
-            child.expect(pexpect.EOF) # Wait for the process to finish
-
-        except pexpect.exceptions.TIMEOUT:
-            raise ConnectionError("Connection timed out waiting for a response from SNX.")
-        except pexpect.exceptions.EOF:
-            output = child.before
-            if "Another session" in output:
-                storage_ip = self.utils.read_json().get('ip')
-                if storage_ip:
-                    self.office_mode_ip = storage_ip
-                    self.logger.info(f"Using stored Office Mode IP: {self.office_mode_ip}")
-                    return self.get_ip_and_connect(output, storage_ip)
-                else:
+        import asyncio # Só é necessário ao conectar
+        return asyncio.run(self.connect_async(server, username, password, keep_info))
+
+    async def connect_async(self, server, username, password, keep_info):
+        """
+        Connects to the VPN without blocking the event loop. Cancelling the
+        task kills snx; the post-connect work runs on a worker thread.
+        If tunsnx is already up with the stored Office Mode IP, that session
+        is adopted without running snx ("resumed": True in the result).
+        A cancel that arrives during the post-connect work disconnects again
+        once that work is over, so nothing is left up behind the login screen.
+        """
+        import asyncio
+        from snx_session import SnxSession, SnxError
+        with self.timeline.trace("connect", server=server):
+            self.server = server
+            self.username = username
+            self.password = password
+            self.keep_info = keep_info
+
+            if not all([server, username, password]):
+                raise ConnectionError("Server, username, and password must be provided.")
+
+            with self.timeline.span("resume_check"):
+                resumable_ip = self._resumable_ip()
+            if resumable_ip:
+                self.logger.info(f"Tunnel already up with {resumable_ip}, resuming the existing session.")
+                result = await self._connect_in_thread("", resumable_ip)
+                return dict(result, resumed=True)
+
+            session = SnxSession(on_output=self._echo_snx_output, timeline=self.timeline)
+            try:
+                outcome = await session.connect(server, username, password)
+            except SnxError as e:
+                raise ConnectionError(str(e))
+
+            if outcome["state"] == "another_session":
+                # O endereço real do túnel vale mais que o salvo (pode estar desatualizado)
+                storage_ip = next(iter(self._tunnel_addresses()), None) or self.config.get('ip')
+                if not storage_ip:
                     raise ConnectionError("Another session detected, but no stored IP found.")
+                self.office_mode_ip = storage_ip
+                self.logger.info(f"Using stored Office Mode IP: {self.office_mode_ip}")
+                result = await self._connect_in_thread(outcome["output"], storage_ip)
+                return dict(result, resumed=True)
+            self._set_tunnel_dns(outcome["dns_servers"], outcome["dns_suffixes"])
+            result = await self._connect_in_thread(outcome["output"], None)
+            return dict(result, resumed=False)
+
+    async def _connect_in_thread(self, output, ip):
+        """
+        get_ip_and_connect() on a worker thread. The thread can't be stopped,
+        so when the connect is cancelled meanwhile it is waited for and then
+        undone with a disconnect before the cancellation goes on.
+        """
+        import asyncio
+        work = asyncio.ensure_future(asyncio.to_thread(self.get_ip_and_connect, output, ip))
+        try:
+            return await asyncio.shield(work)
+        except asyncio.CancelledError:
+            self.logger.info("Connect cancelled while bringing the session up, undoing it.")
+            try:
+                await work
+            except Exception as e:
+                self.logger.warning(f"Cancelled connect also failed: {e}")
+            try:
+                await asyncio.to_thread(self.disconnect)
+            except VpnError as e:
+                self.logger.error(f"Failed to undo the cancelled connect: {e}")
+            raise
+
+    def _resumable_ip(self):
+        """The stored Office Mode IP, if tunsnx is up right now with that address."""
+        stored_ip = self.config.get("ip")
+        if not stored_ip:
+            return None
+        return stored_ip if stored_ip in self._tunnel_addresses() else None
+
+    def _tunnel_addresses(self):
+        try:
+            return self.monitor.addresses()
+        except OSError as e:
+            self.logger.warning(f"Could not read the tunnel addresses: {e}")
+            return []
+
+    def _set_tunnel_dns(self, servers, search):
+        """
+        Keeps the DNS servers and suffixes pushed with Office Mode for this
+        session (a resumed session reuses them), so routes are resolved
+        through the tunnel.
+        """
+        with self.config.update() as data:
+            if servers:
+                data["tunnelDns"] = {"servers": servers, "search": search}
             else:
-                raise ConnectionError("SNX process terminated unexpectedly before connection.")
-        finally:
-            if 'child' in locals() and child.isalive():
-                child.close()
+                data.pop("tunnelDns", None)
+        self._resolver = None
+        if servers:
+            self.logger.info(f"Tunnel DNS servers: {', '.join(servers)}")
+
+    def get_dns_status(self):
+        """
+        Returns {"servers", "search", "tunnel", "stats"}: the name servers routes
+        are resolved with, whether they came from the tunnel, and how each one
+        has been answering (see DnsResolver.server_stats).
+        """
+        resolver = self.resolver
+        return {
+            "servers": list(resolver.nameservers),
+            "search": list(resolver.search),
+            "tunnel": resolver.fallback is not None,
+            "stats": resolver.server_stats(),
+        }
+
+    def _echo_snx_output(self, text):
+        # Ecoa a saída do snx no stdout, como no terminal
+        sys.stdout.write(text)
+        sys.stdout.flush()
 
 
+    @timed("get_ip_and_connect")
     def get_ip_and_connect(self,output,ip):
         if not ip:
             pattern = r"Mode IP\s+:\s+([0-9\.]+)"
@@ -228,76 +369,128 @@ class VpnManager:
             
         # Persist data if requested
         self._update_connection_data(self.server, self.username, self.password, self.keep_info)
-        
-        config = self.utils.read_json()
-        if config.get("keepAddr", False):
+
+        if self.config.get("keepAddr", False):
             self.logger.info("Keeping routes on disconnect as per user settings.")
-            self._auto_add_saved_routes()
+            self._reconcile_after_connect()
         else:
             self.logger.info("Not keeping routes on disconnect as per user settings.")
-            
+        self._start_route_refresh()
+
+        self.monitor.start()
         return {"status": True, "office_ip": self.office_mode_ip}
         
+    @timed("update_connection_data")
     def _update_connection_data(self, server, username, password, keep_info):
         """Saves connection info to the JSON file."""
-        data = self.utils.read_json()
-        data["ip"] = self.office_mode_ip
-        if keep_info:
-            data["server"] = server
-            data["username"] = username
-            data["password"] = password
-            data["keepinfo"] = True
-        self.utils.write_json(data)
+        with self.config.update() as data:
+            data["ip"] = self.office_mode_ip
+            if keep_info:
+                data["server"] = server
+                data["username"] = username
+                data["password"] = password
+                data["keepinfo"] = True
     
-    def _auto_add_saved_routes(self):
-        """Internal method to add all saved routes after connecting."""
-        if not self.office_mode_ip:
-            self.logger.error("Cannot auto-add routes, Office Mode IP is not available.")
-            return
+    # --- Route Reconciliation ---
+    @timed("reconcile_routes")
+    def reconcile_routes(self):
+        """
+        Makes the kernel route table match the saved routes for the current
+        Office Mode IP. The table is read first (no privileges needed) and only
+        the difference is applied: missing routes are added, and routes this
+        app installed that are no longer saved, or point to an old Office Mode
+        IP, are deleted. When nothing changed, nothing is sent to the helper.
+        With policy routing the dedicated table is the one reconciled, its rule
+        is put in place, and when none of its routes can be kept it is flushed.
+        Returns {"status", "added", "removed", "unchanged", "failed"}.
+        """
+        result = {"status": False, "added": 0, "removed": 0, "unchanged": 0, "failed": []}
+        if not self.office_mode_ip or self.office_mode_ip not in self._tunnel_addresses():
+            self.logger.info("No active tunnel, nothing to reconcile.")
+            return result
+
+        from netlink_routes import NetlinkRouteEngine, NetlinkError, RTPROT_SNX_CONNECT, RT_TABLE_MAIN
+        table = self._policy_table()
+        plan = {}
+        for destination in self._route_plan(self._route_index(), *self._aggregation_settings()):
+            plan[str(ipaddress.ip_network(destination, strict=False))] = destination
+        try:
+            kernel = NetlinkRouteEngine().list_routes(table or RT_TABLE_MAIN)
+        except NetlinkError as e:
+            raise RouteError(f"Could not read the route table: {e}")
+
+        present, stale = set(), {}  # stale: gateway -> destinos
+        for route in kernel:
+            if route["destination"] in plan and route["gateway"] == self.office_mode_ip:
+                present.add(route["destination"])
+            elif route["protocol"] == RTPROT_SNX_CONNECT:
+                stale.setdefault(route["gateway"], []).append(route["destination"])
+        to_add = [plan[dst] for dst in plan if dst not in present]
+
+        if table is not None:
+            self._add_policy_rule(table)
+        if stale and table is not None and not present:
+            # Nada a manter na tabela dedicada (ex.: o Office Mode IP mudou): um flush só
+            results = self._helper_call(self.privileged.flush_table, table)
+            result["failed"] += self._failed_routes(results, errno.ESRCH)
+            result["removed"] += sum(r["ok"] for r in results)
+            stale = {}
+        for gateway, destinations in stale.items():
+            results = self._apply_routes("delete", destinations, gateway=gateway)
+            result["failed"] += self._failed_routes(results, errno.ESRCH)
+            result["removed"] += sum(r["ok"] for r in results)
+        if to_add:
+            results = self._apply_routes("add", to_add, sysctl={"net.ipv6.conf.all.disable_ipv6": 1})
+            result["failed"] += self._failed_routes(results, errno.EEXIST)
+            result["added"] += sum(r["ok"] for r in results)
+        result["unchanged"] = len(present)
+        result["status"] = not result["failed"]
+
+        self.logger.info(
+            f"Routes reconciled: {result['added']} added, {result['removed']} removed, "
+            f"{result['unchanged']} already in place."
+        )
+        if result["failed"]:
+            self.logger.error(f"Failed to reconcile {len(result['failed'])} routes: {result['failed']}")
+        return result
+
+    def _reconcile_after_connect(self):
+        try:
+            self.reconcile_routes()
+        except VpnError as e:
+            # Log the error but don't crash the connection process
+            self.logger.error(f"Failed to reconcile routes: {e}")
 
-        routes_data = self.utils.read_json()
-        commands = []
-        for key, value in routes_data.items():
-            if key.endswith("Address") and isinstance(value, list):
-                for ip in value:
-                    commands.append(f"ip route add {ip} via {self.office_mode_ip}")
-        print(commands)
-        
-        if commands:
-            commands.append("sysctl -w net.ipv6.conf.all.disable_ipv6=1")
-            self.logger.info("Executing auto-add route script.")
-            try:
-                self._run_privileged_commands(commands)
-                self.logger.info("Successfully auto-added saved routes.")
-            except VpnError as e:
-                # Log the error but don't crash the connection process
-                self.logger.error(f"Failed to auto-add routes: {e}")
-        else:
-            self.logger.info("No saved routes to auto-add.")
-        
     # --- Disconnection Logic ---
     def disconnect(self):
         """Disconnects from the VPN. Synchronous."""
         try:
-            self._stop_monitor_process()
+            self.reconnector.cancel()
+            self.monitor.stop()
+            if self._refresher is not None:
+                self._refresher.stop()
             self.logger.info("Attempting VPN disconnection using 'snx -d'.")
             subprocess.run("snx -d", shell=True, check=True, text=True, capture_output=True)
             self._delete_saved_routes()
             self._update_json_on_disconnect()
+            self.stop_privileged_session()
             self.office_mode_ip = None
+            self._resolver = None  # O DNS do túnel saiu junto com a configuração
             return {"message": "Disconnected successfully."}
         except subprocess.CalledProcessError as e:
             self.logger.warning(f"'snx -d' failed. This might be normal. Stderr: {e.stderr}")
             # Assume disconnection anyway and proceed with cleanup
             self._delete_saved_routes()
             self._update_json_on_disconnect()
+            self.stop_privileged_session()
+            self._resolver = None
             return {"message": "Disconnected, 'snx -d' reported an error (might be ok)."}
         except Exception as e:
             raise DisconnectionError(f"A critical error occurred: {e}")
 
     def _update_json_on_disconnect(self):
         """Cleans up the JSON file on disconnect based on user settings."""
-        data = self.utils.read_json()
+        data = self.config.view()
         final_data = {}
         if data.get("keepinfo", False):
             final_data = {
@@ -308,22 +501,71 @@ class VpnManager:
             }
             if data.get("keepAddr", False):
                 final_data["keepAddr"] = True
-                for key, value in data.items():
-                    if key.endswith("Address"):
-                        final_data[key] = value
-        self.utils.write_json(final_data)
+                final_data["routes"] = data.get("routes", {})
+                final_data["routesVersion"] = ROUTES_SCHEMA_VERSION
+        for key in ("aggregateRoutes", "aggregationBudget", "autoReconnect", "policyRouting", "routeTable"):
+            if key in data:
+                final_data[key] = data[key]
+        self.config.write(final_data)
 
     # --- Route Management Logic ---
     def get_saved_routes(self):
         """Retrieves saved routes from the configuration file."""
-        data = self.utils.read_json()
-        routes = []
-        for key, value in data.items():
-            if key.endswith("Address") and isinstance(value, list):
-                domain = key.replace("Address", "")
-                for ip in value:
-                    routes.append({"domain": domain, "ip": ip})
-        return routes
+        return self._route_index().routes()
+
+    def search_routes(self, query, mode="auto", limit=None):
+        """
+        Saved routes matching `query` (see RouteIndex.search for the modes),
+        looked up in the search index instead of scanning every route.
+        Returns {"routes", "total"}; `routes` has at most `limit` entries.
+        """
+        try:
+            routes = self._route_index().search(query, mode)
+        except ValueError as e:
+            raise RouteError(str(e))
+        return {"routes": routes[:limit] if limit is not None else routes, "total": len(routes)}
+
+    def lookup_routes(self, hosts):
+        """
+        Longest-prefix match of each host (IPv4 address, CIDR or name) against
+        the routes sent through the VPN. Names are resolved first, all of them
+        concurrently. Returns {"lookups": [{"host", "routed", "addresses",
+        "error"}], "connected"}, where each entry of `addresses` comes from
+        RouteTable.lookup and `connected` says whether the tunnel is up.
+        """
+        from route_refresh import is_domain
+        from route_table import ipv4_span
+        hosts = [host.strip() for host in hosts if host.strip()]
+        names = [host for host in hosts if ipv4_span(host) is None and is_domain(host)]
+        resolved, failed = self.resolver.resolve_many(names) if names else ({}, {})
+        table = self._current_route_table()
+
+        lookups = []
+        for host in hosts:
+            entry = {"host": host, "routed": False, "addresses": [], "error": None}
+            if host in failed:
+                entry["error"] = failed[host]
+            else:
+                addresses = [r["address"] for r in resolved[host]] if host in resolved else [host]
+                try:
+                    entry["addresses"] = [table.lookup(address) for address in addresses]
+                except ValueError as e:
+                    entry["error"] = str(e)  # IPv6 e afins: nunca passam pelo túnel
+                entry["routed"] = any(match["routed"] for match in entry["addresses"])
+            lookups.append(entry)
+        connected = self.office_mode_ip is not None and self.office_mode_ip in self._tunnel_addresses()
+        return {"lookups": lookups, "connected": connected}
+
+    def _current_route_table(self):
+        """RouteTable of the current route plan, rebuilt only when the routes or the aggregation changed."""
+        from route_table import RouteTable
+        index = self._route_index()
+        settings = self._aggregation_settings()
+        key = (index, index.version, settings)
+        if self._route_table is None or self._route_table[0] != key:
+            table = RouteTable(self._route_plan(index, *settings), index.by_address)
+            self._route_table = (key, table)
+        return self._route_table[1]
 
     def add_route(self, domain):
         """Resolves a domain and adds system routes for it. Synchronous."""
@@ -332,33 +574,49 @@ class VpnManager:
         
         try:
             ip = ipaddress.ip_address(domain)
+        except ValueError:
+            ip = None
+        if ip is not None:
             self.logger.info(f"Input '{domain}' is a valid IP address.")
+            if ip.version != 4:
+                # O túnel só leva IPv4: a rota seria salva sem nunca ser instalada
+                raise RouteError(f"Cannot add route: {domain} is not an IPv4 address.")
             addresses = [str(ip)] # Usa o próprio IP como o endereço a ser adicionado
-        except:
+            ttl = None
+        else:
             self.logger.info(f"Input '{domain}' is not an IP, treating as a domain.")
+            from dns_resolver import DnsError
             try:
-                process = subprocess.run(
-                    f"nslookup {domain}", shell=True, capture_output=True, text=True, check=True
-                )
-                addresses = self.utils.extract_ip_addresses(process.stdout.splitlines())
-                if not addresses:
-                    raise RouteError(f"No valid IPv4 addresses found for {domain}.")
-            except subprocess.CalledProcessError:
-                raise RouteError(f"Failed to resolve domain: {domain}")
-            
-        commands = [f"ip route add {addr} via {self.office_mode_ip}" for addr in addresses]
-        self._run_privileged_commands(commands)
-        
-        # Persist the new route
-        data = self.utils.read_json()
-        route_key = f"{domain}Address"
-        if route_key not in data:
-            data[route_key] = []
-        for addr in addresses:
-            if addr not in data[route_key]:
-                data[route_key].append(addr)
-        self.utils.write_json(data)
+                records = self.resolver.resolve(domain)
+            except DnsError as e:
+                raise RouteError(str(e))
+            addresses = sorted({record["address"] for record in records})
+            ttl = min(record["ttl"] for record in records)
+
+        index = self._route_index()
+        aggregate, budget = self._aggregation_settings()
+        old_plan = self._route_plan(index, aggregate, budget) if aggregate else None
 
+        new_addresses = index.add(domain, addresses)
+        try:
+            if old_plan is not None:
+                failed = self._apply_plan_change(old_plan, self._route_plan(index, aggregate, budget))
+            elif new_addresses:
+                # Só endereços que nenhum outro domínio usava precisam de rota nova.
+                failed = self._failed_routes(self._apply_routes("add", new_addresses), errno.EEXIST)
+            else:
+                failed = []
+        except VpnError:
+            self._index = None # Descarta as alterações em memória
+            raise
+        if failed:
+            self._index = None
+            raise RouteError(f"Failed to add routes: {', '.join(failed)}")
+
+        # Persist the new route
+        self._commit_routes(index)
+        if self._refresher is not None:
+            self._refresher.track(domain, addresses, ttl=ttl)  # IPs são ignorados
         return {"status": True, "addresses": addresses}
         
     def remove_route(self, domain, ip_address):
@@ -366,54 +624,384 @@ class VpnManager:
         if not self.office_mode_ip:
             raise RouteError("Cannot remove route: Office Mode IP is not set.")
         
-        commands = [f"ip route del {ip_address} via {self.office_mode_ip}"]
-        self._run_privileged_commands(commands)
-        
-        # Remove from JSON
-        data = self.utils.read_json()
-        route_key = f"{domain}Address"
-        if route_key in data and ip_address in data[route_key]:
-            data[route_key].remove(ip_address)
-            if not data[route_key]: # Remove key if list is empty
-                del data[route_key]
-        self.utils.write_json(data)
+        index = self._route_index()
+        if not index.has(domain, ip_address):
+            return {"status": True}
+        aggregate, budget = self._aggregation_settings()
+        old_plan = self._route_plan(index, aggregate, budget) if aggregate else None
 
+        released = index.remove(domain, ip_address)
+        try:
+            if old_plan is not None:
+                # O agregado que cobria o endereço é dividido nos prefixos restantes.
+                failed = self._apply_plan_change(old_plan, self._route_plan(index, aggregate, budget))
+            elif released:
+                failed = self._failed_routes(self._apply_routes("delete", [ip_address]), errno.ESRCH)
+            else:
+                self.logger.info(f"Keeping route {ip_address}, still used by {index.domains_for(ip_address)}.")
+                failed = []
+        except VpnError:
+            self._index = None # Descarta as alterações em memória
+            raise
+        if failed:
+            self._index = None
+            raise RouteError(f"Failed to remove route: {', '.join(failed)}")
+
+        # Remove from JSON
+        self._commit_routes(index)
+        if self._refresher is not None and domain not in index.by_domain:
+            self._refresher.untrack(domain)
         return {"status": True}
     
+    def import_routes(self, source, fmt=None, progress=None):
+        """
+        Imports routes in bulk from a file path, or from stdin when `source`
+        is "-". Routes are installed in batches and the config is written once
+        at the end. Synchronous.
+        """
+        if not self.office_mode_ip:
+            raise RouteError("Cannot import routes: Office Mode IP is not set.")
+
+        index = self._route_index()
+        aggregate, budget = self._aggregation_settings()
+        if aggregate:
+            # Com agregação, as rotas são instaladas de uma vez no final.
+            old_plan = self._route_plan(index, aggregate, budget)
+            from netlink_routes import route_result
+            apply_routes = lambda batch: [route_result(addr) for addr in batch]
+        else:
+            apply_routes = lambda batch: self._apply_routes("add", batch)
+        from route_import import RouteImporter, iter_entries
+        importer = RouteImporter(
+            self.resolver.resolve_many,
+            apply_routes,
+            progress=progress,
+            known_addresses=index.addresses(),
+            ignored_errno=errno.EEXIST,
+        )
+        try:
+            if source == "-":
+                result = importer.run(iter_entries(sys.stdin, fmt))
+            else:
+                with open(source, "r") as f:
+                    result = importer.run(iter_entries(f, fmt, name=source))
+        except OSError as e:
+            raise RouteError(f"Cannot read import file: {e}")
+        except ValueError as e:
+            raise RouteError(f"Invalid import file: {e}")
+
+        # Persiste todas as rotas importadas de uma só vez
+        for entry, addresses in result["routes"].items():
+            index.add(entry, addresses)
+        if aggregate:
+            try:
+                failed = self._apply_plan_change(old_plan, self._route_plan(index, aggregate, budget))
+            except VpnError:
+                self._index = None # Descarta as alterações em memória
+                raise
+            if failed:
+                self._index = None
+                raise RouteError(f"Failed to install imported routes: {', '.join(failed[:10])}")
+        self._commit_routes(index)
+        self.logger.info(f"Imported {len(result['routes'])} routes, {len(result['failed'])} failures.")
+        if self._refresher is not None:
+            for entry, addresses in result["routes"].items():
+                self._refresher.track(entry, addresses, ttl=self._cached_ttl(entry))
+
+        return {
+            "status": True,
+            "imported": len(result["routes"]),
+            "failed": result["failed"],
+            "stats": result["stats"],
+        }
+
     def get_keep_routes_status(self):
-        """Recupera o estado da configuração 'keepAddress' do arquivo JSON."""
-        return self.utils.read_json().get("keepAddress", False)
+        """Recupera o estado da configuração 'keepAddr' do arquivo JSON."""
+        return self.config.get("keepAddr", False)
 
     def set_keep_routes(self, keep):
         """Define se deve manter as rotas ao desconectar."""
-        data = self.utils.read_json()
         self.logger.info(f"Setting keep routes to: {keep}")
-        data["keepAddress"] = keep
-        self.utils.write_json(data)
+        self.config.set("keepAddr", keep)
+
+    def get_route_aggregation(self):
+        """Returns the route aggregation settings as {"enabled", "budget"}."""
+        return {
+            "enabled": self.config.get("aggregateRoutes", False),
+            "budget": self.config.get("aggregationBudget", 0),
+        }
+
+    def set_route_aggregation(self, enabled, budget=None):
+        """
+        Enables or disables route aggregation. When connected, the installed
+        routes are swapped for the new plan right away.
+        """
+        index = self._route_index()
+        old_plan = self._route_plan(index, *self._aggregation_settings())
+        with self.config.update() as data:
+            data["aggregateRoutes"] = enabled
+            if budget is not None:
+                data["aggregationBudget"] = max(0, int(budget))
+            new_budget = data.get("aggregationBudget", 0)
+        self.logger.info(f"Setting route aggregation to: {enabled} (budget {new_budget})")
+        if self.office_mode_ip:
+            failed = self._apply_plan_change(old_plan, self._route_plan(index, enabled, new_budget))
+            if failed:
+                self.logger.error(f"Failed to apply the new route plan: {failed}")
+        return {"status": True}
+
+    def get_route_aggregates(self):
+        """Returns the aggregates for the saved routes, with the domains each one covers."""
+        from route_aggregation import aggregate_routes
+        return aggregate_routes(self._route_index().by_domain, self.config.get("aggregationBudget", 0))
+
+    def get_policy_routing(self):
+        """Returns {"enabled", "table", "priority"}: whether VPN routes go to a dedicated table."""
+        return {
+            "enabled": self.config.get("policyRouting", False),
+            "table": self.config.get("routeTable", POLICY_ROUTE_TABLE),
+            "priority": POLICY_RULE_PRIORITY,
+        }
+
+    def set_policy_routing(self, enabled, table=None):
+        """
+        Installs the VPN routes in a dedicated routing table, selected by an
+        `ip rule`, instead of the main table. When connected, the routes are
+        installed in their new place before the old ones are removed.
+        """
+        from netlink_routes import RESERVED_TABLES
+        valid = isinstance(table, int) and 0 < table <= 0xFFFFFFFF and table not in RESERVED_TABLES
+        if table is not None and not valid:
+            raise RouteError(f"Invalid routing table: {table} (main, local and default are reserved).")
+        old_table = self._policy_table()
+        with self.config.update() as data:
+            data["policyRouting"] = enabled
+            if table is not None:
+                data["routeTable"] = table
+        new_table = self._policy_table()
+        self.logger.info(f"Setting policy routing to: {enabled} (table {new_table})")
+        if old_table == new_table or not self.office_mode_ip or self.office_mode_ip not in self._tunnel_addresses():
+            return {"status": True}
+        result = self.reconcile_routes()
+        failed = result["failed"] + self._remove_vpn_routes(old_table)
+        if failed:
+            self.logger.error(f"Failed to move the routes to the new table: {failed}")
+        return {"status": not failed}
+
+    def _policy_table(self):
+        """The dedicated routing table in use, or None when routes go to the main table."""
+        settings = self.get_policy_routing()
+        return settings["table"] if settings["enabled"] else None
+
+    def _add_policy_rule(self, table):
+        result = self._helper_call(self.privileged.add_rule, table, POLICY_RULE_PRIORITY)
+        if not result["ok"] and result["errno"] != errno.EEXIST:
+            raise RouteError(f"Could not add the policy routing rule: {result['error']}")
+
+    def _remove_vpn_routes(self, table):
+        """
+        Removes every route this app installed in `table` (None: the main
+        table), saved or not, and the table's rule. Returns the failures.
+        """
+        if table is not None:
+            failed = self._failed_routes(self._helper_call(self.privileged.flush_table, table), errno.ESRCH)
+            rule = self._helper_call(self.privileged.delete_rule, table, POLICY_RULE_PRIORITY)
+            if not rule["ok"] and rule["errno"] != errno.ENOENT:
+                failed.append(f"{rule['destination']}: {rule['error']}")
+            return failed
+        # A main não pode ser esvaziada: só as rotas com o protocolo do app, por gateway
+        from netlink_routes import NetlinkRouteEngine, NetlinkError, RTPROT_SNX_CONNECT
+        try:
+            kernel = NetlinkRouteEngine().list_routes()
+        except NetlinkError as e:
+            raise RouteError(f"Could not read the route table: {e}")
+        by_gateway = {}
+        for route in kernel:
+            if route["protocol"] == RTPROT_SNX_CONNECT:
+                by_gateway.setdefault(route["gateway"], []).append(route["destination"])
+        failed = []
+        for gateway, destinations in by_gateway.items():
+            results = self._helper_call(self.privileged.delete_routes, destinations, gateway)
+            failed += self._failed_routes(results, errno.ESRCH)
+        return failed
+
+    def _aggregation_settings(self):
+        return self.config.get("aggregateRoutes", False), self.config.get("aggregationBudget", 0)
+
+    def _route_plan(self, index, aggregate, budget):
+        """Returns the destinations that must be installed for the saved routes."""
+        if not aggregate:
+            return index.addresses()
+        from route_aggregation import aggregate_routes
+        return [a["prefix"] for a in aggregate_routes(index.by_domain, budget)]
+
+    # --- DNS Refresh ---
+    def set_route_dispatcher(self, dispatch):
+        """`dispatch(fn, *args)` runs route changes found by the DNS refresh (default: inline)."""
+        self.route_dispatch = dispatch
+
+    def get_route_refresh_status(self):
+        """Per-domain re-resolution state: last_resolved_at, next_refresh_in, ttl, changes, failures, error."""
+        return self._refresher.status() if self._refresher is not None else {}
+
+    def _start_route_refresh(self):
+        index = self._route_index()
+        self.route_refresher.sync({domain: index.addresses_for(domain) for domain in index.domains()})
+        self.route_refresher.start()
+
+    def _on_domain_changed(self, domain, addresses):
+        self.route_dispatch(self._apply_resolved, domain, addresses)
+
+    def _apply_resolved(self, domain, addresses):
+        """Moves the routes of `domain` to its new DNS answer, touching only the difference."""
+        index = self._route_index()
+        old = set(index.addresses_for(domain))
+        if not old or not self.office_mode_ip:
+            return {"status": False}  # Domínio removido ou sessão encerrada nesse meio tempo
+        new = set(addresses)
+        if old == new:
+            return {"status": True}
+        aggregate, budget = self._aggregation_settings()
+        old_plan = self._route_plan(index, aggregate, budget)
+
+        index.add(domain, sorted(new - old))
+        for address in old - new:
+            index.remove(domain, address)
+        try:
+            # Rotas novas antes de remover as antigas: o tráfego não sai do túnel
+            failed = self._apply_plan_change(old_plan, self._route_plan(index, aggregate, budget))
+        except VpnError:
+            self._index = None # Descarta as alterações em memória
+            raise
+        if failed:
+            self._index = None
+            raise RouteError(f"Failed to update routes of {domain}: {', '.join(failed)}")
+        self._commit_routes(index)
+        self.logger.info(f"Routes of {domain} updated: +{sorted(new - old)} -{sorted(old - new)}.")
+        return {"status": True}
+
+    def _cached_ttl(self, name):
+        records = self.resolver.cache.get(name.strip().rstrip(".").lower())
+        return min(r["ttl"] for r in records) if records else None
+
+    # --- Route Index ---
+    def _migrate_config(self):
+        """Converts configs with '<domain>Address' keys to the versioned routes schema."""
+        if "keepAddress" in self.config.view():
+            # A janela gravava a opção como 'keepAddress', que ninguém mais lia
+            with self.config.update() as data:
+                data.setdefault("keepAddr", data.pop("keepAddress"))
+        if not needs_migration(self.config.view()):
+            return # Caso comum: sem cópia do config na inicialização
+        data = self.config.read()
+        if migrate_config(data):
+            self.logger.info("Migrated saved routes to the versioned schema.")
+            self.config.write(data)
+
+    def _route_index(self):
+        """Returns the route index, rebuilt only when the saved routes changed under us."""
+        # A revisão antes dos dados: no pior caso o índice é reconstruído à toa
+        revision = self.config.revision("routes")
+        if self._index is None or self._index_revision != revision:
+            self._index = RouteIndex.from_config(self.config.view())
+            self._index_revision = revision
+        return self._index
+
+    def _commit_routes(self, index):
+        """Writes the index back to the config and keeps it as the cached one."""
+        with self.config.update() as data:
+            data["routes"] = index.to_config()
+            data["routesVersion"] = ROUTES_SCHEMA_VERSION
+        self._index = index
+        self._index_revision = self.config.revision("routes")
+
+    def _apply_plan_change(self, old_plan, new_plan):
+        """
+        Moves the kernel from `old_plan` to `new_plan`: new prefixes are added
+        first, then the ones that are no longer needed are deleted, so traffic
+        never falls out of the tunnel. Returns the failures.
+        """
+        old, new = set(old_plan), set(new_plan)
+        to_add = [dst for dst in new_plan if dst not in old]
+        to_delete = [dst for dst in old_plan if dst not in new]
+        failed = []
+        if to_add:
+            failed += self._failed_routes(self._apply_routes("add", to_add), errno.EEXIST)
+        if to_delete:
+            failed += self._failed_routes(self._apply_routes("delete", to_delete), errno.ESRCH)
+        return failed
         
     def _delete_saved_routes(self):
-        """Internal method to delete all saved routes on disconnect."""
+        """
+        Internal method to delete all saved routes on disconnect. With policy
+        routing it flushes the dedicated table instead, so routes that are no
+        longer in the config (edited, or left by a crash) go too.
+        """
         if not self.office_mode_ip:
             return
-        routes = self.get_saved_routes()
-        commands = [f"ip route del {route['ip']} via {self.office_mode_ip}" for route in routes]
-        if commands:
-            commands.append("sysctl -w net.ipv6.conf.all.disable_ipv6=0")
+        table = self._policy_table()
+        if table is not None:
             try:
-                self._run_privileged_commands(commands)
+                failed = self._remove_vpn_routes(table)
+                self._helper_call(self.privileged.set_sysctl, "net.ipv6.conf.all.disable_ipv6", 0)
+                if failed:
+                    self.logger.error(f"Failed to flush the VPN route table on disconnect: {failed}")
+            except Exception as e:
+                self.logger.error(f"Failed to flush the VPN route table on disconnect: {e}")
+            return
+        addresses = self._route_plan(self._route_index(), *self._aggregation_settings())
+        if addresses:
+            try:
+                results = self._apply_routes(
+                    "delete", addresses, sysctl={"net.ipv6.conf.all.disable_ipv6": 0}
+                )
+                failed = self._failed_routes(results, errno.ESRCH)
+                if failed:
+                    self.logger.error(f"Failed to delete {len(failed)} routes on disconnect: {failed}")
             except Exception as e:
                 self.logger.error(f"Failed to delete all routes on disconnect: {e}")
 
-    def _run_privileged_commands(self, commands):
-        """Helper to run a list of commands using pkexec."""
-        script = "\n".join(commands)
+    # --- Route Backend ---
+    def _apply_routes(self, action, addresses, sysctl=None, gateway=None):
+        """
+        Adds or deletes routes via the Office Mode IP (or `gateway`) in a single
+        netlink transaction, through the privileged helper started for this
+        session, in the main table or the policy routing one. Returns one
+        result dict per address (see netlink_routes).
+        """
+        from privileged_helper import HelperError, HelperUnavailableError
+        gateway = gateway or self.office_mode_ip
+        table = self._policy_table()
         try:
-            process = subprocess.Popen(
-                ["pkexec", "bash"], stdin=subprocess.PIPE, text=True,
-                stdout=subprocess.PIPE, stderr=subprocess.PIPE
-            )
-            _, stderr = process.communicate(input=script)
-            if process.returncode != 0:
-                raise VpnError(f"Privileged command failed: {stderr.strip()}")
-        except FileNotFoundError:
-            raise DependencyError("pkexec command not found.")
\ No newline at end of file
+            if action == "add":
+                results = self.privileged.add_routes(addresses, gateway, table)
+            else:
+                results = self.privileged.delete_routes(addresses, gateway, table)
+            for name, value in (sysctl or {}).items():
+                try:
+                    self.privileged.set_sysctl(name, value)
+                except HelperError as e:
+                    self.logger.warning(f"Failed to set {name}: {e}")
+        except HelperUnavailableError as e:
+            raise DependencyError(str(e))
+        except HelperError as e:
+            raise VpnError(f"Privileged command failed: {e}")
+        return results
+
+    def _helper_call(self, fn, *args):
+        """Runs one privileged helper request, with the helper errors as VpnErrors."""
+        from privileged_helper import HelperError, HelperUnavailableError
+        try:
+            return fn(*args)
+        except HelperUnavailableError as e:
+            raise DependencyError(str(e))
+        except HelperError as e:
+            raise VpnError(f"Privileged command failed: {e}")
+
+    @staticmethod
+    def _failed_routes(results, ignored_errno):
+        """Lists 'destination: error' for every result that really failed."""
+        return [
+            f"{r['destination']}: {r['error']}" for r in results
+            if not r["ok"] and r["errno"] != ignored_errno
+        ]
@@ -0,0 +1,266 @@
+# cli.py
+"""
+Headless command line interface: snx-connect <command> ...
+
+Built directly on VpnManager and never imports GTK, so it works from cron
+jobs, login hooks and servers without a display. Every command prints one JSON
+object on stdout (or plain text with `-o text`) and exits with 0 on success,
+1 on a VPN error and 2 on bad usage.
+
+    snx-connect connect [-s SERVER] [-u USER] [--password-stdin] [--keep]
+    snx-connect disconnect
+    snx-connect status
+    snx-connect route list
+    snx-connect route search QUERY [--mode prefix|substring|network] [--limit N]
+    snx-connect route lookup HOST_OR_IP... [--file FILE|-]
+    snx-connect route add DOMAIN_OR_IP...
+    snx-connect route remove DOMAIN [IP...]
+    snx-connect route import FILE|- [--format text|csv|json]
+    snx-connect route reconcile
+    snx-connect route table on|off [--id TABLE]
+"""
+import argparse
+import contextlib
+import getpass
+import json
+import logging
+import os
+import sys
+
+from back_end import VpnManager, VpnError
+from route_import import FORMATS
+from route_search import MODES
+from tunnel_monitor import TunnelWatcher
+
+PASSWORD_ENV = "SNX_CONNECT_PASSWORD"
+
+
+class UsageError(Exception):
+    """Raised for missing arguments that argparse cannot check by itself."""
+    pass
+
+
+# --- Comandos ---
+def cmd_connect(manager, args):
+    server = args.server or manager.config.get("server")
+    username = args.username or manager.config.get("username")
+    if not server or not username:
+        raise UsageError("Server and username are required (no saved login found).")
+    return manager.connect(server, username, read_password(manager, args, server, username), args.keep)
+
+
+def cmd_disconnect(manager, args):
+    return manager.disconnect()
+
+
+def cmd_status(manager, args):
+    return {
+        "connected": TunnelWatcher().is_connected(),
+        "office_ip": manager.config.get("ip"),
+        "server": manager.config.get("server"),
+        "username": manager.config.get("username"),
+        "routes": len(manager.get_saved_routes()),
+        "keep_routes": manager.config.get("keepAddr", False),
+        "aggregate_routes": manager.get_route_aggregation()["enabled"],
+        "policy_routing": manager.get_policy_routing(),
+        "tunnel_dns": manager.config.get("tunnelDns"),
+    }
+
+
+def cmd_route_list(manager, args):
+    return {"routes": manager.get_saved_routes()}
+
+
+def cmd_route_search(manager, args):
+    return manager.search_routes(args.query, args.mode, args.limit)
+
+
+def cmd_route_lookup(manager, args):
+    hosts = list(args.hosts)
+    if args.file == "-":
+        hosts.extend(line.split("#", 1)[0].strip() for line in sys.stdin)
+    elif args.file:
+        try:
+            with open(args.file, encoding="utf-8") as source:
+                hosts.extend(line.split("#", 1)[0].strip() for line in source)
+        except OSError as e:
+            raise UsageError(f"Could not read {args.file}: {e.strerror}")
+    hosts = [host for host in hosts if host]
+    if not hosts:
+        raise UsageError("Nothing to look up: give hosts or --file.")
+    return manager.lookup_routes(hosts)
+
+
+def cmd_route_add(manager, args):
+    added = {}
+    for domain in args.domains:
+        added[domain] = manager.add_route(domain)["addresses"]
+    return {"status": True, "added": added}
+
+
+def cmd_route_remove(manager, args):
+    addresses = args.addresses or [
+        route["ip"] for route in manager.get_saved_routes() if route["domain"] == args.domain
+    ]
+    if not addresses:
+        raise UsageError(f"No saved routes for '{args.domain}'.")
+    for address in addresses:
+        manager.remove_route(args.domain, address)
+    return {"status": True, "removed": addresses}
+
+
+def cmd_route_import(manager, args):
+    return manager.import_routes(args.source, args.format)
+
+
+def cmd_route_reconcile(manager, args):
+    result = manager.reconcile_routes()
+    if not result["status"] and not result["failed"]:
+        raise VpnError("Not connected: no tunnel with the saved Office Mode IP.")
+    return result
+
+
+def cmd_route_table(manager, args):
+    result = manager.set_policy_routing(args.state == "on", args.id)
+    return dict(result, **manager.get_policy_routing())
+
+
+# --- Auxiliares ---
+def read_password(manager, args, server, username):
+    """--password-stdin, then the environment, then the saved login, then a prompt."""
+    if args.password_stdin:
+        return sys.stdin.readline().rstrip("\n")
+    if os.environ.get(PASSWORD_ENV):
+        return os.environ[PASSWORD_ENV]
+    saved = manager.config.view()
+    if saved.get("password") and saved.get("server") == server and saved.get("username") == username:
+        return saved["password"]
+    if sys.stdin.isatty():
+        return getpass.getpass(f"Password for {username}@{server}: ")
+    raise UsageError(f"No password: use --password-stdin or set {PASSWORD_ENV}.")
+
+
+def format_text(result):
+    """Plain `key: value` lines; route lists become one route per line."""
+    lines = []
+    for key, value in result.items():
+        if key == "routes" and isinstance(value, list):
+            lines.extend(f"{route['domain']}\t{route['ip']}" for route in value)
+        elif key == "lookups":
+            lines.extend(format_lookup(entry) for entry in value)
+        elif isinstance(value, (dict, list)):
+            lines.append(f"{key}: {json.dumps(value)}")
+        else:
+            lines.append(f"{key}: {value}")
+    return "\n".join(lines)
+
+
+def format_lookup(entry):
+    """`host  address  via PREFIX (domains)` per address, or the error."""
+    if entry["error"]:
+        return f"{entry['host']}\terror: {entry['error']}"
+    parts = []
+    for match in entry["addresses"]:
+        if not match["routed"]:
+            parts.append(f"{match['address']}\tnot routed")
+            continue
+        domains = f" ({', '.join(match['domains'])})" if match["domains"] else ""
+        parts.append(f"{match['address']}\tvia {match['prefix']}{domains}")
+    return "\n".join(f"{entry['host']}\t{part}" for part in parts)
+
+
+def emit(result, output):
+    if output == "text":
+        text = format_text(result)
+        if text:
+            print(text)
+    else:
+        print(json.dumps(result))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="snx-connect", description="Check Point SNX VPN client (headless).")
+    parser.add_argument("-o", "--output", choices=("json", "text"), default="json",
+                        help="output format (default: json)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log to stderr")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    connect = commands.add_parser("connect", help="connect to the VPN")
+    connect.add_argument("-s", "--server", help="VPN server (default: saved login)")
+    connect.add_argument("-u", "--username", help="username (default: saved login)")
+    connect.add_argument("--password-stdin", action="store_true", help="read the password from stdin")
+    connect.add_argument("--keep", action="store_true", help="save the login for next time")
+    connect.set_defaults(handler=cmd_connect)
+
+    commands.add_parser("disconnect", help="disconnect from the VPN").set_defaults(handler=cmd_disconnect)
+    commands.add_parser("status", help="show the connection state").set_defaults(handler=cmd_status)
+
+    route = commands.add_parser("route", help="manage the routes sent through the VPN")
+    route_commands = route.add_subparsers(dest="route_command", required=True)
+    route_commands.add_parser("list", help="list the saved routes").set_defaults(handler=cmd_route_list)
+
+    search = route_commands.add_parser("search", help="find saved routes by domain, IP or CIDR")
+    search.add_argument("query")
+    search.add_argument("--mode", choices=MODES, default="auto",
+                        help="prefix/substring on domains, network containment for IPs (default: auto)")
+    search.add_argument("--limit", type=int, help="show at most this many routes")
+    search.set_defaults(handler=cmd_route_search)
+
+    lookup = route_commands.add_parser("lookup", help="check whether hosts or IPs go through the VPN")
+    lookup.add_argument("hosts", nargs="*", metavar="HOST_OR_IP")
+    lookup.add_argument("-f", "--file", help="also read hosts from this file, one per line ('-' for stdin)")
+    lookup.set_defaults(handler=cmd_route_lookup)
+
+    add = route_commands.add_parser("add", help="add routes for domains or IPs")
+    add.add_argument("domains", nargs="+", metavar="DOMAIN_OR_IP")
+    add.set_defaults(handler=cmd_route_add)
+
+    remove = route_commands.add_parser("remove", help="remove the routes of a domain")
+    remove.add_argument("domain")
+    remove.add_argument("addresses", nargs="*", metavar="IP", help="only these addresses (default: all)")
+    remove.set_defaults(handler=cmd_route_remove)
+
+    import_ = route_commands.add_parser("import", help="import routes from a file ('-' for stdin)")
+    import_.add_argument("source", metavar="FILE")
+    import_.add_argument("--format", choices=FORMATS, help="file format (default: from the extension)")
+    import_.set_defaults(handler=cmd_route_import)
+
+    route_commands.add_parser(
+        "reconcile", help="make the kernel routes match the saved ones"
+    ).set_defaults(handler=cmd_route_reconcile)
+
+    table = route_commands.add_parser("table", help="keep the VPN routes in a dedicated routing table")
+    table.add_argument("state", choices=("on", "off"))
+    table.add_argument("--id", type=int, help="routing table id (default: 115)")
+    table.set_defaults(handler=cmd_route_table)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.INFO if args.verbose else logging.WARNING,
+        stream=sys.stderr, format="%(name)s: %(message)s"
+    )
+    manager = None
+    try:
+        # O Model ecoa a saída do snx no stdout: manda para o stderr
+        # para o stdout ficar só com o resultado.
+        with contextlib.redirect_stdout(sys.stderr):
+            manager = VpnManager()
+            result = args.handler(manager, args)
+    except UsageError as e:
+        emit({"status": False, "error": str(e)}, args.output)
+        return 2
+    except VpnError as e:
+        emit({"status": False, "error": str(e)}, args.output)
+        return 1
+    finally:
+        if manager is not None:
+            manager.stop_privileged_session()
+    emit(result, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
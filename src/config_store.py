@@ -0,0 +1,199 @@
+# config_store.py
+"""
+Cached, atomically written store for ~/.config/snx-connect/snx-data.json.
+
+One in-memory copy is shared by everybody that uses `ConfigStore.default()`.
+It is only re-read when the file's mtime, inode or size change (e.g. edited by
+hand or by another instance). Writes go to a temporary file that is fsynced and
+renamed over the config, so a crash never leaves a truncated file behind, and
+changes made inside `batch()` reach the disk in a single write.
+
+`revision(key)` changes only when the value of that key changes (here or on
+disk), so caches built from one section, like the route index, survive
+writes to the others.
+"""
+import contextlib
+import copy
+import json
+import logging
+import os
+import tempfile
+import threading
+
+
+def default_config_path():
+    config_dir = os.path.join(os.path.expanduser("~"), ".config", "snx-connect")
+    return os.path.join(config_dir, "snx-data.json")
+
+
+class ConfigStore:
+    """Shared JSON config with stat-based invalidation and coalesced writes."""
+    _instances = {}
+    _instances_lock = threading.Lock()
+
+    def __init__(self, path=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.config_file = path or default_config_path()
+        os.makedirs(os.path.dirname(self.config_file), exist_ok=True)
+        self.lock = threading.RLock()
+        self._data = None
+        self._signature = None
+        self._batch_depth = 0
+        self._dirty = False
+        self._clock = 0         # conta as mudanças de conteúdo
+        self._revisions = {}    # chave -> _clock da última mudança do valor
+        self._reset_at = 0      # recarga sem cópia anterior: todas as chaves mudaram
+
+    @classmethod
+    def default(cls, path=None):
+        """Returns the process-wide store for `path` (the user config by default)."""
+        path = os.path.abspath(path or default_config_path())
+        with cls._instances_lock:
+            if path not in cls._instances:
+                cls._instances[path] = cls(path)
+            return cls._instances[path]
+
+    # --- Leitura ---
+    def get(self, key, default=None):
+        """Returns a top-level value. The value is shared, do not mutate it."""
+        with self.lock:
+            return self._load().get(key, default)
+
+    def view(self):
+        """Returns the cached config itself, for read-only access (no copy)."""
+        with self.lock:
+            return self._load()
+
+    def read(self):
+        """Returns a private copy of the whole config (safe to mutate)."""
+        with self.lock:
+            return copy.deepcopy(self._load())
+
+    def revision(self, key):
+        """A number that changes whenever the value of `key` changes."""
+        with self.lock:
+            self._load()
+            return max(self._revisions.get(key, 0), self._reset_at)
+
+    # --- Escrita ---
+    def write(self, data):
+        """Replaces the whole config. The store takes ownership of `data`."""
+        with self.lock:
+            self._track_changes(self._data, data)
+            self._data = data
+            self._mark_dirty()
+
+    def set(self, key, value):
+        """
+        Replaces one top-level value. Only that key is compared and only its
+        revision moves, so toggling a flag doesn't copy the routes.
+        """
+        with self.lock:
+            data = dict(self._load())  # Cópia rasa: quem leu com view() não vê a troca no meio
+            if key not in data or data[key] != value:
+                self._clock += 1
+                self._revisions[key] = self._clock
+            data[key] = value
+            self._data = data
+            self._mark_dirty()
+
+    @contextlib.contextmanager
+    def update(self):
+        """
+        Yields a working copy of the config for in-place changes and saves it
+        on exit. Nothing changes if the block raises.
+        """
+        with self.lock:
+            working = copy.deepcopy(self._load())
+            yield working
+            self._track_changes(self._data, working)
+            self._data = working
+            self._mark_dirty()
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Coalesces every write made inside the block into one disk write."""
+        with self.lock:
+            self._batch_depth += 1
+            try:
+                yield self
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._dirty:
+                    self.flush()
+
+    def flush(self):
+        """Writes pending changes to disk now."""
+        with self.lock:
+            if self._dirty:
+                self._write_atomic(self._data)
+                self._dirty = False
+
+    def invalidate(self):
+        """Forgets the cached copy; the next read goes to disk."""
+        with self.lock:
+            self._data = None
+            self._signature = None
+
+    # --- Internals ---
+    def _track_changes(self, old, new):
+        self._clock += 1
+        if old is None:
+            self._reset_at = self._clock
+            return
+        for key in old.keys() | new.keys():
+            if key not in old or key not in new or old[key] != new[key]:
+                self._revisions[key] = self._clock
+
+    def _mark_dirty(self):
+        self._dirty = True
+        if self._batch_depth == 0:
+            self.flush()
+
+    def _stat_signature(self):
+        try:
+            st = os.stat(self.config_file)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_ino, st.st_size)
+
+    def _load(self):
+        if self._dirty:
+            # Mudanças pendentes de um batch têm prioridade sobre o disco.
+            return self._data
+        signature = self._stat_signature()
+        if self._data is not None and signature == self._signature:
+            return self._data
+        try:
+            with open(self.config_file, "r") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                data = {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        self._track_changes(self._data, data)
+        self._data = data
+        self._signature = signature
+        return data
+
+    def _write_atomic(self, data):
+        directory = os.path.dirname(self.config_file)
+        fd, tmp_path = tempfile.mkstemp(prefix=".snx-data-", suffix=".tmp", dir=directory)
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o600)  # O arquivo pode conter a senha
+            os.replace(tmp_path, self.config_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        with contextlib.suppress(OSError):
+            dir_fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        self._signature = self._stat_signature()
@@ -1,9 +1,16 @@
 # controller.py
-import threading
 import logging
 
 # Importa as exceções customizadas do nosso Model para um tratamento de erro limpo
 from back_end import VpnError 
+from task_executor import TaskExecutor
+
+# Recursos usados para serializar as tarefas (ver TaskExecutor).
+# O índice de rotas e o arquivo de config são compartilhados por todas as
+# operações de rota, então elas também disputam "routes".
+SESSION = "session"
+ROUTES = "routes"
+CONFIG = "config"
 
 class Controller:
     """
@@ -15,53 +22,122 @@ class Controller:
     4. Use callbacks to inform the View of the result.
     It is completely decoupled from the UI framework (no GTK/GLib imports).
     """
-    def __init__(self, model):
+    def __init__(self, model, loop=None):
         """
         Initializes the Controller with its dependencies (the Model).
-        This is called Dependency Injection.
+        This is called Dependency Injection. `loop` is the asyncio loop for
+        the async tasks (the GLib one in the app); without it the executor
+        runs its own loop thread.
         """
         self.logger = logging.getLogger(self.__class__.__name__)
         self.model = model["manager"] # Recebe a instância do VpnManager
+        self.executor = TaskExecutor(max_workers=4, error_types=(VpnError,), loop=loop)
+        # Mudanças de DNS das rotas entram na mesma fila das outras operações de rotas
+        self.model.set_route_dispatcher(self._dispatch_route_update)
+        # Reconexões automáticas disputam a sessão com login, rotas e disconnect
+        self.model.set_reconnect_runner(self._run_reconnect_attempt)
+
+    def _run_in_thread(self, target, on_success, on_error, *args, resources=(), key=None):
+        """
+        Runs a model method on the bounded worker pool. Tasks sharing a resource
+        run one at a time, in order; a task with the same `key` as one still in
+        flight joins it instead of running again. Returns the task handle
+        (`handle.cancel()`). The callbacks are called from the worker thread.
+        """
+        return self.executor.submit(
+            target, *args, key=key, resources=resources,
+            on_success=on_success, on_error=on_error
+        )
+
+    def _run_async(self, target, on_success, on_error, *args, resources=(), key=None):
+        """
+        Same as _run_in_thread() for a coroutine method of the model, run on
+        the event loop. The callbacks are called from the loop's thread.
+        """
+        return self.executor.submit_async(
+            target, *args, key=key, resources=resources,
+            on_success=on_success, on_error=on_error
+        )
+
+    def _dispatch_route_update(self, fn, *args):
+        self._run_in_thread(fn, None, None, *args, resources=(ROUTES,))
+
+    def _run_reconnect_attempt(self, attempt, cancelled):
+        """Runs one reconnect attempt as a session task and waits for it (on the supervisor thread)."""
+        task = self._run_in_thread(attempt, None, None, resources=(SESSION, ROUTES, CONFIG))
+        while not task.wait(0.1):
+            if cancelled():
+                task.cancel()  # Ainda na fila: não roda mais; rodando: termina sozinha
+        if task.error is not None:
+            raise task.error
 
-    def _run_in_thread(self, target, on_success, on_error, *args):
-        """Helper function to run a model method in a background thread."""
-        def worker():
-            try:
-                # Chama o método síncrono do Model
-                result = target(*args)
-                # Em caso de sucesso, chama o callback de sucesso com o resultado
-                if on_success:
-                    # Desempacota o dicionário de resultado para os callbacks
-                    on_success(**result)
-            except VpnError as e:
-                # Em caso de erro, chama o callback de erro com a mensagem da exceção
-                self.logger.error(f"An error occurred in the worker thread: {e}")
-                if on_error:
-                    on_error(str(e))
-        
-        thread = threading.Thread(target=worker)
-        thread.daemon = True
-        thread.start()
+    def get_task_metrics(self):
+        """Queue depth, running tasks and counters of the background executor."""
+        return self.executor.metrics()
 
     # --- Public API for the View ---
 
     def request_login(self, login_info, on_success, on_error):
-        """Handles the user's request to log in."""
+        """
+        Handles the user's request to log in. Cancelling the returned handle
+        aborts the connect and kills snx.
+        """
         self.logger.info(f"Login requested for user: {login_info['name']}")
-        self._run_in_thread(
-            self.model.connect,
+        return self._run_async(
+            self.model.connect_async,
             on_success,
             on_error,
             login_info["website"],
             login_info["name"],
             login_info["password"],
-            login_info["keep"]
+            login_info["keep"],
+            resources=(SESSION, ROUTES, CONFIG),
+            key=("connect", login_info["website"], login_info["name"]),
         )
 
+    def subscribe_tunnel_state(self, on_change):
+        """
+        Registers `on_change(connected)` for tunnel drops and recoveries seen
+        by the in-process monitor. It is called from the monitor thread.
+        """
+        self.model.add_tunnel_listener(on_change)
+
+    def unsubscribe_tunnel_state(self, on_change):
+        self.model.remove_tunnel_listener(on_change)
+
+    def subscribe_reconnect_events(self, on_event):
+        """
+        Registers `on_event(event)` for the auto-reconnect progress. `event`
+        has "state" ("reconnecting", "recovered", "failed" or "cancelled"),
+        "attempts" and "time_to_recovery". Called from the reconnect thread.
+        """
+        self.model.add_reconnect_listener(on_event)
+
+    def get_auto_reconnect_status(self):
+        return self.model.get_auto_reconnect()
+
+    def set_auto_reconnect_status(self, status):
+        self.model.set_auto_reconnect(status)
+
+    def get_reconnect_history(self):
+        return self.model.get_reconnect_history()
+
+    def get_connect_timings(self, limit=None):
+        """Returns the recorded phase timings of the last connects (see VpnManager)."""
+        return self.model.get_connect_timings(limit)
+
+    def get_connect_timing_summary(self):
+        return self.model.get_connect_timing_summary()
+
     def request_disconnect(self, on_success, on_error):
         """Handles the user's request to disconnect."""
         self.logger.info("Disconnect requested.")
-        self._run_in_thread(self.model.disconnect, on_success, on_error)
+        # Uma tentativa de reconexão na fila não deve rodar depois do disconnect
+        self.model.cancel_reconnect()
+        return self._run_in_thread(
+            self.model.disconnect, on_success, on_error,
+            resources=(SESSION, ROUTES, CONFIG), key=("disconnect",)
+        )
     
     def on_keep_routes_check_toggled (self, widget):
         """
@@ -73,28 +149,75 @@ class Controller:
 
     def request_load_routes(self, view):
         """
-        Handles the request to load saved routes into the view.
-        This is a synchronous call as it should be fast.
+        Reads the saved routes on a worker and hands them to the view, which
+        fills its list model in chunks (`view.handle_routes_loaded(routes)`).
         """
         self.logger.info("Loading saved routes for the view.")
-        try:
-            routes = self.model.get_saved_routes()
-            for route in routes:
-                # O Controller comanda a View para se atualizar
-                view.add_route_to_list(route["domain"], route["ip"])
-        except VpnError as e:
-            self.logger.error(f"Failed to load routes: {e}")
-            view.show_error_dialog("Error Loading Routes", str(e))
-            
+        return self._run_in_thread(
+            lambda: {"routes": self.model.get_saved_routes()},
+            view.handle_routes_loaded, view.handle_routes_load_error,
+            resources=(ROUTES,), key=("load_routes",)
+        )
+
+    def request_search_routes(self, query, on_success, on_error, mode="auto"):
+        """
+        Looks up saved routes in the model's search index. The view cancels the
+        returned handle when the query changes before the search ran. No `key`:
+        a search is cheap and must see the routes as they are when it runs.
+        """
+        return self._run_in_thread(
+            self.model.search_routes, on_success, on_error, query, mode, resources=(ROUTES,)
+        )
+
+    def request_lookup_routes(self, hosts, on_success, on_error):
+        """
+        Tells, for each host or IP in `hosts`, whether it goes through the VPN
+        and by which route (longest-prefix match, names resolved first).
+        """
+        return self._run_in_thread(
+            self.model.lookup_routes, on_success, on_error, list(hosts), resources=(ROUTES,)
+        )
+
     def request_add_route(self, domain, on_success, on_error):
         """Handles the user's request to add a new route."""
         self.logger.info(f"Route addition requested for domain: {domain}")
-        self._run_in_thread(self.model.add_route, on_success, on_error, domain)
+        return self._run_in_thread(
+            self.model.add_route, on_success, on_error, domain,
+            resources=(ROUTES, ("route", domain)), key=("add_route", domain)
+        )
+
+    def request_import_routes(self, path, on_progress, on_success, on_error):
+        """
+        Handles the user's request to import a list of routes from a file.
+        `on_progress` is called from the worker thread with a dict of counters.
+        """
+        self.logger.info(f"Route import requested from: {path}")
+        return self._run_in_thread(
+            self.model.import_routes, on_success, on_error, path, None, on_progress,
+            resources=(ROUTES,), key=("import_routes", path)
+        )
 
     def request_remove_route(self, domain, ip_address, on_success, on_error):
         """Handles the user's request to remove a route."""
         self.logger.info(f"Route removal requested for: {domain} ({ip_address})")
-        self._run_in_thread(self.model.remove_route, on_success, on_error, domain, ip_address)
+        return self._run_in_thread(
+            self.model.remove_route, on_success, on_error, domain, ip_address,
+            resources=(ROUTES, ("route", domain)), key=("remove_route", domain, ip_address)
+        )
+
+    def request_reconcile_routes(self, on_success, on_error):
+        """
+        Makes the kernel routes match the saved ones (only the difference is
+        applied). Also run by the app at startup, for a session left running.
+        """
+        return self._run_in_thread(
+            self.model.reconcile_routes, on_success, on_error,
+            resources=(ROUTES,), key=("reconcile_routes",)
+        )
+
+    def get_route_refresh_status(self):
+        """Per-domain DNS re-resolution state (last resolved, next refresh, changes)."""
+        return self.model.get_route_refresh_status()
 
     def check_dependencies(self):
         """Synchronously checks for system dependencies."""
@@ -103,12 +226,42 @@ class Controller:
     def request_install_snx(self, on_success, on_error):
         """Handles the request to install SNX."""
         self.logger.info("SNX installation requested.")
-        self._run_in_thread(self.model.install_snx, on_success, on_error)
+        return self._run_in_thread(
+            self.model.install_snx, on_success, on_error, resources=("install",), key=("install_snx",)
+        )
     
     def get_keep_routes_status(self):
-        """Pede ao Model o estado atual da configuração 'keepAddress'."""
+        """Pede ao Model o estado atual da configuração 'keepAddr'."""
         return self.model.get_keep_routes_status()
 
     def set_keep_routes_status(self, status):
-        """Pede ao Model para salvar o novo estado da configuração 'keepAddress'."""
-        self.model.set_keep_routes(status)
\ No newline at end of file
+        """Pede ao Model para salvar o novo estado da configuração 'keepAddr'."""
+        self.model.set_keep_routes(status)
+
+    def get_route_aggregation_status(self):
+        """Asks the Model whether saved routes are aggregated before install."""
+        return self.model.get_route_aggregation()["enabled"]
+
+    def get_policy_routing_status(self):
+        """Asks the Model whether VPN routes go to a dedicated routing table."""
+        return self.model.get_policy_routing()["enabled"]
+
+    def get_dns_status(self):
+        """Asks the Model which name servers resolve routes and how fast each one answers."""
+        return self.model.get_dns_status()
+
+    def request_set_policy_routing(self, enabled, on_success, on_error):
+        """Handles the toggling of the dedicated route table (moves the routes when connected)."""
+        self.logger.info(f"Policy routing toggled: {enabled}")
+        return self._run_in_thread(
+            self.model.set_policy_routing, on_success, on_error, enabled,
+            resources=(ROUTES, CONFIG)
+        )
+
+    def request_set_route_aggregation(self, enabled, on_success, on_error):
+        """Handles the toggling of route aggregation (reinstalls routes when connected)."""
+        self.logger.info(f"Route aggregation toggled: {enabled}")
+        return self._run_in_thread(
+            self.model.set_route_aggregation, on_success, on_error, enabled,
+            resources=(ROUTES, CONFIG)
+        )
\ No newline at end of file
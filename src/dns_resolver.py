@@ -0,0 +1,371 @@
+# dns_resolver.py
+"""
+Small in-process DNS resolver for A records.
+
+Queries are sent straight to the configured name servers over UDP (falling
+back to TCP when the answer is truncated), every A record is returned with its
+TTL, and answers are kept in a cache that honours those TTLs. `resolve_many`
+resolves several names concurrently.
+
+With `race=True` a query goes to every server at once and the first answer
+with records wins, so one dead server costs nothing instead of a timeout.
+That is how the DNS servers pushed by the VPN are used, with the system
+resolver as `fallback` for names they can't answer. The latency of every
+server is tracked (`server_stats`).
+"""
+import ipaddress
+import logging
+import random
+import selectors
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+RESOLV_CONF = "/etc/resolv.conf"
+DNS_PORT = 53
+
+TYPE_A = 1
+CLASS_IN = 1
+FLAG_RD = 0x0100
+FLAG_TC = 0x0200
+RCODE_NXDOMAIN = 3
+RACE_GRACE = 0.2  # Segundos de espera pelos outros servidores depois de uma resposta vazia
+LATENCY_SMOOTHING = 0.2  # Peso da última medida na média móvel de latência
+
+_HEADER = struct.Struct("!HHHHHH")
+_RR_FIXED = struct.Struct("!HHIH")  # type, class, ttl, rdlength
+
+
+class DnsError(Exception):
+    """Raised when a name cannot be resolved."""
+    pass
+
+
+def read_resolv_conf(path=RESOLV_CONF):
+    """Returns (nameservers, search_domains) from a resolv.conf file."""
+    nameservers, search = [], []
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                fields = line.split()
+                if not fields or fields[0].startswith(("#", ";")):
+                    continue
+                if fields[0] == "nameserver" and len(fields) > 1:
+                    nameservers.append(fields[1].split("%")[0])
+                elif fields[0] in ("search", "domain"):
+                    search = fields[1:]
+    except OSError:
+        pass
+    return nameservers or ["127.0.0.1"], search
+
+
+# --- Codificação e decodificação de mensagens DNS ---
+def build_query(name, query_id, qtype=TYPE_A):
+    header = _HEADER.pack(query_id, FLAG_RD, 1, 0, 0, 0)
+    qname = b""
+    for label in name.rstrip(".").split("."):
+        try:
+            encoded = label.encode("idna")
+        except UnicodeError:
+            raise DnsError(f"Invalid domain name: {name}")
+        if not encoded or len(encoded) > 63:
+            raise DnsError(f"Invalid domain name: {name}")
+        qname += bytes([len(encoded)]) + encoded
+    return header + qname + b"\0" + struct.pack("!HH", qtype, CLASS_IN)
+
+
+def _skip_name(message, offset):
+    while True:
+        length = message[offset]
+        if length & 0xC0 == 0xC0:  # ponteiro de compressão
+            return offset + 2
+        offset += 1
+        if length == 0:
+            return offset
+        offset += length
+
+
+def parse_response(message, query_id):
+    """
+    Returns (flags, records) where records is a list of
+    {"address": "x.x.x.x", "ttl": seconds} for every A record in the answer.
+    """
+    if len(message) < _HEADER.size:
+        raise DnsError("Truncated DNS response.")
+    resp_id, flags, qdcount, ancount, _, _ = _HEADER.unpack_from(message, 0)
+    if resp_id != query_id:
+        raise DnsError("DNS response ID mismatch.")
+
+    offset = _HEADER.size
+    for _ in range(qdcount):
+        offset = _skip_name(message, offset) + 4
+
+    records = []
+    for _ in range(ancount):
+        offset = _skip_name(message, offset)
+        rtype, rclass, ttl, rdlength = _RR_FIXED.unpack_from(message, offset)
+        offset += _RR_FIXED.size
+        if rtype == TYPE_A and rclass == CLASS_IN and rdlength == 4:
+            address = str(ipaddress.IPv4Address(message[offset:offset + 4]))
+            records.append({"address": address, "ttl": ttl})
+        offset += rdlength
+    return flags, records
+
+
+class DnsCache:
+    """Thread-safe name -> records cache where every entry expires with its TTL."""
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """Returns the cached records with their remaining TTL, or None."""
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is None:
+                return None
+            stored_at, records = entry
+            elapsed = int(self.clock() - stored_at)
+            if any(record["ttl"] <= elapsed for record in records):
+                del self.entries[name]
+                return None
+            return [{"address": r["address"], "ttl": r["ttl"] - elapsed} for r in records]
+
+    def put(self, name, records):
+        if not records or min(r["ttl"] for r in records) <= 0:
+            return
+        with self.lock:
+            self.entries[name] = (self.clock(), records)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class DnsResolver:
+    """
+    Resolves names to IPv4 addresses without forking `nslookup`.
+    The cache is shared by every call made through the same instance.
+    """
+    def __init__(self, nameservers=None, search=None, timeout=2.0, port=DNS_PORT,
+                 cache=None, max_workers=16, race=False, fallback=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        if nameservers is None:
+            nameservers, default_search = read_resolv_conf()
+            search = default_search if search is None else search
+        self.nameservers = list(nameservers)
+        self.search = list(search or [])
+        self.timeout = timeout
+        self.port = port
+        self.cache = cache if cache is not None else DnsCache()
+        self.max_workers = max_workers
+        self.race = race
+        self.fallback = fallback  # Outro DnsResolver, para quando estes servidores falham
+        self.latency = {}  # servidor -> estatísticas (ver server_stats)
+        self.latency_lock = threading.Lock()
+
+    # --- Public API ---
+    def resolve(self, name):
+        """Returns every A record for `name` as [{"address", "ttl"}]. Raises DnsError."""
+        name = name.strip().rstrip(".").lower()
+        cached = self.cache.get(name)
+        if cached is not None:
+            return cached
+
+        last_error = DnsError(f"No valid IPv4 addresses found for {name}.")
+        for candidate in self._candidates(name):
+            try:
+                records = self._query(candidate)
+            except DnsError as e:
+                last_error = e
+                continue
+            if records:
+                self.cache.put(name, records)
+                return records
+        if self.fallback is not None:
+            try:
+                records = self.fallback.resolve(name)
+            except DnsError:
+                raise last_error
+            self.logger.info(f"{name} resolved by the fallback resolver.")
+            self.cache.put(name, records)
+            return records
+        raise last_error
+
+    def resolve_many(self, names):
+        """
+        Resolves `names` concurrently. Returns {name: records} and
+        {name: error message} for the names that failed.
+        """
+        names = list(dict.fromkeys(names))
+        resolved, failed = {}, {}
+        if not names:
+            return resolved, failed
+        workers = max(1, min(self.max_workers, len(names)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {name: executor.submit(self.resolve, name) for name in names}
+            for name, future in futures.items():
+                try:
+                    resolved[name] = future.result()
+                except DnsError as e:
+                    failed[name] = str(e)
+        return resolved, failed
+
+    def server_stats(self):
+        """
+        {server: {"queries", "answers", "failures", "avg_ms", "last_ms"}}:
+        how each name server has been doing (failures include timeouts).
+        """
+        with self.latency_lock:
+            return {server: dict(stats) for server, stats in self.latency.items()}
+
+    # --- Internals ---
+    def _record(self, server, elapsed):
+        """Counts one query to `server`; `elapsed` is None when it failed or timed out."""
+        with self.latency_lock:
+            stats = self.latency.setdefault(
+                server, {"queries": 0, "answers": 0, "failures": 0, "avg_ms": None, "last_ms": None}
+            )
+            stats["queries"] += 1
+            if elapsed is None:
+                stats["failures"] += 1
+                return
+            ms = elapsed * 1000
+            stats["answers"] += 1
+            stats["last_ms"] = ms
+            stats["avg_ms"] = ms if stats["avg_ms"] is None else (
+                stats["avg_ms"] + LATENCY_SMOOTHING * (ms - stats["avg_ms"])
+            )
+
+    def _candidates(self, name):
+        if "." in name or not self.search:
+            return [name]
+        return [f"{name}.{domain}" for domain in self.search] + [name]
+
+    def _query(self, name):
+        if self.race and len(self.nameservers) > 1:
+            return self._query_race(name)
+        last_error = None
+        for server in self.nameservers:
+            query_id = random.randint(0, 0xFFFF)
+            query = build_query(name, query_id)
+            started = time.monotonic()
+            try:
+                flags, records = self._query_udp(server, query, query_id)
+                if flags & FLAG_TC:
+                    flags, records = self._query_tcp(server, query, query_id)
+            except (OSError, DnsError, struct.error, IndexError) as e:
+                self._record(server, None)
+                self.logger.debug(f"Query for {name} to {server} failed: {e}")
+                last_error = e
+                continue
+            self._record(server, time.monotonic() - started)
+            if flags & 0x000F == RCODE_NXDOMAIN:
+                raise DnsError(f"Domain not found: {name}")
+            return records
+        raise DnsError(f"Failed to resolve domain: {name} ({last_error})")
+
+    def _query_race(self, name):
+        """
+        Sends the query to every server at once and returns the first answer
+        that has records. Once a server answered without records the others
+        only get a short grace period, so a dead server doesn't hold back
+        every name that has to go to the fallback.
+        """
+        query_id = random.randint(0, 0xFFFF)
+        query = build_query(name, query_id)
+        selector = selectors.DefaultSelector()
+        sockets, answered, not_found, last_error = [], 0, 0, None
+        started = time.monotonic()
+        try:
+            for server in self.nameservers:
+                try:
+                    sock = socket.socket(self._family(server), socket.SOCK_DGRAM)
+                    sockets.append(sock)
+                    sock.setblocking(False)
+                    sock.connect((server, self.port))
+                    sock.send(query)
+                except OSError as e:
+                    self._record(server, None)
+                    last_error = e
+                    continue
+                selector.register(sock, selectors.EVENT_READ, server)
+
+            deadline = started + self.timeout
+            while selector.get_map():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                for key, _ in selector.select(remaining):
+                    server = key.data
+                    try:
+                        data = key.fileobj.recv(4096)
+                        if data[:2] != query[:2]:
+                            continue  # Resposta atrasada de outra consulta; continua esperando
+                        flags, records = parse_response(data, query_id)
+                        if flags & FLAG_TC:
+                            flags, records = self._query_tcp(server, query, query_id)
+                    except (OSError, DnsError, struct.error, IndexError) as e:
+                        records, flags, last_error = None, 0, e
+                    selector.unregister(key.fileobj)
+                    if records is None:
+                        self._record(server, None)
+                        self.logger.debug(f"Query for {name} to {server} failed: {last_error}")
+                        continue
+                    self._record(server, time.monotonic() - started)
+                    answered += 1
+                    if records:
+                        return records
+                    if flags & 0x000F == RCODE_NXDOMAIN:
+                        not_found += 1
+                    elapsed = time.monotonic() - started
+                    deadline = min(deadline, started + max(RACE_GRACE, 2 * elapsed))
+            for key in selector.get_map().values():
+                self._record(key.data, None)  # Sem resposta até o prazo
+        finally:
+            selector.close()
+            for sock in sockets:
+                sock.close()
+
+        if answered and not_found == answered:
+            raise DnsError(f"Domain not found: {name}")
+        if answered:
+            return []  # Responderam, mas sem registros A
+        raise DnsError(f"Failed to resolve domain: {name} ({last_error or 'timed out'})")
+
+    def _family(self, server):
+        return socket.AF_INET6 if ":" in server else socket.AF_INET
+
+    def _query_udp(self, server, query, query_id):
+        with socket.socket(self._family(server), socket.SOCK_DGRAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect((server, self.port))
+            sock.send(query)
+            deadline = time.monotonic() + self.timeout
+            while True:
+                sock.settimeout(max(0.0, deadline - time.monotonic()))
+                response = sock.recv(4096)
+                try:
+                    return parse_response(response, query_id)
+                except DnsError:
+                    # Resposta atrasada de uma consulta anterior; continua esperando.
+                    continue
+
+    def _query_tcp(self, server, query, query_id):
+        with socket.create_connection((server, self.port), timeout=self.timeout) as sock:
+            sock.sendall(struct.pack("!H", len(query)) + query)
+            length = struct.unpack("!H", self._recv_exact(sock, 2))[0]
+            return parse_response(self._recv_exact(sock, length), query_id)
+
+    @staticmethod
+    def _recv_exact(sock, size):
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise DnsError("Connection closed by DNS server.")
+            data += chunk
+        return data
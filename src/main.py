@@ -32,8 +32,18 @@ if __name__ == "__main__":
         "manager": VpnManager()
     }
 
-    # 2. Cria o Controller, injetando o Model
-    controller = Controller(model)
+    # 2. Cria o Controller, injetando o Model. As tarefas assíncronas (connect)
+    # rodam no próprio main loop do GLib quando o PyGObject oferece a integração
+    # com asyncio; senão o Controller usa uma thread com um loop próprio.
+    loop = None
+    try:
+        import asyncio
+        from gi.events import GLibEventLoopPolicy
+        asyncio.set_event_loop_policy(GLibEventLoopPolicy())
+        loop = asyncio.get_event_loop_policy().get_event_loop()
+    except ImportError:
+        pass
+    controller = Controller(model, loop=loop)
 
     # 3. Cria a Aplicação (View principal), injetando o Controller
     app = Application(controller=controller)
@@ -0,0 +1,340 @@
+# netlink_routes.py
+"""
+Route engine that talks rtnetlink directly.
+
+Instead of forking one `ip route add/del` per route, all requests are packed
+into a single batch of RTM_NEWROUTE/RTM_DELROUTE messages, each with its own
+sequence number, and the kernel acknowledges every message individually. That
+gives one result per route and costs a handful of syscalls for hundreds of
+routes.
+
+With policy routing the routes live in a table of their own, selected by an
+`ip rule` (`add_rule`), and tearing them all down is one `flush_table`.
+
+Modifying the routing table requires CAP_NET_ADMIN, so the engine runs inside
+the privileged helper (see privileged_helper.py).
+"""
+import errno
+import ipaddress
+import os
+import socket
+import struct
+
+# --- Constantes do rtnetlink (linux/netlink.h e linux/rtnetlink.h) ---
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+
+NLM_F_REQUEST = 0x01
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+NLM_F_EXCL = 0x200
+NLM_F_CREATE = 0x400
+
+RTM_NEWROUTE = 24
+RTM_DELROUTE = 25
+RTM_GETROUTE = 26
+RTM_NEWRULE = 32
+RTM_DELRULE = 33
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_TABLE = 15
+
+FRA_PRIORITY = 6
+FRA_TABLE = 15
+FR_ACT_TO_TBL = 1
+
+RT_TABLE_UNSPEC = 0
+RT_TABLE_DEFAULT = 253
+RT_TABLE_MAIN = 254
+RT_TABLE_LOCAL = 255
+RESERVED_TABLES = {RT_TABLE_UNSPEC, RT_TABLE_DEFAULT, RT_TABLE_MAIN, RT_TABLE_LOCAL}
+RTPROT_BOOT = 3
+# Protocolo próprio nas rotas instaladas pelo app (o `ip route` mostra "proto 115"),
+# para distingui-las das rotas do snx e do sistema na reconciliação.
+RTPROT_SNX_CONNECT = 115
+RT_SCOPE_UNIVERSE = 0
+RT_SCOPE_NOWHERE = 255
+RTN_UNICAST = 1
+
+_NLMSGHDR = struct.Struct("=IHHII")   # len, type, flags, seq, pid
+_RTMSG = struct.Struct("=BBBBBBBBI")  # family, dst_len, src_len, tos, table, protocol, scope, type, flags
+_FIB_RULE_HDR = struct.Struct("=BBBBBBBBI")  # family, dst_len, src_len, tos, table, res1, res2, action, flags
+_RTATTR = struct.Struct("=HH")        # len, type
+_NLMSGERR = struct.Struct("=i")
+
+# Tamanho máximo de cada escrita no socket. O kernel processa cada datagrama
+# mensagem a mensagem, então lotes grandes são divididos sem perder a
+# semântica de "uma transação com um ACK por rota".
+_MAX_DATAGRAM = 32 * 1024
+_RCVBUF = 1024 * 1024
+_ACK_TIMEOUT = 5.0
+
+
+class NetlinkError(OSError):
+    """Raised when the netlink socket itself cannot be used."""
+    pass
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _rtattr(attr_type, payload):
+    length = _RTATTR.size + len(payload)
+    return _RTATTR.pack(length, attr_type) + payload + b"\0" * (_align(length) - length)
+
+
+def route_result(destination, error=0):
+    """Builds the per-route result dict returned by every backend."""
+    return {
+        "destination": destination,
+        "ok": error == 0,
+        "errno": error,
+        "error": os.strerror(error) if error else None,
+    }
+
+
+class NetlinkRouteEngine:
+    """
+    Adds and deletes routes in batches over a NETLINK_ROUTE socket.
+    Every public method returns a list of result dicts (see `route_result`),
+    in the same order as the destinations that were given.
+    """
+    def __init__(self, table=RT_TABLE_MAIN, protocol=RTPROT_SNX_CONNECT):
+        self.table = table
+        self.protocol = protocol
+        self._seq = 0
+
+    # --- Public API ---
+    def add_routes(self, destinations, gateway, table=None):
+        """
+        Installs `destinations` via `gateway` in `table` (default: the
+        engine's). Existing routes report EEXIST.
+        """
+        return self._transact(RTM_NEWROUTE, NLM_F_CREATE | NLM_F_EXCL, destinations, gateway, table)
+
+    def delete_routes(self, destinations, gateway=None, table=None):
+        """Removes `destinations`. Missing routes report ESRCH."""
+        return self._transact(RTM_DELROUTE, 0, destinations, gateway, table)
+
+    def flush_table(self, table=None):
+        """
+        Deletes every route this app installed (its protocol) in `table`, in
+        one batch, whatever the config says. Returns the delete results.
+        """
+        table = self.table if table is None else table
+        destinations = [
+            route["destination"] for route in self.list_routes(table)
+            if route["protocol"] == self.protocol
+        ]
+        return self._transact(RTM_DELROUTE, 0, destinations, None, table)
+
+    def add_rule(self, table, priority):
+        """
+        `ip rule add pref PRIORITY lookup TABLE`: every IPv4 lookup also tries
+        `table`, before the main one. Returns a result dict; EEXIST if the
+        same rule is already there.
+        """
+        return self._rule(RTM_NEWRULE, NLM_F_CREATE | NLM_F_EXCL, table, priority)
+
+    def delete_rule(self, table, priority):
+        """Removes the rule added by add_rule(). ENOENT if it isn't there."""
+        return self._rule(RTM_DELRULE, 0, table, priority)
+
+    def list_routes(self, table=None):
+        """
+        Dumps the IPv4 unicast routes of `table` (default: the engine's), as
+        dicts with "destination" (CIDR), "gateway", "oif" and "protocol".
+        Reading the table needs no privileges.
+        """
+        table = self.table if table is None else table
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        except OSError as e:
+            raise NetlinkError(e.errno, f"Cannot open netlink socket: {e.strerror}")
+        routes = []
+        with sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RCVBUF)
+            sock.settimeout(_ACK_TIMEOUT)
+            sock.bind((0, 0))
+            seq = self._next_seq()
+            body = _RTMSG.pack(socket.AF_INET, 0, 0, 0, 0, 0, 0, 0, 0)
+            sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(body), RTM_GETROUTE,
+                                     NLM_F_REQUEST | NLM_F_DUMP, seq, 0) + body)
+            while True:
+                try:
+                    data = sock.recv(_RCVBUF)
+                except socket.timeout:
+                    raise NetlinkError(errno.ETIMEDOUT, "Route dump timed out.")
+                except OSError as e:
+                    # Ex.: ENOBUFS, a tabela não coube no buffer de recepção
+                    raise NetlinkError(e.errno or errno.EIO, f"Route dump failed: {e.strerror or e}")
+                offset = 0
+                while offset + _NLMSGHDR.size <= len(data):
+                    length, msg_type, _, reply_seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                    if length < _NLMSGHDR.size:
+                        return routes
+                    if reply_seq == seq:
+                        if msg_type == NLMSG_DONE:
+                            return routes
+                        if msg_type == NLMSG_ERROR:
+                            (error,) = _NLMSGERR.unpack_from(data, offset + _NLMSGHDR.size)
+                            raise NetlinkError(-error, f"Route dump failed: {os.strerror(-error)}")
+                        if msg_type == RTM_NEWROUTE:
+                            route = self._parse_route(data[offset + _NLMSGHDR.size:offset + length], table)
+                            if route is not None:
+                                routes.append(route)
+                    offset += _align(length)
+
+    # --- Internals ---
+    def _parse_route(self, payload, wanted_table):
+        if len(payload) < _RTMSG.size:
+            return None
+        family, dst_len, _, _, table, protocol, _, route_type, _ = _RTMSG.unpack_from(payload)
+        attrs, offset = {}, _RTMSG.size
+        while offset + _RTATTR.size <= len(payload):
+            attr_len, attr_type = _RTATTR.unpack_from(payload, offset)
+            if attr_len < _RTATTR.size:
+                break
+            attrs[attr_type] = payload[offset + _RTATTR.size:offset + attr_len]
+            offset += _align(attr_len)
+        if RTA_TABLE in attrs:
+            (table,) = struct.unpack("=I", attrs[RTA_TABLE][:4])
+        if family != socket.AF_INET or route_type != RTN_UNICAST or table != wanted_table:
+            return None
+        destination = socket.inet_ntoa(attrs[RTA_DST]) if RTA_DST in attrs else "0.0.0.0"
+        gateway = attrs.get(RTA_GATEWAY)
+        return {
+            "destination": f"{destination}/{dst_len}",
+            "gateway": socket.inet_ntoa(gateway) if gateway else None,
+            "oif": struct.unpack("=I", attrs[RTA_OIF][:4])[0] if RTA_OIF in attrs else None,
+            "protocol": protocol,
+        }
+
+    def _next_seq(self):
+        self._seq = (self._seq + 1) & 0xFFFFFFFF or 1
+        return self._seq
+
+    def _build_message(self, msg_type, flags, network, gateway, seq, table):
+        family = socket.AF_INET if network.version == 4 else socket.AF_INET6
+        short_table = table if table < 256 else RT_TABLE_UNSPEC
+        if msg_type == RTM_NEWROUTE:
+            rtm = _RTMSG.pack(family, network.prefixlen, 0, 0, short_table,
+                              self.protocol, RT_SCOPE_UNIVERSE, RTN_UNICAST, 0)
+        else:
+            rtm = _RTMSG.pack(family, network.prefixlen, 0, 0, short_table,
+                              0, RT_SCOPE_NOWHERE, 0, 0)
+
+        attrs = _rtattr(RTA_DST, network.network_address.packed)
+        if gateway is not None:
+            attrs += _rtattr(RTA_GATEWAY, gateway.packed)
+        if table >= 256:
+            attrs += _rtattr(RTA_TABLE, struct.pack("=I", table))
+
+        body = rtm + attrs
+        header = _NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type,
+                                NLM_F_REQUEST | NLM_F_ACK | flags, seq, 0)
+        return header + body
+
+    def _transact(self, msg_type, flags, destinations, gateway, table=None):
+        table = self.table if table is None else table
+        destinations = list(destinations)
+        results = [None] * len(destinations)
+        gateway_ip = ipaddress.ip_address(gateway) if gateway else None
+
+        pending = {}  # seq -> índice na lista de resultados
+        batches, current, current_seqs = [], b"", []
+        for index, destination in enumerate(destinations):
+            try:
+                network = ipaddress.ip_network(destination, strict=False)
+                if gateway_ip is not None and gateway_ip.version != network.version:
+                    raise ValueError("address family mismatch")
+            except ValueError:
+                results[index] = route_result(destination, errno.EINVAL)
+                continue
+
+            seq = self._next_seq()
+            message = self._build_message(msg_type, flags, network, gateway_ip, seq, table)
+            pending[seq] = index
+            if current and len(current) + len(message) > _MAX_DATAGRAM:
+                batches.append((current, current_seqs))
+                current, current_seqs = b"", []
+            current += message
+            current_seqs.append(seq)
+        if current:
+            batches.append((current, current_seqs))
+
+        if not pending:
+            return results
+
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        except OSError as e:
+            raise NetlinkError(e.errno, f"Cannot open netlink socket: {e.strerror}")
+
+        with sock:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RCVBUF)
+            sock.settimeout(_ACK_TIMEOUT)
+            sock.bind((0, 0))
+            for batch, seqs in batches:
+                sock.sendall(batch)
+                # Lê os ACKs de cada lote antes de enviar o próximo, para não
+                # estourar o buffer de recepção com milhares de respostas.
+                try:
+                    self._collect_acks(sock, set(seqs), pending, destinations, results)
+                except socket.timeout:
+                    break
+
+        for seq, index in pending.items():
+            results[index] = route_result(destinations[index], errno.ETIMEDOUT)
+        return results
+
+    def _rule(self, msg_type, flags, table, priority):
+        seq = self._next_seq()
+        short_table = table if table < 256 else RT_TABLE_UNSPEC
+        body = _FIB_RULE_HDR.pack(socket.AF_INET, 0, 0, 0, short_table, 0, 0, FR_ACT_TO_TBL, 0)
+        body += _rtattr(FRA_PRIORITY, struct.pack("=I", priority))
+        body += _rtattr(FRA_TABLE, struct.pack("=I", table))
+        message = _NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type,
+                                 NLM_F_REQUEST | NLM_F_ACK | flags, seq, 0) + body
+        name = f"rule {priority} lookup {table}"
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        except OSError as e:
+            raise NetlinkError(e.errno, f"Cannot open netlink socket: {e.strerror}")
+        results = [None]
+        with sock:
+            sock.settimeout(_ACK_TIMEOUT)
+            sock.bind((0, 0))
+            sock.sendall(message)
+            try:
+                self._collect_acks(sock, {seq}, {seq: 0}, [name], results)
+            except socket.timeout:
+                results[0] = route_result(name, errno.ETIMEDOUT)
+        return results[0]
+
+    def _collect_acks(self, sock, expected, pending, destinations, results):
+        """Reads ACKs until every seq in `expected` has one. socket.timeout is left to the caller."""
+        while expected:
+            try:
+                data = sock.recv(_RCVBUF)
+            except socket.timeout:
+                raise
+            except OSError as e:
+                # Ex.: ENOBUFS, ACKs perdidos; o resultado de cada rota ficaria desconhecido
+                raise NetlinkError(e.errno or errno.EIO, f"Reading netlink ACKs failed: {e.strerror or e}")
+            offset = 0
+            while offset + _NLMSGHDR.size <= len(data):
+                length, msg_type, _, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+                if length < _NLMSGHDR.size:
+                    break
+                if msg_type == NLMSG_ERROR and seq in expected:
+                    (error,) = _NLMSGERR.unpack_from(data, offset + _NLMSGHDR.size)
+                    index = pending.pop(seq)
+                    results[index] = route_result(destinations[index], -error)
+                    expected.discard(seq)
+                offset += _align(length)
@@ -0,0 +1,476 @@
+# privileged_helper.py
+"""
+Root-side helper that lives for a whole VPN session.
+
+The app starts it once with `pkexec python3 privileged_helper.py <uid>`,
+writes a random token on its stdin and keeps that pipe open. The helper
+creates its socket in a directory of its own (owned by it, mode 0711, so
+the user can only reach the socket by name), answers `READY <socket path>`
+on stdout and then serves typed requests (add/delete routes, policy rules, flush a route table,
+set sysctl, flush) on a UNIX socket, so route changes cost a local RPC instead of a polkit round-trip.
+
+Requests are only accepted from the uid that started the helper (checked with
+SO_PEERCRED) and when they carry the session token. When the app closes the
+stdin pipe, or dies, the helper exits.
+
+Wire format: each message is a 4-byte big-endian length followed by a UTF-8
+JSON object.
+    request:  {"token": "...", "type": "add_routes", "gateway": "...", "destinations": [...]}
+    response: {"ok": true, "result": ...} or {"ok": false, "error": "..."}
+"""
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import secrets
+import shutil
+import socket
+import socketserver
+import stat
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+
+from netlink_routes import NetlinkRouteEngine, RESERVED_TABLES
+
+_LENGTH = struct.Struct("!I")
+_MAX_MESSAGE = 16 * 1024 * 1024
+_READY_LINE = "READY"
+_START_TIMEOUT = 120  # Inclui o tempo que o usuário leva para digitar a senha no polkit
+
+# Somente estes sysctls podem ser alterados pelo helper.
+ALLOWED_SYSCTLS = {"net.ipv6.conf.all.disable_ipv6"}
+# Regras de policy routing: só antes da regra da tabela main (32766).
+MAX_RULE_PRIORITY = 32765
+SOCKET_NAME = "helper.sock"
+
+
+class HelperError(Exception):
+    """Raised when the helper cannot be started or rejects a request."""
+    pass
+
+class HelperUnavailableError(HelperError):
+    """Raised when pkexec is missing, so the helper cannot be started at all."""
+    pass
+
+
+def make_socket_dir():
+    """
+    Creates the directory for the helper socket: in /run when running as
+    root, owned by the helper and mode 0711 (no listing, no writes by others).
+    """
+    base = "/run" if os.geteuid() == 0 and os.access("/run", os.W_OK) else tempfile.gettempdir()
+    path = tempfile.mkdtemp(prefix="snx-connect-helper-", dir=base)
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    try:
+        os.fchmod(fd, 0o711)
+        check_socket_dir(os.fstat(fd), {os.geteuid()}, path)
+    finally:
+        os.close(fd)
+    return path
+
+
+def check_socket_dir(st, owners, path):
+    """Raises HelperError unless `st` is a directory owned by one of `owners` that only its owner can write to."""
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid not in owners or st.st_mode & 0o022:
+        raise HelperError(f"Unsafe directory for the helper socket: {path}")
+
+
+def write_sysctl(name, value):
+    """Writes a sysctl through /proc/sys, the same as `sysctl -w name=value`."""
+    path = os.path.join("/proc/sys", *name.split("."))
+    with open(path, "w") as f:
+        f.write(str(value))
+
+
+# --- Protocolo ---
+def send_message(sock, message):
+    payload = json.dumps(message).encode("utf-8")
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock, size):
+    chunks = []
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError("Connection closed by peer.")
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b"".join(chunks)
+
+
+def recv_message(sock):
+    (length,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    if length > _MAX_MESSAGE:
+        raise HelperError(f"Message too large ({length} bytes).")
+    return json.loads(_recv_exact(sock, length).decode("utf-8"))
+
+
+# --- Lado root: execução das requisições ---
+class HelperService:
+    """
+    Validates and executes typed requests against a route backend.
+    The backend needs `add_routes(destinations, gateway, table=None)` and
+    `delete_routes(destinations, gateway, table=None)` (plus `add_rule`,
+    `delete_rule` and `flush_table` for policy routing), so it can be
+    replaced by a fake one to run the helper without privileges.
+    """
+    def __init__(self, backend=None, sysctl_writer=write_sysctl):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.backend = backend or NetlinkRouteEngine()
+        self.sysctl_writer = sysctl_writer
+        self.installed = {}  # (destino, tabela) -> gateway, rotas adicionadas nesta sessão
+        self.lock = threading.Lock()
+        self.handlers = {
+            "ping": self._handle_ping,
+            "add_routes": self._handle_add_routes,
+            "delete_routes": self._handle_delete_routes,
+            "add_rule": self._handle_add_rule,
+            "delete_rule": self._handle_delete_rule,
+            "flush_table": self._handle_flush_table,
+            "set_sysctl": self._handle_set_sysctl,
+            "flush": self._handle_flush,
+        }
+
+    def handle(self, request):
+        """Returns the response dict for a request dict. Never raises."""
+        handler = self.handlers.get(request.get("type"))
+        if handler is None:
+            return {"ok": False, "error": f"Unknown request type: {request.get('type')}"}
+        try:
+            with self.lock:
+                return {"ok": True, "result": handler(request)}
+        except (ValueError, TypeError, OSError) as e:
+            return {"ok": False, "error": str(e)}
+
+    @staticmethod
+    def _routes_args(request):
+        gateway = request.get("gateway")
+        destinations = request.get("destinations")
+        if gateway is not None:
+            gateway = str(ipaddress.ip_address(gateway))
+        if not isinstance(destinations, list) or not all(isinstance(d, str) for d in destinations):
+            raise ValueError("'destinations' must be a list of strings.")
+        return destinations, gateway
+
+    @staticmethod
+    def _table_arg(request, required=False):
+        """A policy routing table id; the system tables (main, local, ...) are refused."""
+        table = request.get("table")
+        if table is None and not required:
+            return None
+        if not isinstance(table, int) or isinstance(table, bool) or not 0 < table <= 0xFFFFFFFF:
+            raise ValueError("'table' must be a routing table id.")
+        if table in RESERVED_TABLES:
+            raise ValueError(f"Table {table} is reserved by the system.")
+        return table
+
+    @staticmethod
+    def _priority_arg(request):
+        priority = request.get("priority")
+        if not isinstance(priority, int) or isinstance(priority, bool) or not 0 < priority <= MAX_RULE_PRIORITY:
+            raise ValueError(f"'priority' must be between 1 and {MAX_RULE_PRIORITY}.")
+        return priority
+
+    def _handle_ping(self, request):
+        return {"pid": os.getpid()}
+
+    def _handle_add_routes(self, request):
+        destinations, gateway = self._routes_args(request)
+        table = self._table_arg(request)
+        if gateway is None:
+            raise ValueError("'gateway' is required to add routes.")
+        results = self.backend.add_routes(destinations, gateway, **self._table_kwargs(table))
+        for result in results:
+            if result["ok"]:
+                self.installed[(result["destination"], table)] = gateway
+        return results
+
+    def _handle_delete_routes(self, request):
+        destinations, gateway = self._routes_args(request)
+        table = self._table_arg(request)
+        results = self.backend.delete_routes(destinations, gateway, **self._table_kwargs(table))
+        for result in results:
+            self.installed.pop((result["destination"], table), None)
+        return results
+
+    def _handle_add_rule(self, request):
+        return self.backend.add_rule(self._table_arg(request, required=True), self._priority_arg(request))
+
+    def _handle_delete_rule(self, request):
+        return self.backend.delete_rule(self._table_arg(request, required=True), self._priority_arg(request))
+
+    def _handle_flush_table(self, request):
+        """Deletes every route of the app in a dedicated table, even ones from an earlier session."""
+        table = self._table_arg(request, required=True)
+        results = self.backend.flush_table(table)
+        for key in [key for key in self.installed if key[1] == table]:
+            del self.installed[key]
+        return results
+
+    @staticmethod
+    def _table_kwargs(table):
+        # Sem tabela, a chamada fica como antes (backends falsos sem o parâmetro continuam valendo)
+        return {} if table is None else {"table": table}
+
+    def _handle_set_sysctl(self, request):
+        name, value = request.get("name"), request.get("value")
+        if name not in ALLOWED_SYSCTLS:
+            raise ValueError(f"sysctl '{name}' is not allowed.")
+        if value not in (0, 1):
+            raise ValueError("sysctl value must be 0 or 1.")
+        self.sysctl_writer(name, value)
+        return None
+
+    def _handle_flush(self, request):
+        """Deletes every route this helper installed during the session."""
+        by_gateway = {}
+        for (destination, table), gateway in self.installed.items():
+            by_gateway.setdefault((gateway, table), []).append(destination)
+        results = []
+        for (gateway, table), destinations in by_gateway.items():
+            results.extend(self.backend.delete_routes(destinations, gateway, **self._table_kwargs(table)))
+        self.installed.clear()
+        return results
+
+
+def peer_credentials(sock):
+    """(pid, uid, gid) of the process on the other end of a UNIX socket."""
+    return struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+
+
+class _RequestHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        pid, uid, gid = peer_credentials(self.request)
+        if uid not in (server.allowed_uid, 0):
+            server.logger.warning(f"Rejected connection from uid {uid} (pid {pid}).")
+            return
+
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (EOFError, OSError, ValueError, HelperError):
+                return
+            if not hmac.compare_digest(str(request.get("token", "")), server.token):
+                send_message(self.request, {"ok": False, "error": "Invalid token."})
+                return
+            response = server.service.handle(request)
+            response["id"] = request.get("id")
+            send_message(self.request, response)
+
+
+class HelperServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """UNIX socket server that forwards authenticated requests to a HelperService."""
+    daemon_threads = True
+
+    def __init__(self, socket_dir, token, allowed_uid, service=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.token = token
+        self.allowed_uid = allowed_uid
+        self.service = service or HelperService()
+        self.socket_dir = socket_dir
+        # Só outro processo do mesmo dono poderia trocar o socket por um link
+        check_socket_dir(os.lstat(socket_dir), {os.geteuid()}, socket_dir)
+        socket_path = os.path.join(socket_dir, SOCKET_NAME)
+        # Já nasce 0600: nada de chmod depois do bind
+        umask = os.umask(0o177)
+        try:
+            super().__init__(socket_path, _RequestHandler)
+        finally:
+            os.umask(umask)
+        if os.geteuid() == 0 and allowed_uid != 0:
+            os.chown(socket_path, allowed_uid, -1, follow_symlinks=False)
+
+    def server_close(self):
+        super().server_close()
+        for remove, path in ((os.unlink, self.server_address), (os.rmdir, self.socket_dir)):
+            try:
+                remove(path)
+            except OSError:
+                pass
+
+
+def serve(allowed_uid, stdin=None, stdout=None, service=None, socket_dir=None):
+    """
+    Reads the token from `stdin`, serves until `stdin` is closed.
+    Announces readiness by printing `READY <socket path>` on `stdout`.
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    token = stdin.readline().strip()
+    if not token:
+        return 1
+
+    server = HelperServer(socket_dir or make_socket_dir(), token, allowed_uid, service)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    stdout.write(f"{_READY_LINE} {server.server_address}\n")
+    stdout.flush()
+    try:
+        # O pipe fica aberto enquanto a aplicação viver.
+        while stdin.readline():
+            pass
+    finally:
+        server.shutdown()
+        server.server_close()
+    return 0
+
+
+# --- Lado da aplicação ---
+class PrivilegedSession:
+    """
+    App-side handle to the privileged helper. The helper is started lazily on
+    the first request and reused until `stop()` is called. When the app already
+    runs as root, requests are executed in-process.
+    """
+    def __init__(self, service=None, command=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.process = None
+        self.sock = None
+        self.token = None
+        self.lock = threading.Lock()
+        self.request_id = 0
+        self.command = command
+        self.local_service = service if service is not None else (
+            HelperService() if os.geteuid() == 0 else None
+        )
+
+    # --- Public API ---
+    def add_routes(self, destinations, gateway, table=None):
+        return self.request("add_routes", destinations=list(destinations), gateway=gateway, table=table)
+
+    def delete_routes(self, destinations, gateway=None, table=None):
+        return self.request("delete_routes", destinations=list(destinations), gateway=gateway, table=table)
+
+    def add_rule(self, table, priority):
+        return self.request("add_rule", table=table, priority=priority)
+
+    def delete_rule(self, table, priority):
+        return self.request("delete_rule", table=table, priority=priority)
+
+    def flush_table(self, table):
+        return self.request("flush_table", table=table)
+
+    def set_sysctl(self, name, value):
+        return self.request("set_sysctl", name=name, value=value)
+
+    def flush(self):
+        return self.request("flush")
+
+    def is_running(self):
+        return self.local_service is not None or (
+            self.process is not None and self.process.poll() is None
+        )
+
+    def request(self, request_type, **fields):
+        """Sends one request and returns its result, raising HelperError on failure."""
+        request = dict(fields, type=request_type)
+        if self.local_service is not None:
+            response = self.local_service.handle(request)
+        else:
+            with self.lock:
+                self._ensure_started()
+                self.request_id += 1
+                request.update(token=self.token, id=self.request_id)
+                try:
+                    send_message(self.sock, request)
+                    response = recv_message(self.sock)
+                except (OSError, EOFError, ValueError) as e:
+                    self._cleanup()
+                    raise HelperError(f"Lost connection to the privileged helper: {e}")
+        if not response.get("ok"):
+            raise HelperError(response.get("error", "Unknown helper error."))
+        return response.get("result")
+
+    def stop(self):
+        """Closes the session; the helper exits when its stdin is closed."""
+        with self.lock:
+            self._cleanup()
+
+    # --- Internals ---
+    def _ensure_started(self):
+        if self.process is not None and self.process.poll() is None and self.sock is not None:
+            return
+        self._cleanup()
+
+        if self.command is None and shutil.which("pkexec") is None:
+            raise HelperUnavailableError("pkexec command not found.")
+
+        self.token = secrets.token_hex(32)
+        command = self.command or ["pkexec", "python3", os.path.abspath(__file__)]
+
+        self.logger.info("Starting privileged helper.")
+        self.process = subprocess.Popen(
+            command + [str(os.getuid())],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True
+        )
+        try:
+            self.process.stdin.write(self.token + "\n")
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            pass
+
+        socket_path = self._wait_ready()
+        if not socket_path:
+            returncode = self.process.poll()
+            self._cleanup()
+            raise HelperError(f"Privileged helper failed to start (exit code {returncode}).")
+
+        try:
+            # O diretório tem de ser do root (ou nosso) e ninguém mais escreve nele
+            socket_dir = os.path.dirname(socket_path)
+            check_socket_dir(os.lstat(socket_dir), {0, os.getuid()}, socket_dir)
+            if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+                raise HelperError(f"Not a socket: {socket_path}")
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(socket_path)
+        except (OSError, HelperError) as e:
+            self._cleanup()
+            raise HelperError(f"Could not reach the privileged helper: {e}")
+        self.logger.info(f"Privileged helper ready (PID {self.process.pid}).")
+
+    def _wait_ready(self):
+        """The socket path announced by the helper, or None if it didn't start."""
+        result = []
+        reader = threading.Thread(
+            target=lambda: result.append(self.process.stdout.readline().strip()), daemon=True
+        )
+        reader.start()
+        reader.join(_START_TIMEOUT)
+        word, _, socket_path = (result[0] if result else "").partition(" ")
+        if word != _READY_LINE or not os.path.isabs(socket_path):
+            return None
+        return socket_path
+
+    def _cleanup(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        if self.process is not None:
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.logger.warning("Privileged helper did not exit in time.")
+            self.process = None
+
+
+def main(argv):
+    if len(argv) != 2:
+        print(f"usage: {argv[0]} <uid>", file=sys.stderr)
+        return 2
+    logging.basicConfig(level=logging.INFO)
+    allowed_uid = int(os.environ.get("PKEXEC_UID", argv[1]))
+    return serve(allowed_uid)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
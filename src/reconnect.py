@@ -0,0 +1,126 @@
+# reconnect.py
+"""
+Automatic reconnection after the tunnel drops.
+
+`ReconnectSupervisor` retries a connect callable on its own thread, waiting a
+jittered exponential delay between attempts so a flapping gateway is not
+hammered, and records every incident (attempts, errors and time to recovery)
+in a bounded history.
+"""
+import collections
+import logging
+import random
+import threading
+import time
+
+
+class Backoff:
+    """
+    Exponential delays with jitter: attempt n waits between
+    (1 - jitter) * d and d seconds, with d = min(max_delay, base * factor ** n).
+    """
+    def __init__(self, base=1.0, factor=2.0, max_delay=60.0, jitter=0.5, rng=random.random):
+        self.base = base
+        self.factor = factor
+        self.max_delay = max_delay
+        self.jitter = jitter
+        self.rng = rng
+
+    def delay(self, attempt):
+        ceiling = min(self.max_delay, self.base * self.factor ** attempt)
+        return ceiling * (1 - self.jitter * self.rng())
+
+
+class ReconnectSupervisor:
+    """
+    Calls `attempt()` until it returns without raising, `max_attempts` is
+    reached or `cancel()` is called. Progress is reported to `on_event(event)`
+    with event["state"] in "reconnecting", "recovered", "failed", "cancelled".
+    """
+    def __init__(self, attempt, backoff=None, max_attempts=10, on_event=None,
+                 history=20, clock=time.monotonic):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.attempt = attempt
+        self.backoff = backoff or Backoff()
+        self.max_attempts = max_attempts
+        self.on_event = on_event
+        self.clock = clock
+        self.incidents = collections.deque(maxlen=history)
+        self._thread = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    def is_active(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def trigger(self):
+        """Starts a recovery for a new incident. Returns False if one is already running."""
+        with self._lock:
+            if self.is_active():
+                return False
+            self._cancel = threading.Event()
+            self._thread = threading.Thread(
+                target=self._run, args=(self._cancel,), name="ReconnectSupervisor", daemon=True
+            )
+            self._thread.start()
+        return True
+
+    def cancel(self, wait=True):
+        """Stops the running recovery, if any (e.g. on a user-requested disconnect)."""
+        with self._lock:
+            thread = self._thread
+            self._cancel.set()
+        if wait and thread is not None and thread is not threading.current_thread():
+            thread.join()
+
+    def is_cancelled(self):
+        """True once the running recovery was asked to stop."""
+        return self._cancel.is_set()
+
+    def history(self):
+        return [dict(incident) for incident in self.incidents]
+
+    def _run(self, cancelled):
+        started = self.clock()
+        incident = {
+            "started_at": time.time(),
+            "attempts": 0,
+            "state": "reconnecting",
+            "time_to_recovery": None,
+            "error": None,
+        }
+        self.incidents.append(incident)
+
+        for attempt in range(self.max_attempts):
+            delay = self.backoff.delay(attempt)
+            self._emit(incident, attempt=attempt + 1, delay=delay)
+            if cancelled.wait(delay):
+                break
+            incident["attempts"] = attempt + 1
+            try:
+                self.attempt()
+            except Exception as e:
+                incident["error"] = str(e)
+                self.logger.warning(f"Reconnect attempt {attempt + 1} failed: {e}")
+                continue
+            if cancelled.is_set():
+                break  # Desconectado pelo usuário durante a tentativa
+            incident["state"] = "recovered"
+            incident["time_to_recovery"] = self.clock() - started
+            self.logger.info(
+                f"Reconnected after {incident['attempts']} attempt(s) in "
+                f"{incident['time_to_recovery']:.2f}s."
+            )
+            self._emit(incident)
+            return
+
+        incident["state"] = "cancelled" if cancelled.is_set() else "failed"
+        self.logger.warning(f"Reconnect {incident['state']} after {incident['attempts']} attempt(s).")
+        self._emit(incident)
+
+    def _emit(self, incident, **extra):
+        if self.on_event:
+            try:
+                self.on_event(dict(incident, **extra))
+            except Exception as e:
+                self.logger.error(f"Reconnect listener failed: {e}")
@@ -0,0 +1,152 @@
+# route_aggregation.py
+"""
+Collapses saved routes into a minimal set of covering IPv4 prefixes.
+
+With a budget of 0 the result is exact: the same addresses are covered, just
+with fewer prefixes (e.g. 256 consecutive /32s become one /24). A positive
+budget allows the aggregates to cover up to that many extra addresses in
+total, which lets nearby but not contiguous addresses share a prefix.
+
+Every aggregate remembers which domains and which saved addresses it covers,
+so removing one address can be handled by aggregating the remaining ones again.
+"""
+import bisect
+import heapq
+import ipaddress
+
+DEFAULT_MIN_PREFIXLEN = 16
+
+
+def _supernet(first, last):
+    """Smallest prefix that contains both networks."""
+    diff = int(first.network_address) ^ int(last.broadcast_address)
+    prefixlen = min(first.prefixlen, last.prefixlen, 32 - diff.bit_length())
+    return ipaddress.ip_network((int(first.network_address), prefixlen), strict=False)
+
+
+class _Node:
+    __slots__ = ("prefix", "real", "prev", "next", "alive", "version")
+
+    def __init__(self, prefix, real):
+        self.prefix = prefix
+        self.real = real        # endereços realmente salvos dentro do prefixo
+        self.prev = None
+        self.next = None
+        self.alive = True
+        self.version = 0
+
+    @property
+    def extra(self):
+        return self.prefix.num_addresses - self.real
+
+
+def _merge_candidate(left, right, min_prefixlen):
+    """Returns (delta, supernet, absorbed nodes) for merging `left` and `right`."""
+    supernet = _supernet(left.prefix, right.prefix)
+    if supernet.prefixlen < min_prefixlen:
+        return None
+    # O supernet pode engolir vizinhos dos dois lados.
+    first = left
+    while first.prev is not None and first.prev.prefix.subnet_of(supernet):
+        first = first.prev
+    absorbed, node = [], first
+    while node is not None and node.prefix.subnet_of(supernet):
+        absorbed.append(node)
+        node = node.next
+    real = sum(n.real for n in absorbed)
+    delta = (supernet.num_addresses - real) - sum(n.extra for n in absorbed)
+    return delta, supernet, absorbed
+
+
+def _merge_with_budget(prefixes, budget, min_prefixlen):
+    nodes = [_Node(p, p.num_addresses) for p in prefixes]
+    for a, b in zip(nodes, nodes[1:]):
+        a.next, b.prev = b, a
+
+    heap, counter = [], 0
+
+    def push(left):
+        nonlocal counter
+        right = left.next
+        if right is None:
+            return
+        candidate = _merge_candidate(left, right, min_prefixlen)
+        if candidate is not None:
+            counter += 1
+            heapq.heappush(heap, (candidate[0], counter, left, left.version, right, right.version))
+
+    for node in nodes:
+        push(node)
+
+    spent = 0
+    while heap:
+        delta, _, left, lver, right, rver = heapq.heappop(heap)
+        if not (left.alive and right.alive and left.version == lver and right.version == rver
+                and left.next is right):
+            continue
+        candidate = _merge_candidate(left, right, min_prefixlen)
+        if candidate is None:
+            continue
+        delta, supernet, absorbed = candidate
+        if spent + delta > budget:
+            continue
+
+        spent += delta
+        merged = absorbed[0]
+        merged.real = sum(n.real for n in absorbed)
+        merged.prefix = supernet
+        merged.version += 1
+        merged.next = absorbed[-1].next
+        if merged.next is not None:
+            merged.next.prev = merged
+        for node in absorbed[1:]:
+            node.alive = False
+        if merged.prev is not None:
+            merged.prev.version += 1
+            push(merged.prev)
+        push(merged)
+
+    return [n.prefix for n in nodes if n.alive]
+
+
+def aggregate_routes(routes, budget=0, min_prefixlen=DEFAULT_MIN_PREFIXLEN):
+    """
+    Aggregates `routes` ({domain: [address or CIDR, ...]}).
+    Returns a list sorted by prefix of
+        {"prefix": "10.0.0.0/24", "domains": [...], "members": [...]}
+    Invalid and non-IPv4 entries are ignored.
+    """
+    members = {}
+    for domain, addresses in routes.items():
+        for address in addresses:
+            try:
+                network = ipaddress.ip_network(address, strict=False)
+            except ValueError:
+                continue
+            if network.version == 4:
+                members.setdefault(network, set()).add(domain)
+    if not members:
+        return []
+
+    prefixes = list(ipaddress.collapse_addresses(members))
+    if budget > 0 and len(prefixes) > 1:
+        prefixes = _merge_with_budget(prefixes, budget, min_prefixlen)
+
+    aggregates = [{"prefix": p, "domains": set(), "members": []} for p in prefixes]
+    starts = [int(p.network_address) for p in prefixes]
+    for network, domains in members.items():
+        index = bisect.bisect_right(starts, int(network.network_address)) - 1
+        aggregate = aggregates[index]
+        aggregate["domains"].update(domains)
+        aggregate["members"].append(network)
+
+    return [
+        {
+            "prefix": str(a["prefix"]) if a["prefix"].prefixlen < 32 else str(a["prefix"].network_address),
+            "domains": sorted(a["domains"]),
+            "members": [
+                str(m) if m.prefixlen < 32 else str(m.network_address) for m in sorted(a["members"])
+            ],
+        }
+        for a in aggregates
+    ]
@@ -0,0 +1,228 @@
+# route_import.py
+"""
+Streaming bulk import of routes (domains, IPs and CIDRs).
+
+Entries are read lazily from a file or stdin (plain text, CSV or JSON),
+validated with `ipaddress`, deduplicated, resolved in chunks with bounded
+concurrency and installed in large batches. The caller gets the final
+domain -> addresses map back and commits it to the config in one write.
+"""
+import csv
+import ipaddress
+import itertools
+import json
+import logging
+import re
+
+FORMATS = ("text", "csv", "json")
+
+# Colunas aceitas em arquivos CSV/JSON, por ordem de preferência.
+_ENTRY_FIELDS = ("domain", "host", "hostname", "ip", "address", "cidr", "network", "route")
+_HOSTNAME = re.compile(r"^(?=.{1,253}$)([A-Za-z0-9_](?:[A-Za-z0-9_-]{0,61}[A-Za-z0-9_])?\.?)+$")
+
+
+def detect_format(name, first_line):
+    """Guesses the input format from the file name, then from its content."""
+    lowered = (name or "").lower()
+    if lowered.endswith(".json"):
+        return "json"
+    if lowered.endswith(".csv"):
+        return "csv"
+    stripped = first_line.lstrip()
+    if stripped.startswith(("[", "{")):
+        return "json"
+    if "," in stripped:
+        return "csv"
+    return "text"
+
+
+def _iter_text(stream):
+    for line in stream:
+        entry = line.split("#", 1)[0].strip()
+        if entry:
+            yield entry
+
+
+def _iter_csv(stream):
+    reader = csv.reader(row for row in stream if row.strip() and not row.lstrip().startswith("#"))
+    column = 0
+    for index, row in enumerate(reader):
+        if not row:
+            continue
+        if index == 0:
+            header = [cell.strip().lower() for cell in row]
+            matches = [header.index(f) for f in _ENTRY_FIELDS if f in header]
+            if matches:
+                column = matches[0]
+                continue
+        if column < len(row) and row[column].strip():
+            yield row[column].strip()
+
+
+def _iter_json(text):
+    data = json.loads(text)
+    if isinstance(data, dict):
+        # Aceita {"routes": [...]} e os formatos novo e antigo do snx-data.json.
+        if isinstance(data.get("routes"), list):
+            data = data["routes"]
+        elif isinstance(data.get("routes"), dict):
+            data = list(data["routes"])
+        else:
+            data = [
+                key[:-len("Address")] for key, value in data.items()
+                if key.endswith("Address") and isinstance(value, list)
+            ]
+    if not isinstance(data, list):
+        raise ValueError("JSON input must be a list of entries.")
+    for item in data:
+        if isinstance(item, str):
+            entry = item
+        elif isinstance(item, dict):
+            entry = next((item[f] for f in _ENTRY_FIELDS if isinstance(item.get(f), str)), None)
+        else:
+            entry = None
+        if entry and entry.strip():
+            yield entry.strip()
+
+
+def iter_entries(stream, fmt=None, name=None):
+    """Yields the raw entries of `stream` one at a time."""
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+    first_line = stream.readline()
+    if fmt is None:
+        fmt = detect_format(name, first_line)
+    if fmt == "json":
+        return _iter_json(first_line + stream.read())
+    lines = itertools.chain([first_line], stream)
+    if fmt == "csv":
+        return _iter_csv(lines)
+    return _iter_text(lines)
+
+
+def classify(entry):
+    """
+    Returns ("network", "a.b.c.d" or "a.b.c.d/nn") for IPs and CIDRs,
+    ("domain", name) for host names, or raises ValueError.
+    """
+    try:
+        network = ipaddress.ip_network(entry, strict=False)
+    except ValueError:
+        network = None
+    if network is not None:
+        if network.version != 4:
+            raise ValueError(f"Only IPv4 routes are supported: {entry}")
+        if network.prefixlen == 32:
+            return "network", str(network.network_address)
+        return "network", str(network)
+
+    name = entry.rstrip(".").lower()
+    if "/" in name or not _HOSTNAME.match(name):
+        raise ValueError(f"Not a valid domain, IP or CIDR: {entry}")
+    return "domain", name
+
+
+class RouteImporter:
+    """
+    Runs the import pipeline.
+    - `resolve_many(names)` must return ({name: [{"address", "ttl"}]}, {name: error}).
+    - `apply_routes(addresses)` must install the addresses and return one
+      result dict per address (see netlink_routes.route_result).
+    - `progress(state)` is called with a dict of counters after each chunk.
+    """
+    def __init__(self, resolve_many, apply_routes, progress=None,
+                 known_addresses=(), chunk_size=500, batch_size=1000, ignored_errno=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.resolve_many = resolve_many
+        self.apply_routes = apply_routes
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.batch_size = batch_size
+        self.ignored_errno = ignored_errno
+
+        self.routes = {}    # entrada -> endereços
+        self.failed = {}    # entrada ou endereço -> motivo
+        self.installed = set(known_addresses)
+        self.pending = []   # endereços aguardando instalação
+        self.owners = {}    # endereço -> entradas que dependem dele
+        self.seen = set()
+        self.state = {"read": 0, "duplicates": 0, "resolved": 0, "installed": 0,
+                      "failed": 0, "done": False}
+
+    def run(self, entries):
+        """Consumes `entries` and returns {"routes": {...}, "failed": {...}, "stats": {...}}."""
+        chunk = []
+        for entry in entries:
+            self.state["read"] += 1
+            try:
+                kind, value = classify(entry)
+            except ValueError as e:
+                self._fail(entry, str(e))
+                continue
+            if value in self.seen:
+                self.state["duplicates"] += 1
+                continue
+            self.seen.add(value)
+            chunk.append((kind, value))
+            if len(chunk) >= self.chunk_size:
+                self._process_chunk(chunk)
+                chunk = []
+        if chunk:
+            self._process_chunk(chunk)
+        self._flush()
+
+        self.state["done"] = True
+        self._report()
+        return {"routes": self.routes, "failed": self.failed, "stats": dict(self.state)}
+
+    # --- Etapas do pipeline ---
+    def _process_chunk(self, chunk):
+        domains = [value for kind, value in chunk if kind == "domain"]
+        resolved, failed = self.resolve_many(domains) if domains else ({}, {})
+        for name, reason in failed.items():
+            self._fail(name, reason)
+
+        for kind, value in chunk:
+            if kind == "network":
+                self._queue(value, [value])
+            elif value in resolved:
+                addresses = sorted({record["address"] for record in resolved[value]})
+                self.state["resolved"] += 1
+                self._queue(value, addresses)
+
+        if len(self.pending) >= self.batch_size:
+            self._flush()
+        self._report()
+
+    def _queue(self, entry, addresses):
+        self.routes[entry] = addresses
+        for address in addresses:
+            self.owners.setdefault(address, []).append(entry)
+            if address not in self.installed:
+                self.installed.add(address)
+                self.pending.append(address)
+
+    def _flush(self):
+        while self.pending:
+            batch, self.pending = self.pending[:self.batch_size], self.pending[self.batch_size:]
+            for result in self.apply_routes(batch):
+                if result["ok"] or result["errno"] == self.ignored_errno:
+                    self.state["installed"] += 1
+                    continue
+                address = result["destination"]
+                self._fail(address, result["error"])
+                self.installed.discard(address)
+                for entry in self.owners.get(address, []):
+                    remaining = [a for a in self.routes.get(entry, []) if a != address]
+                    if remaining:
+                        self.routes[entry] = remaining
+                    else:
+                        self.routes.pop(entry, None)
+
+    def _fail(self, key, reason):
+        self.failed[key] = reason
+        self.state["failed"] += 1
+
+    def _report(self):
+        if self.progress:
+            self.progress(dict(self.state))
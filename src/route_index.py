@@ -0,0 +1,201 @@
+# route_index.py
+"""
+In-memory index of saved routes.
+
+The config stores routes as a versioned `{"routes": {domain: [addresses]}}`
+map. The index keeps that forward map plus a reverse address -> domains map,
+so every lookup, add and remove is O(1) and a kernel route is only touched
+when the last domain that needs an address lets go of it.
+
+The search index (route_search.py) is built on the first search and then
+kept in step with every add and remove.
+
+Configs written by older versions (one "<domain>Address" key per domain) are
+migrated with `migrate_config`.
+"""
+from route_search import RouteSearch, parse_network
+
+ROUTES_SCHEMA_VERSION = 2
+LEGACY_SUFFIX = "Address"
+
+
+def _legacy_routes(data):
+    return {
+        key[:-len(LEGACY_SUFFIX)]: value for key, value in data.items()
+        if key.endswith(LEGACY_SUFFIX) and isinstance(value, list)
+    }
+
+
+def needs_migration(data):
+    """
+    True if `data` has legacy route keys or was written for another schema.
+    A config without routes has nothing to migrate: the version is stamped
+    by the first write of the routes.
+    """
+    if any(key.endswith(LEGACY_SUFFIX) and isinstance(value, list) for key, value in data.items()):
+        return True
+    return data.get("routesVersion", ROUTES_SCHEMA_VERSION) != ROUTES_SCHEMA_VERSION
+
+
+def migrate_config(data):
+    """
+    Converts a legacy config in place to the current schema.
+    Returns True if anything changed.
+    """
+    if not needs_migration(data):
+        return False
+    legacy = _legacy_routes(data)
+    index = RouteIndex.from_config(data)
+    for domain in legacy:
+        del data[f"{domain}{LEGACY_SUFFIX}"]
+    data["routes"] = index.to_config()
+    data["routesVersion"] = ROUTES_SCHEMA_VERSION
+    return True
+
+
+class RouteIndex:
+    """Domain -> addresses map with a reverse address -> domains refcount."""
+    def __init__(self):
+        self.by_domain = {}   # domínio -> {endereço: None} (ordenado, busca O(1))
+        self.by_address = {}  # endereço -> {domínio, ...}
+        self._search = None   # RouteSearch, criado na primeira busca
+        self.version = 0      # Muda a cada alteração (cache da RouteTable no back_end)
+
+    @classmethod
+    def from_config(cls, data):
+        index = cls()
+        routes = data.get("routes")
+        if isinstance(routes, dict):
+            for domain, addresses in routes.items():
+                if isinstance(addresses, list):
+                    index.add(domain, addresses)
+        for domain, addresses in _legacy_routes(data).items():
+            index.add(domain, addresses)
+        return index
+
+    def to_config(self):
+        return {domain: list(addresses) for domain, addresses in self.by_domain.items()}
+
+    # --- Consultas ---
+    def __len__(self):
+        return len(self.by_address)
+
+    def __contains__(self, address):
+        return address in self.by_address
+
+    def domains(self):
+        return list(self.by_domain)
+
+    def addresses(self):
+        """Every distinct address, each one appears once however many domains use it."""
+        return list(self.by_address)
+
+    def has(self, domain, address):
+        return address in self.by_domain.get(domain, ())
+
+    def addresses_for(self, domain):
+        return list(self.by_domain.get(domain, ()))
+
+    def domains_for(self, address):
+        return sorted(self.by_address.get(address, ()))
+
+    def refcount(self, address):
+        return len(self.by_address.get(address, ()))
+
+    def routes(self):
+        """Flat [{"domain", "ip"}] list, in insertion order."""
+        return [
+            {"domain": domain, "ip": address}
+            for domain, addresses in self.by_domain.items() for address in addresses
+        ]
+
+    def search(self, query, mode="auto"):
+        """
+        Routes ([{"domain", "ip"}], sorted by domain) matching `query`:
+        "prefix" and "substring" match domains (prefix also matches typed
+        addresses), "network" returns the addresses inside the IPv4/CIDR
+        `query` or containing it, "auto" is "network" for a complete address
+        or CIDR and "substring" plus address prefix otherwise.
+        """
+        search = self._search_index()
+        query = query.strip()
+        network = parse_network(query)
+        if mode == "network" and network is None:
+            raise ValueError(f"Not an IPv4 address or CIDR: {query}")
+        if mode == "auto":
+            mode = "network" if network is not None else "substring"
+
+        domains, addresses = [], []
+        if mode == "network":
+            addresses = search.addresses_in(network)
+        elif mode == "prefix":
+            domains = search.domains_with_prefix(query)
+            addresses = search.addresses_with_prefix(query)
+        elif mode == "substring":
+            domains = search.domains_containing(query)
+            addresses = search.addresses_with_prefix(query)
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+
+        pairs = {(domain, address) for domain in domains for address in self.by_domain[domain]}
+        pairs.update((domain, address) for address in addresses for domain in self.by_address[address])
+        return [{"domain": domain, "ip": address} for domain, address in sorted(pairs)]
+
+    def _search_index(self):
+        if self._search is None:
+            self._search = RouteSearch.build(self.by_domain, self.by_address)
+        return self._search
+
+    # --- Alterações ---
+    def add(self, domain, addresses):
+        """
+        Links `addresses` to `domain`. Returns the addresses that were not
+        referenced by any domain before (the ones that need a kernel route).
+        """
+        is_new_domain = domain not in self.by_domain
+        linked = self.by_domain.setdefault(domain, {})
+        new = []
+        for address in addresses:
+            if address in linked:
+                continue
+            linked[address] = None
+            self.version += 1
+            owners = self.by_address.setdefault(address, set())
+            if not owners:
+                new.append(address)
+            owners.add(domain)
+        if not linked:
+            del self.by_domain[domain]
+        elif self._search is not None:
+            if is_new_domain:
+                self._search.add_domain(domain)
+            for address in new:
+                self._search.add_address(address)
+        return new
+
+    def remove(self, domain, address):
+        """
+        Unlinks `address` from `domain`. Returns True when no domain references
+        the address anymore (its kernel route can go).
+        """
+        linked = self.by_domain.get(domain)
+        if linked is None or address not in linked:
+            return False
+        del linked[address]
+        self.version += 1
+        if not linked:
+            del self.by_domain[domain]
+            if self._search is not None:
+                self._search.remove_domain(domain)
+        owners = self.by_address[address]
+        owners.discard(domain)
+        if not owners:
+            del self.by_address[address]
+            if self._search is not None:
+                self._search.remove_address(address)
+            return True
+        return False
+
+    def remove_domain(self, domain):
+        """Unlinks every address of `domain`. Returns the ones that became unreferenced."""
+        return [a for a in self.addresses_for(domain) if self.remove(domain, a)]
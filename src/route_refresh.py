@@ -0,0 +1,200 @@
+# route_refresh.py
+"""
+Re-resolves the domains of saved routes when their DNS answer expires.
+
+Addresses of CDN-backed services rotate, so the addresses stored when a
+domain was added go stale. `RouteRefresher` keeps one deadline per domain
+(the record TTL, clamped and with a little random jitter so domains added
+together don't refresh together), resolves the due ones on a small pool of
+threads and calls `on_change(domain, addresses)` only when the answer set
+differs from the previous one. Applying the change is up to the caller.
+"""
+import heapq
+import ipaddress
+import logging
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def is_domain(name):
+    """False for saved routes that are plain IPs or CIDRs (nothing to resolve)."""
+    try:
+        ipaddress.ip_network(name, strict=False)
+        return False
+    except ValueError:
+        return True
+
+
+class RouteRefresher:
+    """
+    `resolve(domain)` returns [{"address", "ttl"}] or raises; `on_change(domain,
+    addresses)` is called from a pool thread when the set of addresses changed.
+    """
+    def __init__(self, resolve, on_change, min_interval=30.0, max_interval=3600.0,
+                 jitter=0.1, max_concurrent=4, initial_spread=30.0,
+                 clock=time.monotonic, rng=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.resolve = resolve
+        self.on_change = on_change
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self.max_concurrent = max_concurrent
+        self.initial_spread = initial_spread  # Domínios sem TTL conhecido: espalhados nesse intervalo
+        self.clock = clock
+        self.rng = rng or random.Random()
+        self.entries = {}   # domínio -> estado (ver _entry)
+        self.heap = []      # (vencimento, seq, domínio); entradas antigas são ignoradas
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pool = None
+        self._stopped = True
+
+    # --- Domínios ---
+    def track(self, domain, addresses, ttl=None):
+        """Starts (or restarts) following `domain`, whose current answer is `addresses`."""
+        if not is_domain(domain):
+            return
+        with self._condition:
+            entry = self.entries.setdefault(domain, self._entry())
+            entry["addresses"] = frozenset(addresses)
+            if ttl is None:
+                self._schedule(domain, self.rng.uniform(0, self.initial_spread))
+            else:
+                entry["ttl"] = ttl
+                entry["last_resolved_at"] = time.time()
+                self._schedule(domain, self._interval(ttl))
+
+    def untrack(self, domain):
+        with self._condition:
+            self.entries.pop(domain, None)  # A entrada no heap fica e é ignorada
+
+    def sync(self, routes):
+        """Follows exactly the domains of `routes` ({domain: [addresses]}), keeping known schedules."""
+        with self._condition:
+            for domain in [d for d in self.entries if d not in routes]:
+                del self.entries[domain]
+        for domain, addresses in routes.items():
+            if domain not in self.entries:
+                self.track(domain, addresses)
+
+    def status(self):
+        """
+        {domain: {"last_resolved_at", "next_refresh_in", "ttl", "changes",
+        "failures", "error"}}. Times are epoch seconds and seconds from now.
+        """
+        now = self.clock()
+        with self._condition:
+            return {
+                domain: {
+                    "last_resolved_at": entry["last_resolved_at"],
+                    "next_refresh_in": max(0.0, entry["due"] - now) if entry["due"] is not None else None,
+                    "ttl": entry["ttl"],
+                    "changes": entry["changes"],
+                    "failures": entry["failures"],
+                    "error": entry["error"],
+                }
+                for domain, entry in self.entries.items()
+            }
+
+    # --- Ciclo de vida ---
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        with self._condition:
+            if self.is_running():
+                return
+            self._stopped = False
+            self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="RouteRefresh")
+            self._thread = threading.Thread(target=self._run, name="RouteRefresher", daemon=True)
+            self._thread.start()
+        self.logger.info(f"Route refresh started for {len(self.entries)} domains.")
+
+    def stop(self):
+        with self._condition:
+            if self._stopped:
+                return
+            self._stopped = True
+            thread, pool = self._thread, self._pool
+            self._thread = self._pool = None
+            self._condition.notify_all()
+        if thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        pool.shutdown(wait=False, cancel_futures=True)
+        self.logger.info("Route refresh stopped.")
+
+    # --- Internals ---
+    @staticmethod
+    def _entry():
+        return {"addresses": frozenset(), "due": None, "ttl": None, "last_resolved_at": None,
+                "changes": 0, "failures": 0, "error": None, "in_flight": False}
+
+    def _interval(self, ttl):
+        base = min(max(ttl, self.min_interval), self.max_interval)
+        # Só para frente: o cache do resolvedor já expirou quando a consulta sai
+        return base * (1 + self.rng.uniform(0, self.jitter))
+
+    def _schedule(self, domain, delay):
+        """Caller holds the condition."""
+        due = self.clock() + delay
+        self.entries[domain]["due"] = due
+        self._seq += 1
+        heapq.heappush(self.heap, (due, self._seq, domain))
+        self._condition.notify_all()
+
+    def _run(self):
+        with self._condition:
+            while not self._stopped:
+                now = self.clock()
+                while self.heap and not self._stopped:
+                    due, _, domain = self.heap[0]
+                    entry = self.entries.get(domain)
+                    if entry is None or entry["due"] != due or entry["in_flight"]:
+                        heapq.heappop(self.heap)  # Removido ou reagendado
+                        continue
+                    if due > now:
+                        break
+                    heapq.heappop(self.heap)
+                    entry["in_flight"] = True
+                    self._pool.submit(self._refresh, domain)
+                timeout = self.heap[0][0] - now if self.heap else None
+                self._condition.wait(timeout)
+
+    def _refresh(self, domain):
+        try:
+            records = self.resolve(domain)
+            error = None
+        except Exception as e:
+            records, error = None, str(e)
+
+        with self._condition:
+            entry = self.entries.get(domain)
+            if entry is None:
+                return  # Deixou de ser seguido enquanto resolvia
+            entry["in_flight"] = False
+            if error is not None:
+                entry["failures"] += 1
+                entry["error"] = error
+                # Mantém as rotas atuais e tenta de novo mais tarde, cada vez mais espaçado
+                retry = min(self.min_interval * 2 ** (entry["failures"] - 1), self.max_interval)
+                self._schedule(domain, retry * (1 + self.rng.uniform(0, self.jitter)))
+                self.logger.warning(f"Could not re-resolve {domain}: {error}")
+                return
+            addresses = frozenset(r["address"] for r in records)
+            changed = addresses != entry["addresses"]
+            entry.update(addresses=addresses, ttl=min(r["ttl"] for r in records),
+                         last_resolved_at=time.time(), failures=0, error=None)
+            if changed:
+                entry["changes"] += 1
+            self._schedule(domain, self._interval(entry["ttl"]))
+
+        if changed:
+            self.logger.info(f"{domain} now resolves to {sorted(addresses)}.")
+            try:
+                self.on_change(domain, sorted(addresses))
+            except Exception as e:
+                self.logger.error(f"Failed to apply the new addresses of {domain}: {e}")
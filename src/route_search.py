@@ -0,0 +1,169 @@
+# route_search.py
+"""
+Search index over the saved routes, kept up to date by RouteIndex.
+
+Three lookups, none of them a scan of every route:
+
+  - domain prefix: bisect on the sorted list of domains;
+  - domain substring: trigram postings; a longer query intersects the
+    postings of its trigrams and checks the few candidates left with `in`,
+    a shorter one joins the postings of the (distinct, far fewer than the
+    domains) trigrams that contain it;
+  - IPv4/CIDR containment: addresses inside the query network come from a
+    bisect on the sorted network starts; saved networks that contain the
+    query come from one dict lookup per prefix length in use (at most 33).
+
+Typed address prefixes ("10.1.") also bisect on the sorted address strings.
+"""
+import bisect
+import collections
+import ipaddress
+import re
+
+from route_table import ipv4_span
+
+MODES = ("auto", "prefix", "substring", "network")
+NGRAM = 3
+_IPV4_QUERY = re.compile(r"\d{1,3}(\.\d{1,3}){3}(/\d{1,2})?")
+
+
+def parse_network(query):
+    """The IPv4Network a complete address or CIDR query stands for, or None."""
+    if not _IPV4_QUERY.fullmatch(query):
+        return None
+    try:
+        return ipaddress.IPv4Network(query, strict=False)
+    except ValueError:
+        return None
+
+
+def _grams(text):
+    if len(text) <= NGRAM:
+        return {text}
+    return {text[i:i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+class RouteSearch:
+    """Incremental index of domains and addresses. Queries are case-insensitive."""
+    def __init__(self):
+        self.domains = []        # ordenados (minúsculas) para a busca por prefixo
+        self.names = {}          # minúsculas -> domínio como foi salvo
+        self.postings = collections.defaultdict(set)  # trigrama -> {domínio em minúsculas}
+        self.address_texts = []  # endereços ordenados como texto
+        self.starts = []         # (primeiro endereço, último endereço, texto), ordenado
+        self.by_length = {}      # tamanho do prefixo -> {rede como int: texto}
+
+    @classmethod
+    def build(cls, domains, addresses):
+        """Index for a whole route set, sorting once instead of inserting one by one."""
+        search = cls()
+        for domain in domains:
+            key = domain.lower()
+            if key not in search.names:
+                search.names[key] = domain
+                for gram in _grams(key):
+                    search.postings[gram].add(key)
+        search.domains = sorted(search.names)
+        search.address_texts = sorted(set(addresses))
+        for address in search.address_texts:
+            span = ipv4_span(address)
+            if span is not None:
+                search.starts.append((span[0], span[1], address))
+                search.by_length.setdefault(span[2], {})[span[0]] = address
+        search.starts.sort()
+        return search
+
+    # --- Manutenção ---
+    def add_domain(self, domain):
+        key = domain.lower()
+        if key in self.names:
+            return
+        self.names[key] = domain
+        bisect.insort(self.domains, key)
+        for gram in _grams(key):
+            self.postings[gram].add(key)
+
+    def remove_domain(self, domain):
+        key = domain.lower()
+        if self.names.pop(key, None) is None:
+            return
+        del self.domains[bisect.bisect_left(self.domains, key)]
+        for gram in _grams(key):
+            owners = self.postings[gram]
+            owners.discard(key)
+            if not owners:
+                del self.postings[gram]
+
+    def add_address(self, address):
+        position = bisect.bisect_left(self.address_texts, address)
+        if position < len(self.address_texts) and self.address_texts[position] == address:
+            return
+        self.address_texts.insert(position, address)
+        span = ipv4_span(address)
+        if span is not None:
+            bisect.insort(self.starts, (span[0], span[1], address))
+            self.by_length.setdefault(span[2], {})[span[0]] = address
+
+    def remove_address(self, address):
+        position = bisect.bisect_left(self.address_texts, address)
+        if position == len(self.address_texts) or self.address_texts[position] != address:
+            return
+        del self.address_texts[position]
+        span = ipv4_span(address)
+        if span is not None:
+            del self.starts[bisect.bisect_left(self.starts, (span[0], span[1], address))]
+            networks = self.by_length[span[2]]
+            if networks.get(span[0]) == address:
+                del networks[span[0]]
+            if not networks:
+                del self.by_length[span[2]]
+
+    # --- Consultas ---
+    def domains_with_prefix(self, prefix):
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self.domains, prefix)
+        end = bisect.bisect_left(self.domains, prefix + "\uffff")
+        return [self.names[key] for key in self.domains[start:end]]
+
+    def domains_containing(self, text):
+        text = text.lower()
+        if not text:
+            return [self.names[key] for key in self.domains]
+        if len(text) < NGRAM:
+            candidates = set()
+            for gram, keys in self.postings.items():
+                if text in gram:
+                    candidates |= keys
+        else:
+            grams = sorted(_grams(text), key=lambda gram: len(self.postings.get(gram, ())))
+            candidates = set(self.postings.get(grams[0], ()))
+            for gram in grams[1:]:
+                if not candidates:
+                    break
+                candidates &= self.postings.get(gram, set())
+        candidates = {key for key in candidates if text in key}
+        return [self.names[key] for key in sorted(candidates)]
+
+    def addresses_with_prefix(self, prefix):
+        start = bisect.bisect_left(self.address_texts, prefix)
+        end = bisect.bisect_left(self.address_texts, prefix + "\uffff")
+        return self.address_texts[start:end]
+
+    def addresses_in(self, network):
+        """Saved addresses/networks inside `network` or containing it."""
+        first, last = int(network.network_address), int(network.broadcast_address)
+        found = []
+        # Contidas na consulta: começam dentro dela e terminam antes do fim
+        position = bisect.bisect_left(self.starts, (first,))
+        while position < len(self.starts) and self.starts[position][0] <= last:
+            start, end, address = self.starts[position]
+            if end <= last:
+                found.append(address)
+            position += 1
+        # Que contêm a consulta: no máximo uma rede por tamanho de prefixo
+        for length, networks in self.by_length.items():
+            if length < network.prefixlen:
+                masked = first & (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+                if masked in networks:
+                    found.append(networks[masked])
+        return found
@@ -0,0 +1,104 @@
+# route_table.py
+"""
+Longest-prefix-match table of the routes sent through the VPN.
+
+Answers "does this address go through the tunnel?" the way the kernel does:
+a binary trie of IPv4 prefixes, walked one bit per level, so a lookup costs
+at most 32 steps whatever the number of routes. `RouteTable` keeps two
+tries: the destinations actually installed (the route plan, aggregated or
+not) and the saved addresses, to tell which domains the match came from.
+"""
+
+
+def ipv4_span(address):
+    """(first, last, prefix length) as ints for an IPv4 address or CIDR, else None."""
+    # Sem ipaddress aqui: é chamado para cada rota ao montar os índices
+    text, _, length = address.partition("/")
+    octets = text.split(".")
+    if len(octets) != 4 or not all(o.isdigit() and int(o) < 256 for o in octets):
+        return None
+    if length and not (length.isdigit() and int(length) <= 32):
+        return None
+    length = int(length) if length else 32
+    value = (int(octets[0]) << 24) | (int(octets[1]) << 16) | (int(octets[2]) << 8) | int(octets[3])
+    mask = (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+    return value & mask, (value & mask) | (~mask & 0xFFFFFFFF), length
+
+
+class PrefixTrie:
+    """Binary trie of IPv4 prefixes, each with a value."""
+    def __init__(self):
+        self.root = [None, None, None]  # [filho bit 0, filho bit 1, (prefixo, valor)]
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def insert(self, prefix, value):
+        """Stores `value` for `prefix` (an address or CIDR). Raises ValueError if it isn't IPv4."""
+        span = ipv4_span(prefix)
+        if span is None:
+            raise ValueError(f"Not an IPv4 address or CIDR: {prefix}")
+        first, _, length = span
+        node = self.root
+        for depth in range(length):
+            bit = (first >> (31 - depth)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = (prefix, value)
+
+    def longest_match(self, address):
+        """
+        (prefix, value) of the most specific stored prefix that covers
+        `address` (an address or CIDR), or None.
+        """
+        span = ipv4_span(address)
+        if span is None:
+            raise ValueError(f"Not an IPv4 address or CIDR: {address}")
+        return self.match(span[0], span[2])
+
+    def match(self, first, length=32):
+        """longest_match() for an already parsed address (see ipv4_span)."""
+        node, best = self.root, self.root[2]
+        for depth in range(length):
+            node = node[(first >> (31 - depth)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+
+class RouteTable:
+    """`plan`: destinations installed in the kernel; `by_address`: saved address -> domains."""
+    def __init__(self, plan, by_address):
+        self.installed = PrefixTrie()
+        self.saved = PrefixTrie()
+        for destination in plan:
+            self.installed.insert(destination, None)
+        for address, domains in by_address.items():
+            if ipv4_span(address) is not None:
+                self.saved.insert(address, sorted(domains))
+
+    def lookup(self, address):
+        """
+        {"address", "routed", "prefix", "route", "domains"}: `prefix` is the
+        installed destination that carries `address` (None: it doesn't go
+        through the VPN), `route` the most specific saved address covering it
+        and `domains` the domains that saved it.
+        """
+        span = ipv4_span(address)
+        if span is None:
+            raise ValueError(f"Not an IPv4 address or CIDR: {address}")
+        installed = self.installed.match(span[0], span[2])
+        saved = self.saved.match(span[0], span[2])
+        return {
+            "address": address,
+            "routed": installed is not None,
+            "prefix": installed[0] if installed else None,
+            "route": saved[0] if saved else None,
+            "domains": saved[1] if saved else [],
+        }
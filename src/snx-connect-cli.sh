@@ -0,0 +1,5 @@
+#!/bin/sh
+# snx-connect-cli.sh
+
+# Interface de linha de comando (sem GTK): flatpak run --command=snx-connect-cli.sh ...
+exec python3 /app/src/snx-connect/cli.py "$@"
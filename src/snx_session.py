@@ -0,0 +1,245 @@
+# snx_session.py
+"""
+Asyncio driver for the interactive `snx` client.
+
+snx only talks to a terminal, so it runs on a pseudo-terminal (ptyprocess,
+the library under pexpect). Its output is read by an event loop reader as it
+arrives, so waiting for a prompt never blocks a thread, several sessions can
+share one loop (the GLib one in the app), and a connect can be cancelled at
+any point: cancelling the task kills the snx process.
+
+Every phase has its own timeout and the whole connect has a deadline:
+
+    session = SnxSession(on_output=print)
+    outcome = await session.connect(server, username, password)
+    # {"state": "connected" | "another_session", "office_ip": ...,
+    #  "dns_servers": [...], "dns_suffixes": [...], "output": ...}
+"""
+import asyncio
+import codecs
+import contextlib
+import logging
+import os
+import re
+import signal
+import time
+
+from ptyprocess import PtyProcess
+
+EOF = object()  # Padrão especial: fim da saída do processo
+
+PHASE_TIMEOUTS = {
+    "password_prompt": 15.0,
+    "authenticate": 30.0,
+    "accept_certificate": 20.0,
+    "session_info": 2.0,  # Linhas que o snx imprime depois do IP (DNS, sufixo); opcionais
+}
+DEFAULT_DEADLINE = sum(PHASE_TIMEOUTS.values())
+
+PASSWORD_PROMPT = re.compile(r"[Pp]assword:")
+ACCEPT_PROMPT = re.compile(r"accept\?")
+OFFICE_MODE_IP = re.compile(r"Office Mode IP\s*:\s*([0-9.]+)\s")  # \s: o IP inteiro já chegou
+DENIED = re.compile(r"denied")
+SESSION_INFO_END = re.compile(r"Timeout\s*:[^\n]*\n")  # Última linha do resumo da sessão
+DNS_SERVER = re.compile(r"^\s*(?:Secondary )?DNS Server\s*:\s*([0-9.]+)", re.MULTILINE)
+DNS_SUFFIX = re.compile(r"^\s*DNS Suffix\s*:\s*(\S[^\r\n]*)", re.MULTILINE)
+
+
+class SnxError(Exception):
+    """Raised when snx refuses or ends the connection."""
+    pass
+
+
+class SnxTimeoutError(SnxError):
+    """Raised when a phase or the whole connect runs out of time."""
+    def __init__(self, message, phase):
+        super().__init__(message)
+        self.phase = phase
+
+
+def parse_session_info(output):
+    """
+    {"dns_servers": [...], "dns_suffixes": [...]} from the session summary
+    snx prints once connected; empty lists when it didn't print them.
+    """
+    servers = []
+    for server in DNS_SERVER.findall(output):
+        if server not in servers and server != "0.0.0.0":
+            servers.append(server)
+    suffixes = []
+    for line in DNS_SUFFIX.findall(output):
+        for suffix in re.split(r"[,;\s]+", line.strip()):
+            suffix = suffix.strip(".")
+            if suffix and suffix not in suffixes:
+                suffixes.append(suffix)
+    return {"dns_servers": servers, "dns_suffixes": suffixes}
+
+
+class SnxSession:
+    """
+    One `snx -s SERVER -u USER` run. `on_output(text)` receives the output as
+    it arrives; `timeline` (see timing.py) gets one span per phase.
+    """
+    def __init__(self, command="snx", on_output=None, timeline=None,
+                 timeouts=None, deadline=DEFAULT_DEADLINE):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.command = command
+        self.on_output = on_output
+        self.timeline = timeline
+        self.timeouts = dict(PHASE_TIMEOUTS, **(timeouts or {}))
+        self.deadline = deadline
+        self.process = None
+        self.output = ""       # tudo o que o snx escreveu
+        self.buffer = ""       # ainda não consumido pelos expect
+        self.eof = False
+        self._loop = None
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._changed = None
+        self._deadline_at = None
+
+    # --- Fluxo de conexão ---
+    async def connect(self, server, username, password):
+        """
+        Runs the login dialogue. Returns {"state", "office_ip", "dns_servers",
+        "dns_suffixes", "output"} where state is "connected" or
+        "another_session"; raises SnxError otherwise.
+        """
+        self._deadline_at = time.monotonic() + self.deadline
+        failed = True
+        try:
+            with self._span("spawn"):
+                await self.start([self.command, "-s", server, "-u", username])
+
+            with self._span("password_prompt"):
+                index, _ = await self.expect([PASSWORD_PROMPT, EOF], "password_prompt")
+            if index == 1:
+                return self._ended_early("SNX process terminated unexpectedly before connection.")
+
+            with self._span("authenticate"):
+                self.send_line(password)
+                index, match = await self.expect([ACCEPT_PROMPT, OFFICE_MODE_IP, EOF], "authenticate")
+
+            if index == 0:
+                with self._span("accept_certificate"):
+                    self.send_line("y")
+                    index, match = await self.expect([OFFICE_MODE_IP, DENIED, EOF], "accept_certificate")
+                if index == 1:
+                    raise SnxError("Connection denied by SNX. Check your credentials or server settings.")
+                if index == 2:
+                    return self._ended_early("SNX process ended unexpectedly after accepting the certificate.")
+                self.logger.info("Accepted connection request.")
+            elif index == 2:
+                return self._ended_early("SNX process ended unexpectedly after password.")
+            else:
+                self.logger.info("Connected to SNX without needing to accept terms.")
+
+            office_ip = match.group(1)
+            failed = False
+            with self._span("session_info"):
+                try:
+                    await self.expect([SESSION_INFO_END, EOF], "session_info")
+                except SnxTimeoutError:
+                    # Já conectado; sem o resumo, só não há DNS do túnel
+                    self.logger.debug("SNX did not print the session summary in time.")
+            return dict(parse_session_info(self.output), state="connected",
+                        office_ip=office_ip, output=self.output)
+        finally:
+            with self._span("close"):
+                # Erro, timeout ou cancelamento: o snx não serve mais, mata na hora
+                await self.close(grace=0 if failed else 1.0)
+
+    def _ended_early(self, message):
+        if "Another session" in self.output:
+            return {"state": "another_session", "office_ip": None, "dns_servers": [],
+                    "dns_suffixes": [], "output": self.output}
+        if "Office" in self.output:
+            raise SnxError("Office Mode IP not found in SNX output.")
+        raise SnxError(message)
+
+    # --- Processo e expect ---
+    async def start(self, argv):
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+        self.process = PtyProcess.spawn(argv, dimensions=(24, 200))
+        os.set_blocking(self.process.fd, False)
+        self._loop.add_reader(self.process.fd, self._on_readable)
+
+    def _on_readable(self):
+        try:
+            data = os.read(self.process.fd, 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""  # EIO: o outro lado do pty fechou
+        if not data:
+            self.eof = True
+            self._loop.remove_reader(self.process.fd)
+            text = self._decoder.decode(b"", final=True)
+        else:
+            text = self._decoder.decode(data)
+        if text:
+            self.output += text
+            self.buffer += text
+            if self.on_output:
+                self.on_output(text)
+        self._changed.set()
+
+    async def expect(self, patterns, phase):
+        """
+        Waits until one of `patterns` (compiled regexes or EOF) shows up in the
+        output. Returns (index, match) and consumes the output up to the match.
+        """
+        timeout = min(self.timeouts[phase], self._deadline_at - time.monotonic())
+        try:
+            return await asyncio.wait_for(self._expect(patterns), max(timeout, 0))
+        except asyncio.TimeoutError:
+            raise SnxTimeoutError("Connection timed out waiting for a response from SNX.", phase)
+
+    async def _expect(self, patterns):
+        while True:
+            best = None
+            for index, pattern in enumerate(patterns):
+                if pattern is EOF:
+                    continue
+                match = pattern.search(self.buffer)
+                if match and (best is None or match.start() < best[1].start()):
+                    best = (index, match)
+            if best is not None:
+                self.buffer = self.buffer[best[1].end():]
+                return best
+            if self.eof:
+                if EOF in patterns:
+                    return patterns.index(EOF), None
+                raise SnxError("SNX process terminated unexpectedly before connection.")
+            self._changed.clear()
+            await self._changed.wait()
+
+    def send_line(self, text):
+        os.write(self.process.fd, (text + "\n").encode("utf-8"))
+
+    async def close(self, grace=1.0):
+        """Stops reading and makes sure the snx foreground process is gone."""
+        if self.process is None:
+            return
+        process, self.process = self.process, None
+        if not self.eof:
+            self._loop.remove_reader(process.fd)
+        # Espera o snx sair sozinho (ele já imprimiu tudo); só mata se passar do prazo.
+        waited = 0.0
+        while process.isalive() and waited < grace:
+            await asyncio.sleep(0.01)
+            waited += 0.01
+        if process.isalive():
+            with contextlib.suppress(OSError):
+                process.kill(signal.SIGKILL)
+            with contextlib.suppress(Exception):
+                process.wait()
+        # O processo já saiu: sem a espera de 100 ms do close() (chamado também pelo __del__)
+        process.delayafterclose = 0
+        with contextlib.suppress(OSError):
+            process.close()
+
+    def _span(self, name):
+        if self.timeline is None:
+            return contextlib.nullcontext()
+        return self.timeline.span(name)
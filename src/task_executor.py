@@ -0,0 +1,241 @@
+# task_executor.py
+"""
+Bounded background execution for the Controller.
+
+Tasks run on a fixed pool of worker threads. Each task names the resources it
+touches (e.g. "session", "routes"); two tasks sharing a resource never run at
+the same time and start in submission order, while unrelated tasks run in
+parallel. A task submitted with a `key` that matches one already queued or
+running is not run twice: its callbacks are attached to the existing task
+(single-flight), so a double-clicked button only connects once.
+
+Coroutine functions go through `submit_async()`: they run on an asyncio loop
+(the GLib one when the app provides it, otherwise a loop thread owned by the
+executor) and hold their resources until they finish, without taking a worker
+thread while they wait. Cancelling one cancels its asyncio task.
+"""
+import collections
+import logging
+import threading
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+CANCELLED = "cancelled"
+
+
+class Task:
+    """Handle for a submitted task. `cancel()` drops it if it hasn't started yet."""
+    def __init__(self, executor, fn, args, key, resources):
+        self.executor = executor
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.resources = frozenset(resources)
+        self.callbacks = []        # [(on_success, on_error)]
+        self.state = PENDING
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.cancel_requested = False
+        self.is_async = False
+        self.future = None         # concurrent.futures.Future das tarefas assíncronas
+        self.error = None          # exceção da tarefa, quando falhou
+        self.finished = threading.Event()
+
+    def cancel(self):
+        """
+        Cancels the task. A queued task is removed and never runs; a running
+        coroutine is cancelled, and a running function finishes. Either way its
+        callbacks are not called. Returns False if already done.
+        """
+        return self.executor.cancel(self)
+
+    def wait(self, timeout=None):
+        """Waits until the task finished or was dropped. Returns False on timeout."""
+        return self.finished.wait(timeout)
+
+
+class TaskExecutor:
+    """Fixed-size worker pool with per-resource serialization and single-flight."""
+    def __init__(self, max_workers=4, error_types=(Exception,), loop=None):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.max_workers = max_workers
+        self.error_types = error_types  # Erros repassados ao on_error; os outros só vão para o log
+        self.loop = loop                # Loop asyncio das tarefas assíncronas (criado sob demanda)
+        self.pending = collections.deque()
+        self.busy = set()               # recursos em uso por tarefas em execução
+        self.inflight = {}              # key -> Task (na fila ou rodando)
+        self.workers = []
+        self.idle_workers = 0
+        self.condition = threading.Condition()
+        self.stats = collections.Counter()
+        self.max_depth = 0
+        self.total_wait = 0.0
+
+    # --- API ---
+    def submit(self, fn, *args, key=None, resources=(), on_success=None, on_error=None):
+        return self._submit(fn, args, False, key, resources, on_success, on_error)
+
+    def submit_async(self, coroutine_fn, *args, key=None, resources=(), on_success=None, on_error=None):
+        """Like submit(), for a coroutine function run on the executor's event loop."""
+        return self._submit(coroutine_fn, args, True, key, resources, on_success, on_error)
+
+    def _submit(self, fn, args, is_async, key, resources, on_success, on_error):
+        with self.condition:
+            if key is not None and key in self.inflight:
+                task = self.inflight[key]
+                task.callbacks.append((on_success, on_error))
+                self.stats["deduplicated"] += 1
+                self.logger.info(f"Joined in-flight task {key}.")
+                return task
+            task = Task(self, fn, args, key, resources)
+            task.is_async = is_async
+            task.callbacks.append((on_success, on_error))
+            if key is not None:
+                self.inflight[key] = task
+            self.pending.append(task)
+            self.stats["submitted"] += 1
+            self.max_depth = max(self.max_depth, len(self.pending))
+            if len(self.pending) > self.idle_workers and len(self.workers) < self.max_workers:
+                self._spawn_worker()
+            self.condition.notify_all()
+            return task
+
+    def cancel(self, task):
+        with self.condition:
+            if task.state in (DONE, CANCELLED):
+                return False
+            task.cancel_requested = True
+            if task.state == PENDING:
+                self.pending.remove(task)
+                task.state = CANCELLED
+                self._forget(task)
+                task.finished.set()
+                self.condition.notify_all()
+            elif task.future is not None:
+                task.future.cancel()  # Vira CancelledError dentro da corrotina
+            self.stats["cancelled"] += 1
+            return True
+
+    def metrics(self):
+        """Queue depth and counters: queued, running, workers, max_depth, avg_wait_ms, ..."""
+        with self.condition:
+            waited = self.stats["started"]
+            return {
+                "queued": len(self.pending),
+                "running": self.stats["started"] - self.stats["finished"],
+                "workers": len(self.workers),
+                "max_depth": self.max_depth,
+                "avg_wait_ms": (self.total_wait / waited * 1000) if waited else 0.0,
+                "busy_resources": sorted(map(str, self.busy)),
+                **{name: self.stats[name] for name in
+                   ("submitted", "started", "finished", "failed", "deduplicated", "cancelled")},
+            }
+
+    # --- Internals ---
+    def _spawn_worker(self):
+        worker = threading.Thread(
+            target=self._worker_loop, name=f"TaskWorker-{len(self.workers) + 1}", daemon=True
+        )
+        self.workers.append(worker)
+        worker.start()
+
+    def _next_runnable(self):
+        """First queued task whose resources are free and not claimed by an earlier queued task."""
+        claimed = set()
+        for task in self.pending:
+            if not (task.resources & self.busy) and not (task.resources & claimed):
+                return task
+            claimed |= task.resources  # Mantém a ordem de chegada por recurso
+        return None
+
+    def _worker_loop(self):
+        while True:
+            with self.condition:
+                self.idle_workers += 1
+                task = self._next_runnable()
+                while task is None:
+                    self.condition.wait()
+                    task = self._next_runnable()
+                self.idle_workers -= 1
+                self.pending.remove(task)
+                self.busy |= task.resources
+                task.state = RUNNING
+                task.started_at = time.monotonic()
+                self.total_wait += task.started_at - task.submitted_at
+                self.stats["started"] += 1
+            if task.is_async:
+                self._start_async(task)
+            else:
+                self._run(task)
+
+    def _run(self, task):
+        result, error, crashed = None, None, False
+        try:
+            result = task.fn(*task.args)
+        except self.error_types as e:
+            error = e
+        except Exception as e:
+            crashed = True
+            task.error = e
+            self.logger.exception(f"Unexpected error in background task: {e}")
+        finally:
+            self._finish(task, result, error, crashed)
+
+    def _start_async(self, task):
+        import asyncio # Só quando há tarefas assíncronas
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+            threading.Thread(target=self.loop.run_forever, name="TaskLoop", daemon=True).start()
+        with self.condition:
+            task.future = asyncio.run_coroutine_threadsafe(task.fn(*task.args), self.loop)
+            if task.cancel_requested:
+                task.future.cancel()
+        task.future.add_done_callback(lambda future: self._on_async_done(task, future))
+
+    def _on_async_done(self, task, future):
+        result, error, crashed = None, None, False
+        if future.cancelled():
+            task.cancel_requested = True
+        elif future.exception() is not None:
+            error = task.error = future.exception()
+            if not isinstance(error, self.error_types):
+                crashed = True
+                self.logger.error(f"Unexpected error in background task: {error}", exc_info=error)
+        else:
+            result = future.result()
+        self._finish(task, result, error, crashed)
+
+    def _finish(self, task, result, error, crashed):
+        with self.condition:
+            self.busy -= task.resources
+            task.state = DONE
+            if error is not None:
+                task.error = error
+            self._forget(task)
+            task.finished.set()
+            self.stats["finished"] += 1
+            if error is not None or crashed:
+                self.stats["failed"] += 1
+            callbacks = list(task.callbacks)
+            self.condition.notify_all()
+
+        if task.cancel_requested or crashed:
+            return
+        if error is not None:
+            self.logger.error(f"An error occurred in the worker thread: {error}")
+        for on_success, on_error in callbacks:
+            try:
+                if error is not None:
+                    if on_error:
+                        on_error(str(error))
+                elif on_success:
+                    # Desempacota o dicionário de resultado para os callbacks
+                    on_success(**result)
+            except Exception as e:
+                self.logger.exception(f"Task callback failed: {e}")
+
+    def _forget(self, task):
+        if task.key is not None and self.inflight.get(task.key) is task:
+            del self.inflight[task.key]
@@ -0,0 +1,137 @@
+# timing.py
+"""
+Lightweight timing spans for the slow, blocking operations (connect, routes).
+
+A trace groups the spans recorded while it is open in the same context (the
+same thread, or the same asyncio task and the threads it hands work to with
+asyncio.to_thread):
+
+    with timeline.trace("connect", server=server):
+        with timeline.span("password_prompt"):
+            ...
+
+Finished traces are kept in a bounded history and logged as structured
+records (the record is attached to the log entry as `extra={"trace": ...}`).
+"""
+import collections
+import contextlib
+import contextvars
+import functools
+import logging
+import threading
+import time
+
+
+class Timeline:
+    """Bounded history of traces, each one a list of named spans."""
+    def __init__(self, history=50, clock=time.perf_counter):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.clock = clock
+        self.traces = collections.deque(maxlen=history)
+        self._current = contextvars.ContextVar(f"trace-{id(self)}", default=None)  # (record, start)
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def trace(self, name, **attrs):
+        """Opens a trace. Spans opened inside it (same context) are attached to it."""
+        if self._current.get() is not None:
+            # Trace dentro de trace (ex.: connect chamado pela reconexão): vira um span.
+            with self.span(name, **attrs) as record:
+                yield record
+            return
+        record = {
+            "name": name,
+            "started_at": time.time(),
+            "duration": None,
+            "ok": True,
+            "error": None,
+            "attrs": attrs,
+            "spans": [],
+        }
+        start = self.clock()
+        token = self._current.set((record, start))
+        try:
+            yield record
+        except BaseException as e:
+            record["ok"] = False
+            record["error"] = str(e)
+            raise
+        finally:
+            record["duration"] = self.clock() - start
+            self._current.reset(token)
+            with self._lock:
+                self.traces.append(record)
+            self.logger.info(
+                f"{name} took {record['duration'] * 1000:.1f} ms "
+                + ", ".join(f"{s['name']}={s['duration'] * 1000:.1f}" for s in record["spans"]),
+                extra={"trace": record},
+            )
+
+    @contextlib.contextmanager
+    def span(self, name, **attrs):
+        """Times one phase. Outside of a trace it is recorded as a trace of its own."""
+        current = self._current.get()
+        if current is None:
+            with self.trace(name, **attrs) as record:
+                yield record
+            return
+        parent, trace_start = current
+        start = self.clock()
+        # offset: segundos desde o início do trace
+        record = {"name": name, "offset": start - trace_start, "duration": None, "ok": True, "attrs": attrs}
+        parent["spans"].append(record)  # Em ordem de início, spans aninhados vêm depois do pai
+        try:
+            yield record
+        except BaseException:
+            record["ok"] = False
+            raise
+        finally:
+            record["duration"] = self.clock() - start
+
+    def history(self, name=None, limit=None):
+        """Returns copies of the finished traces, newest last, optionally filtered by name."""
+        with self._lock:
+            traces = [t for t in self.traces if name is None or t["name"] == name]
+        if limit:
+            traces = traces[-limit:]
+        return [dict(t, attrs=dict(t["attrs"]), spans=[dict(s) for s in t["spans"]]) for t in traces]
+
+    def summary(self, name, group_by=None):
+        """
+        Per-phase statistics for the traces called `name`:
+            {group: {phase: {"count", "mean", "median", "max"}}}
+        `group_by` is a trace attribute (e.g. "server"); without it there is one group, None.
+        """
+        import statistics # Só usado aqui; fica fora da inicialização
+        groups = {}
+        for trace in self.history(name):
+            if not trace["ok"]:
+                continue
+            key = trace["attrs"].get(group_by) if group_by else None
+            phases = groups.setdefault(key, {})
+            phases.setdefault("total", []).append(trace["duration"])
+            for span in trace["spans"]:
+                phases.setdefault(span["name"], []).append(span["duration"])
+        return {
+            key: {
+                phase: {
+                    "count": len(values),
+                    "mean": statistics.fmean(values),
+                    "median": statistics.median(values),
+                    "max": max(values),
+                }
+                for phase, values in phases.items()
+            }
+            for key, phases in groups.items()
+        }
+
+
+def timed(name):
+    """Method decorator: records the call as a span on `self.timeline`."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with self.timeline.span(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,330 @@
+# tunnel_monitor.py
+"""
+Watches the SNX tunnel interface (tunsnx) without forking.
+
+The watcher subscribes to rtnetlink link and IPv4 address notifications and
+re-checks the tunnel as soon as anything happens to it, so a drop is seen in
+milliseconds. The tunnel counts as connected while the interface exists, is
+administratively up and still has an IPv4 address. A slow periodic check stays
+as a fallback, and becomes the only mechanism if netlink is not available.
+
+`TunnelMonitor` runs the watcher on a thread of the app process and publishes
+the transitions to whoever subscribed (model, controller, notifications).
+"""
+import logging
+import os
+import select
+import socket
+import struct
+import threading
+import time
+
+TUNNEL_INTERFACE = "tunsnx"
+
+NETLINK_ROUTE = 0
+RTMGRP_LINK = 0x1
+RTMGRP_IPV4_IFADDR = 0x10
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x01
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_DELADDR = 21
+RTM_GETADDR = 22
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+
+IFF_UP = 0x1
+
+_NLMSGHDR = struct.Struct("=IHHII")
+_IFINFOMSG = struct.Struct("=BxHiII")  # family, type, index, flags, change
+_IFADDRMSG = struct.Struct("=BBBBI")   # family, prefixlen, flags, scope, index
+_RTATTR = struct.Struct("=HH")         # len, type
+_RCVBUF = 256 * 1024
+
+
+def _messages(data):
+    offset = 0
+    while offset + _NLMSGHDR.size <= len(data):
+        length, msg_type, _, seq, _ = _NLMSGHDR.unpack_from(data, offset)
+        if length < _NLMSGHDR.size:
+            return
+        yield msg_type, seq, data[offset + _NLMSGHDR.size:offset + length]
+        offset += (length + 3) & ~3
+
+
+def _attributes(payload, offset):
+    attrs = {}
+    while offset + _RTATTR.size <= len(payload):
+        length, attr_type = _RTATTR.unpack_from(payload, offset)
+        if length < _RTATTR.size:
+            break
+        attrs[attr_type] = payload[offset + _RTATTR.size:offset + length]
+        offset += (length + 3) & ~3
+    return attrs
+
+
+class TunnelWatcher:
+    """
+    Reports tunnel state changes to a callback: `on_change(connected)`.
+    `poll_interval` is the fallback re-check period, in seconds.
+    """
+    def __init__(self, ifname=TUNNEL_INTERFACE, poll_interval=5.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.ifname = ifname
+        self.poll_interval = poll_interval
+        self.last_change_at = None  # time.monotonic() da última transição detectada
+        self._wake_r, self._wake_w = os.pipe()
+        self._wake_lock = threading.Lock()
+        self._stopped = False
+        self._seq = 0
+
+    # --- Estado da interface ---
+    def _ifindex(self):
+        try:
+            return socket.if_nametoindex(self.ifname)
+        except OSError:
+            return None
+
+    def _query(self, msg_type, flags, body):
+        """Sends one request over a short-lived netlink socket and yields the replies."""
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE) as sock:
+            sock.settimeout(1.0)
+            sock.bind((0, 0))
+            self._seq += 1
+            sock.send(_NLMSGHDR.pack(_NLMSGHDR.size + len(body), msg_type,
+                                     NLM_F_REQUEST | flags, self._seq, 0) + body)
+            while True:
+                for reply_type, seq, payload in _messages(sock.recv(_RCVBUF)):
+                    if reply_type in (NLMSG_DONE, NLMSG_ERROR):
+                        return
+                    yield reply_type, payload
+                    if not flags & NLM_F_DUMP:
+                        return
+
+    def _link_up(self, ifindex):
+        body = _IFINFOMSG.pack(socket.AF_UNSPEC, 0, ifindex, 0, 0)
+        for msg_type, payload in self._query(RTM_GETLINK, 0, body):
+            if msg_type == RTM_NEWLINK and len(payload) >= _IFINFOMSG.size:
+                return bool(_IFINFOMSG.unpack_from(payload)[3] & IFF_UP)
+        return False
+
+    def _has_ipv4_address(self, ifindex):
+        body = _IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        return any(
+            msg_type == RTM_NEWADDR and len(payload) >= _IFADDRMSG.size
+            and _IFADDRMSG.unpack_from(payload)[4] == ifindex
+            for msg_type, payload in self._query(RTM_GETADDR, NLM_F_DUMP, body)
+        )
+
+    def ipv4_addresses(self):
+        """IPv4 addresses of the interface; empty if it is missing or down."""
+        ifindex = self._ifindex()
+        if ifindex is None or not self._link_up(ifindex):
+            return []
+        addresses = []
+        body = _IFADDRMSG.pack(socket.AF_INET, 0, 0, 0, 0)
+        for msg_type, payload in self._query(RTM_GETADDR, NLM_F_DUMP, body):
+            if msg_type != RTM_NEWADDR or len(payload) < _IFADDRMSG.size:
+                continue
+            if _IFADDRMSG.unpack_from(payload)[4] != ifindex:
+                continue
+            attrs = _attributes(payload, _IFADDRMSG.size)
+            # Em ponto a ponto (tun) o endereço local é IFA_LOCAL
+            address = attrs.get(IFA_LOCAL) or attrs.get(IFA_ADDRESS)
+            if address and len(address) == 4:
+                addresses.append(socket.inet_ntoa(address))
+        return addresses
+
+    def is_connected(self):
+        ifindex = self._ifindex()
+        if ifindex is None:
+            return False
+        try:
+            return self._link_up(ifindex) and self._has_ipv4_address(ifindex)
+        except OSError:
+            # Sem netlink: a existência da interface é o melhor que temos.
+            return True
+
+    # --- Laço de eventos ---
+    def _open_events_socket(self):
+        try:
+            sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RCVBUF)
+            sock.bind((0, RTMGRP_LINK | RTMGRP_IPV4_IFADDR))
+            sock.setblocking(False)
+            return sock
+        except OSError as e:
+            self.logger.warning(f"Netlink notifications unavailable, falling back to polling: {e}")
+            return None
+
+    def _is_relevant(self, data, ifindex):
+        """True if any message in `data` concerns our interface."""
+        for msg_type, _, payload in _messages(data):
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK) and len(payload) >= _IFINFOMSG.size:
+                index = _IFINFOMSG.unpack_from(payload)[2]
+            elif msg_type in (RTM_NEWADDR, RTM_DELADDR) and len(payload) >= _IFADDRMSG.size:
+                index = _IFADDRMSG.unpack_from(payload)[4]
+            else:
+                continue
+            if ifindex is None or index == ifindex:
+                return True
+        return False
+
+    def watch(self, on_change, initial=None):
+        """
+        Blocks until `stop()` is called, calling `on_change(connected)` on every
+        transition. `initial` is the state assumed at start (checked if None).
+        """
+        sock = self._open_events_socket()
+        connected = self.is_connected() if initial is None else initial
+        ifindex = self._ifindex()
+        try:
+            while not self._stopped:
+                readers = [self._wake_r] + ([sock] if sock else [])
+                ready, _, _ = select.select(readers, [], [], self.poll_interval)
+                if self._wake_r in ready:
+                    break
+                if sock in ready:
+                    try:
+                        data = sock.recv(_RCVBUF)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = None # ENOBUFS: eventos perdidos, verifica de novo
+                    if data is not None and not self._is_relevant(data, ifindex):
+                        continue
+
+                current = self.is_connected()
+                # A interface pode ter sido recriada com outro índice (reconexão).
+                ifindex = self._ifindex()
+                if current != connected:
+                    connected = current
+                    self.last_change_at = time.monotonic()
+                    self.logger.info(f"Tunnel {self.ifname} {'up' if connected else 'down'}.")
+                    on_change(connected)
+        finally:
+            if sock:
+                sock.close()
+
+    def wait_for_disconnect(self):
+        """
+        Blocks until the tunnel goes down (or `stop()` is called). If the
+        tunnel is not up yet, waits for it to come up first.
+        Returns True if a drop was detected.
+        """
+        armed = self.is_connected()
+        dropped = False
+
+        def on_change(connected):
+            nonlocal armed, dropped
+            if connected:
+                armed = True
+            elif armed:
+                dropped = True
+                self.stop()
+
+        self.watch(on_change, initial=armed)
+        return dropped
+
+    def stop(self):
+        with self._wake_lock:
+            self._stopped = True
+            if self._wake_w is not None:
+                os.write(self._wake_w, b"x")
+
+    def close(self):
+        """Releases the wake-up pipe. Call once `watch()` has returned."""
+        with self._wake_lock:
+            if self._wake_w is not None:
+                os.close(self._wake_r)
+                os.close(self._wake_w)
+                self._wake_r = self._wake_w = None
+
+
+class TunnelMonitor:
+    """
+    Runs a TunnelWatcher on a daemon thread inside the app process and
+    publishes every transition to the registered listeners, as
+    `listener(connected)`. Listeners are called from the monitor thread.
+    """
+    def __init__(self, ifname=TUNNEL_INTERFACE, watcher_factory=TunnelWatcher):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.ifname = ifname
+        self.watcher_factory = watcher_factory
+        self.listeners = []
+        self._watcher = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener):
+        with self._lock:
+            if listener not in self.listeners:
+                self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def addresses(self):
+        """Current IPv4 addresses of the tunnel ([] if it is not up)."""
+        watcher = self.watcher_factory(self.ifname)
+        try:
+            return watcher.ipv4_addresses()
+        finally:
+            watcher.close()
+
+    def start(self):
+        """Starts watching the tunnel. Does nothing if already running."""
+        with self._lock:
+            if self.is_running():
+                self.logger.info("Tunnel monitor is already running.")
+                return
+            self._watcher = self.watcher_factory(self.ifname)
+            self._thread = threading.Thread(
+                target=self._run, args=(self._watcher,), name="TunnelMonitor", daemon=True
+            )
+            self._thread.start()
+        self.logger.info(f"Tunnel monitor started for {self.ifname}.")
+
+    def stop(self):
+        """Stops watching. Listeners are not called for a requested stop."""
+        with self._lock:
+            watcher, thread = self._watcher, self._thread
+            self._watcher = self._thread = None
+        if watcher is None:
+            self.logger.info("No active tunnel monitor to stop.")
+            return
+        watcher.stop()
+        if thread is not threading.current_thread():
+            thread.join(timeout=2.0)
+        self.logger.info("Tunnel monitor stopped.")
+
+    def _run(self, watcher):
+        try:
+            watcher.watch(lambda connected: self._publish(watcher, connected), initial=True)
+        except Exception as e:
+            self.logger.error(f"Tunnel monitor failed: {e}")
+        finally:
+            watcher.close()
+
+    def _publish(self, watcher, connected):
+        with self._lock:
+            if watcher is not self._watcher:
+                return  # Já foi parado: não notifica
+            listeners = list(self.listeners)
+        for listener in listeners:
+            try:
+                listener(connected)
+            except Exception as e:
+                self.logger.error(f"Tunnel state listener failed: {e}")
@@ -2,9 +2,12 @@
 import gi  # type: ignore
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw, Gdk,GLib
+from gi.repository import Gtk, Adw, Gdk, Gio
 from .window import MainWindow # Importa MainWindow, que não depende mais deste arquivo
+from .dispatcher import UiDispatcher
+import logging
 import os
+import time
 
 import gettext
 _ = gettext.gettext
@@ -13,7 +16,12 @@ class Application(Adw.Application):
     def __init__(self, controller, **kwargs):
         super().__init__(**kwargs, application_id="com.exemplo.SNXConnect")
         self.controller = controller
+        self.win = None
+        self.dispatcher = UiDispatcher.default()
         self.connect("activate", self.on_activate)
+        # O monitor do túnel roda dentro do processo e avisa a aplicação direto.
+        self.controller.subscribe_tunnel_state(self.on_tunnel_state_changed)
+        self.controller.subscribe_reconnect_events(self.on_reconnect_event)
 
     def do_startup(self):
         Adw.Application.do_startup(self)
@@ -34,8 +42,31 @@ class Application(Adw.Application):
 
     def on_activate(self, app):
         self.win = MainWindow(application=app, controller=self.controller)
+        # Atualizações vindas das threads são aplicadas no ritmo dos quadros da janela
+        self.dispatcher.attach(self.win)
+        # tools/startup_benchmark.py: mede o tempo até o primeiro frame e fecha.
+        probe = os.environ.get("SNX_CONNECT_STARTUP_PROBE")
+        if probe:
+            self.win.connect("map", self._on_first_map, float(probe))
         self.win.present()
         self._check_dependencies()
+        # Sessão que ficou ativa (app fechado ou travado): alinha as rotas do kernel.
+        self.controller.request_reconcile_routes(
+            on_success=lambda **result: None,
+            on_error=lambda error: logging.getLogger(self.__class__.__name__).warning(
+                f"Route reconcile failed: {error}"
+            )
+        )
+
+    def _on_first_map(self, win, started_at):
+        clock = win.get_frame_clock()
+
+        def after_paint(clock):
+            print(f"first_frame_ms={(time.time() - started_at) * 1000:.1f}", flush=True)
+            clock.disconnect(handler_id)
+            self.quit()
+
+        handler_id = clock.connect("after-paint", after_paint)
 
     def _check_dependencies(self):
         """
@@ -72,14 +103,50 @@ class Application(Adw.Application):
             dialog.connect("response", on_dialog_response)
             dialog.present()
     
-    # Callbacks que são chamados pela thread do Controller
+    def get_ui_stats(self):
+        """Queue depth and frame cost of the UI dispatcher (see ui/dispatcher.py)."""
+        return self.dispatcher.stats()
+
+    # Callbacks que são chamados pela thread do Controller.
+    # Estado do túnel e da reconexão: se chegarem vários no mesmo quadro, vale o último.
+    def on_tunnel_state_changed(self, connected):
+        self.dispatcher.post(self._handle_tunnel_state, connected, key="tunnel_state")
+
+    def on_reconnect_event(self, event):
+        self.dispatcher.post(self._handle_reconnect_event, event, key="reconnect")
+
     def on_install_success(self, status, message):
-        GLib.idle_add(self._show_install_success_dialog, message)
+        self.dispatcher.post(self._show_install_success_dialog, message)
 
     def on_install_error(self, error_message):
-        GLib.idle_add(self._show_install_error_dialog, error_message)
+        self.dispatcher.post(self._show_install_error_dialog, error_message)
 
     # Funções auxiliares que fazem o trabalho real na UI
+    def _handle_tunnel_state(self, connected):
+        if connected:
+            self.withdraw_notification("vpn-disconnected")
+        elif self.controller.get_auto_reconnect_status():
+            self._notify(_("SNX VPN Disconnected"), _("The VPN connection was lost. Reconnecting..."))
+        else:
+            self._notify(_("SNX VPN Disconnected"), _("The VPN connection was lost."))
+        if self.win:
+            self.win.on_tunnel_state_changed(connected)
+
+    def _handle_reconnect_event(self, event):
+        if event["state"] == "recovered":
+            self.withdraw_notification("vpn-disconnected")
+        elif event["state"] == "failed":
+            self._notify(_("SNX VPN Disconnected"), _("Could not reconnect to the VPN."))
+        if self.win:
+            self.win.on_reconnect_event(event)
+
+    def _notify(self, title, body):
+        notification = Gio.Notification.new(title)
+        notification.set_body(body)
+        notification.set_icon(Gio.ThemedIcon.new("network-vpn-acquiring-symbolic"))
+        notification.set_priority(Gio.NotificationPriority.URGENT)
+        self.send_notification("vpn-disconnected", notification)
+
     def _show_install_success_dialog(self, message):
         dialog = Adw.MessageDialog(
             transient_for=self.win,
@@ -90,7 +157,6 @@ class Application(Adw.Application):
         # Conecta a resposta do diálogo para fechar a aplicação
         dialog.connect("response", lambda d, r: d.close())
         dialog.present()
-        return False
 
     def _show_install_error_dialog(self, error_message):
         dialog = Adw.MessageDialog(
@@ -101,4 +167,3 @@ class Application(Adw.Application):
         dialog.add_response("ok", _("OK"))
         dialog.connect("response", lambda d, r: d.close())
         dialog.present()
-        return False
\ No newline at end of file
@@ -0,0 +1,143 @@
+# ui/dispatcher.py
+"""
+Main-thread dispatcher for the callbacks that arrive from worker threads.
+
+Instead of one GLib.idle_add per event, workers `post()` to a queue and the
+queue is drained once per frame (a tick callback on the window, or a short
+timeout while the window is hidden), within a time budget; what doesn't fit
+waits for the next frame. Events posted with the same `key` are coalesced:
+only the latest one is applied (e.g. import progress, the state of a route).
+"""
+import collections
+import itertools
+import logging
+import threading
+import time
+
+from gi.repository import GLib
+
+FRAME_INTERVAL_MS = 16
+
+
+class UiDispatcher:
+    """Queues UI updates from any thread and applies them on the GTK main thread."""
+    _default = None
+
+    @classmethod
+    def default(cls):
+        """Dispatcher shared by the whole application."""
+        if cls._default is None:
+            cls._default = cls()
+        return cls._default
+
+    def __init__(self, budget_ms=4.0):
+        self.logger = logging.getLogger(self.__class__.__name__)
+        self.budget = budget_ms / 1000
+        self.widget = None
+        self._tick_id = None   # tick callback armado (só na main thread)
+        self.queue = collections.OrderedDict()  # chave -> (fn, args)
+        self.lock = threading.Lock()
+        self.scheduled = False
+        self._ids = itertools.count()
+        self.counters = collections.Counter()
+        self.max_depth = 0
+        self.frame_total = 0.0
+        self.frame_max = 0.0
+        self.last_frame = 0.0
+
+    def attach(self, widget):
+        """Drains on the frame clock of `widget` (usually the main window) while it is mapped."""
+        self.widget = widget
+        widget.connect("unmap", self._on_unmap)
+
+    def post(self, fn, *args, key=None):
+        """
+        Runs `fn(*args)` on the main thread at the next frame. A pending event
+        with the same `key` is replaced by this one. Safe from any thread.
+        """
+        with self.lock:
+            if key is None:
+                key = ("event", next(self._ids))
+            elif key in self.queue:
+                self.counters["coalesced"] += 1
+                del self.queue[key]  # O mais recente vai para o fim da fila
+            self.queue[key] = (fn, args)
+            self.counters["posted"] += 1
+            self.max_depth = max(self.max_depth, len(self.queue))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        # Uma única fonte no main loop por rajada de eventos
+        GLib.idle_add(self._arm)
+
+    def stats(self):
+        """Queue depth, counters and per-frame cost (in milliseconds)."""
+        with self.lock:
+            frames = self.counters["frames"]
+            return {
+                "queued": len(self.queue),
+                "max_depth": self.max_depth,
+                "posted": self.counters["posted"],
+                "coalesced": self.counters["coalesced"],
+                "applied": self.counters["applied"],
+                "frames": frames,
+                "long_frames": self.counters["long_frames"],  # Mais que um quadro inteiro
+                "last_frame_ms": self.last_frame * 1000,
+                "avg_frame_ms": (self.frame_total / frames * 1000) if frames else 0.0,
+                "max_frame_ms": self.frame_max * 1000,
+            }
+
+    # --- Internals (main thread) ---
+    def _arm(self):
+        if self.widget is not None and self.widget.get_mapped():
+            self._tick_id = self.widget.add_tick_callback(self._on_tick)
+        else:
+            GLib.timeout_add(FRAME_INTERVAL_MS, self._drain)
+        return GLib.SOURCE_REMOVE
+
+    def _on_tick(self, widget, clock):
+        more = self._drain()
+        if not more:
+            self._tick_id = None
+        return more
+
+    def _on_unmap(self, widget):
+        # Janela escondida não tem quadros: o tick pararia com eventos na fila
+        if self._tick_id is not None:
+            widget.remove_tick_callback(self._tick_id)
+            self._tick_id = None
+            GLib.timeout_add(FRAME_INTERVAL_MS, self._drain)
+
+    def _drain(self):
+        """Applies queued events until the budget runs out. Returns True to run again next frame."""
+        start = time.perf_counter()
+        applied = 0
+        while True:
+            with self.lock:
+                if not self.queue:
+                    self.scheduled = False
+                    more = False
+                    break
+                _, (fn, args) = self.queue.popitem(last=False)
+            try:
+                fn(*args)
+            except Exception as e:
+                self.logger.exception(f"UI update failed: {e}")
+            applied += 1
+            if time.perf_counter() - start >= self.budget:
+                with self.lock:
+                    more = bool(self.queue)
+                    if not more:
+                        self.scheduled = False
+                break
+
+        elapsed = time.perf_counter() - start
+        with self.lock:
+            self.counters["applied"] += applied
+            self.counters["frames"] += 1
+            if elapsed * 1000 > FRAME_INTERVAL_MS:
+                self.counters["long_frames"] += 1
+            self.frame_total += elapsed
+            self.frame_max = max(self.frame_max, elapsed)
+            self.last_frame = elapsed
+        return GLib.SOURCE_CONTINUE if more else GLib.SOURCE_REMOVE
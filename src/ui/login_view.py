@@ -2,8 +2,9 @@
 import gi  # type: ignore
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw, GObject, GLib # Importar GLib
-from back_end import Utils
+from gi.repository import Gtk, Adw, GObject
+from config_store import ConfigStore
+from .dispatcher import UiDispatcher
 
 # Assume que _ está configurado no main.py
 import gettext
@@ -15,11 +16,11 @@ class LoginView(Gtk.Box):
     def __init__(self, controller):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=6)
         self.controller = controller
-        self.utils = Utils()
+        self.config = ConfigStore.default()
 
         self.set_css_name("login-view")
         
-        data = self.utils.read_json()
+        data = self.config.view()
         self.is_checked = data.get("keepinfo", False)
         self.last_office_ip = None
 
@@ -56,6 +57,7 @@ class LoginView(Gtk.Box):
         self.connect_button = Gtk.Button(label=_("Connect"), halign=Gtk.Align.CENTER)
         self.connect_button.add_css_class("connect-button")
         self.connect_button.connect("clicked", self.on_connect_button_clicked)
+        self.login_task = None  # Handle da conexão em andamento (cancelável)
         
         self.spinner = Gtk.Spinner(spinning=False, halign=Gtk.Align.CENTER)
 
@@ -86,7 +88,12 @@ class LoginView(Gtk.Box):
         self.append(self.spinner)
 
     def on_connect_button_clicked(self, widget):
-        self.connect_button.set_sensitive(False)
+        if self.login_task is not None:
+            # Durante a conexão o botão cancela: o snx é encerrado
+            self.login_task.cancel()
+            self._reset_connect_button()
+            return
+        self.connect_button.set_label(_("Cancel"))
         self.spinner.start()
         
         login_info = {
@@ -96,13 +103,18 @@ class LoginView(Gtk.Box):
             "keep": self.is_checked,
         }
         
-        self.controller.request_login(
+        self.login_task = self.controller.request_login(
             login_info, 
             on_success=self.on_login_success, 
             on_error=self.on_login_error
         )
     
     
+    def _reset_connect_button(self):
+        self.login_task = None
+        self.spinner.stop()
+        self.connect_button.set_label(_("Connect"))
+
     def on_password_icon_pressed(self, entry, icon_pos):
         """Callback para quando o ícone de visibilidade da senha é clicado."""
         is_visible = not entry.get_visibility()
@@ -116,25 +128,19 @@ class LoginView(Gtk.Box):
     def on_checkbox_toggled(self, widget):
         self.is_checked = widget.get_active()
 
-    def on_login_success(self, status, office_ip):
-        GLib.idle_add(self._update_ui_on_success, office_ip)
+    def on_login_success(self, status, office_ip, resumed=False):
+        UiDispatcher.default().post(self._update_ui_on_success, office_ip, key="login")
 
     def on_login_error(self, error_message):
-        GLib.idle_add(self._update_ui_on_error, error_message)
+        UiDispatcher.default().post(self._update_ui_on_error, error_message, key="login")
 
     def _update_ui_on_success(self, office_ip):
         self.last_office_ip = office_ip
-        self.spinner.stop()
-        self.connect_button.set_sensitive(True)
+        self._reset_connect_button()
         self.emit("login-success", self.last_office_ip)
-        return False # Remove a tarefa da fila do GLib
 
     def _update_ui_on_error(self, error_message):
-        self.connect_button.set_sensitive(True)
-        self.spinner.stop()
-        if "Another session" in error_message:
-            self.emit("login-success", "")
-            return False
+        self._reset_connect_button()
 
         dialog = Adw.MessageDialog(
             transient_for=self.get_root(),
@@ -144,5 +150,4 @@ class LoginView(Gtk.Box):
         dialog.add_response("ok", _("OK"))
         dialog.set_response_appearance("ok", Adw.ResponseAppearance.DESTRUCTIVE)
         dialog.connect("response", lambda d, r: d.close())
-        dialog.present()
-        return False # Remove a tarefa da fila do GLib
\ No newline at end of file
+        dialog.present()
\ No newline at end of file
@@ -2,74 +2,70 @@
 import gi  # type: ignore
 gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
-from gi.repository import Gtk, Adw, GObject, GLib # Importar GLib é essencial
+from gi.repository import Gtk, Adw, GObject, GLib, Gio # Importar GLib é essencial
+
+from .dispatcher import UiDispatcher
 
 # Assume que _ está configurado no main.py
 import gettext
 _ = gettext.gettext
 
-class RouteRow(Gtk.ListBoxRow):
+LOAD_CHUNK_SIZE = 500  # Rotas inseridas no modelo por evento do dispatcher
+
+
+class RouteItem(GObject.Object):
+    """One saved route in the list model. `busy` is True while it is being removed."""
+    domain = GObject.Property(type=str, default="")
+    address = GObject.Property(type=str, default="")
+    busy = GObject.Property(type=bool, default=False)
+
+    def __init__(self, domain, address):
+        super().__init__(domain=domain, address=address)
+
+
+class RouteRow(Gtk.Box):
     """
-    Represents a custom row in the routes list, with a remove button.
+    Widget of a visible route, with a remove button. Rows are recycled by the
+    ListView: `bind()` attaches a RouteItem, `unbind()` releases it.
     """
-    def __init__(self, domain, address, on_remove_request):
-        super().__init__()
-        self.domain = domain
-        self.address = address
-        self.on_remove_request = on_remove_request
-
-        box = Gtk.Box(
+    def __init__(self, on_remove_request):
+        super().__init__(
             orientation=Gtk.Orientation.HORIZONTAL, spacing=6,
-            margin_top=6, margin_bottom=6, margin_start=12, margin_end=12,
+            margin_top=6, margin_bottom=6, margin_start=24, margin_end=12,
         )
-        label = Gtk.Label(hexpand=True, xalign=0)
-        label.set_markup(f"<b>{domain}</b> → {address}")
+        self.on_remove_request = on_remove_request
+        self.item = None
+        self._bindings = []
 
+        self.label = Gtk.Label(hexpand=True, xalign=0)
+        self.spinner = Gtk.Spinner()
         self.remove_button = Gtk.Button.new_from_icon_name("edit-delete-symbolic")
-        self.remove_button.get_style_context().add_class("destructive-action")
+        self.remove_button.add_css_class("destructive-action")
         self.remove_button.set_tooltip_text(_("Remove this route"))
         self.remove_button.connect("clicked", self.on_remove_clicked)
 
-        self.spinner = Gtk.Spinner()
-        box.append(label)
-        box.append(self.spinner)
-        box.append(self.remove_button)
-        self.set_child(box)
+        self.append(self.label)
+        self.append(self.spinner)
+        self.append(self.remove_button)
 
-    def on_remove_clicked(self, widget):
-        self.remove_button.set_sensitive(False)
-        self.spinner.start()
-        self.on_remove_request(self)
-
-    # Callbacks que são chamados pela thread do Controller
-    def on_remove_success(self, **kwargs):
-        GLib.idle_add(self._update_ui_on_remove_success)
+    def bind(self, item):
+        self.item = item
+        self.label.set_text(item.address)
+        flags = GObject.BindingFlags.SYNC_CREATE
+        self._bindings = [
+            item.bind_property("busy", self.spinner, "spinning", flags),
+            item.bind_property("busy", self.remove_button, "sensitive", flags | GObject.BindingFlags.INVERT_BOOLEAN),
+        ]
 
-    def on_remove_error(self, error_message):
-        GLib.idle_add(self._update_ui_on_remove_error, error_message)
+    def unbind(self):
+        for binding in self._bindings:
+            binding.unbind()
+        self._bindings = []
+        self.item = None
 
-    # Funções auxiliares que fazem o trabalho real na UI
-    def _update_ui_on_remove_success(self):
-        # O get_parent() pode não funcionar se a linha já estiver sendo removida,
-        # uma abordagem mais segura é o pai remover o filho.
-        # Mas para simplificar, vamos manter assim por enquanto.
-        parent = self.get_parent()
-        if parent:
-            parent.remove(self)
-        return False
-
-    def _update_ui_on_remove_error(self, error_message):
-        self.spinner.stop()
-        self.remove_button.set_sensitive(True)
-        dialog = Adw.MessageDialog(
-            transient_for=self.get_root(),
-            title=_("Error Removing Route"), body=str(error_message),
-        )
-        dialog.add_response("ok", _("OK"))
-        dialog.set_response_appearance("ok", Adw.ResponseAppearance.DESTRUCTIVE)
-        dialog.connect("response", lambda d, r: d.close())
-        dialog.present()
-        return False
+    def on_remove_clicked(self, widget):
+        if self.item is not None:
+            self.on_remove_request(self.item)
 
 
 class RoutesView(Gtk.Box):
@@ -81,6 +77,7 @@ class RoutesView(Gtk.Box):
     def __init__(self, controller):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=12)
         self.controller = controller
+        self.dispatcher = UiDispatcher.default()
         
         self.set_margin_top(12)
         self.set_margin_bottom(12)
@@ -99,29 +96,99 @@ class RoutesView(Gtk.Box):
             hexpand=True, placeholder_text=_("Enter a domain (e.g., bitbucket.org)")
         )
         self.add_button = Gtk.Button(label=_("Add"))
+        self.import_button = Gtk.Button.new_from_icon_name("document-open-symbolic")
+        self.import_button.set_tooltip_text(_("Import routes from a file"))
         self.add_spinner = Gtk.Spinner(spinning=False)
+        self.import_progress = Gtk.ProgressBar(show_text=True, visible=False)
         
         entry_box.append(self.domain_entry)
         entry_box.append(self.add_button)
+        entry_box.append(self.import_button)
         add_box.append(entry_box)
         add_box.append(self.add_spinner)
+        add_box.append(self.import_progress)
+
+        # Lista virtualizada: só as linhas visíveis têm widgets, reciclados na rolagem.
+        # O modelo é ordenado em seções por domínio (um cabeçalho por domínio).
+        # Com uma busca ativa, a lista mostra search_store (os resultados do
+        # índice de busca do backend) no lugar de routes_store.
+        self.routes_store = Gio.ListStore.new(RouteItem)
+        self.search_store = Gio.ListStore.new(RouteItem)
+        self._items = {}  # (domínio, endereço) -> RouteItem de routes_store
+        self.search_task = None
+        by_domain = Gtk.StringSorter.new(Gtk.PropertyExpression.new(RouteItem, None, "domain"))
+        self.sorted_routes = Gtk.SortListModel.new(self.routes_store, None)
+        self.sorted_routes.set_section_sorter(by_domain)
+        self.sorted_routes.set_incremental(True)
+
+        row_factory = Gtk.SignalListItemFactory()
+        row_factory.connect("setup", self._on_row_setup)
+        row_factory.connect("bind", lambda f, list_item: list_item.get_child().bind(list_item.get_item()))
+        row_factory.connect("unbind", lambda f, list_item: list_item.get_child().unbind())
+        header_factory = Gtk.SignalListItemFactory()
+        header_factory.connect("setup", self._on_header_setup)
+        header_factory.connect("bind", self._on_header_bind)
 
         routes_frame = Gtk.Frame(label=_("Active Routes"))
-        self.routes_listbox = Gtk.ListBox()
-        self.routes_listbox.set_selection_mode(Gtk.SelectionMode.NONE)
+        routes_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL)
+        self.search_entry = Gtk.SearchEntry(
+            placeholder_text=_("Search by domain, IP or CIDR"), margin_top=6, margin_start=6, margin_end=6
+        )
+        self.search_entry.connect("search-changed", self.on_search_changed)
+        self.routes_list = Gtk.ListView(
+            model=Gtk.NoSelection.new(self.sorted_routes), factory=row_factory, header_factory=header_factory
+        )
+        self._load_generation = 0  # Invalida carregamentos em andamento ao limpar a lista
         scrolled_window = Gtk.ScrolledWindow(
-            child=self.routes_listbox, vexpand=True, min_content_height=200
+            child=self.routes_list, vexpand=True, min_content_height=200
         )
-        routes_frame.set_child(scrolled_window)
+        routes_box.append(self.search_entry)
+        routes_box.append(scrolled_window)
+        routes_frame.set_child(routes_box)
 
         self.append(add_frame)
         self.append(routes_frame)
 
         self.add_button.connect("clicked", self.on_add_button_clicked)
+        self.import_button.connect("clicked", self.on_import_button_clicked)
+
+    # --- Lista de rotas ---
+    def _on_row_setup(self, factory, list_item):
+        list_item.set_child(RouteRow(self.on_remove_route_request))
+
+    def _on_header_setup(self, factory, header):
+        header.set_child(Gtk.Label(xalign=0, margin_top=6, margin_start=12))
+
+    def _on_header_bind(self, factory, header):
+        domain = GLib.markup_escape_text(header.get_item().domain)
+        header.get_child().set_markup(f"<b>{domain}</b>")
 
     def add_route_to_list(self, domain, address):
-        row = RouteRow(domain, address, self.on_remove_route_request)
-        self.routes_listbox.append(row)
+        self._append_routes([(domain, address)])
+
+    def _append_routes(self, routes):
+        """Adds (domain, address) pairs to the list in a single model change."""
+        items = []
+        for route in routes:
+            if route not in self._items:
+                self._items[route] = RouteItem(*route)
+                items.append(self._items[route])
+        self.routes_store.splice(self.routes_store.get_n_items(), 0, items)
+
+    def load_routes(self, routes):
+        """Replaces the list with `routes`, inserted in chunks so the UI keeps responding."""
+        self.clear_routes_list()
+        self._load_chunk(self._load_generation, routes, 0)
+
+    def _load_chunk(self, generation, routes, offset):
+        if generation != self._load_generation:
+            return # A lista foi limpa ou recarregada nesse meio tempo
+        self._append_routes((r["domain"], r["ip"]) for r in routes[offset:offset + LOAD_CHUNK_SIZE])
+        if offset + LOAD_CHUNK_SIZE < len(routes):
+            # O resto entra no mesmo quadro se couber no orçamento, senão no próximo
+            self.dispatcher.post(self._load_chunk, generation, routes, offset + LOAD_CHUNK_SIZE)
+        else:
+            self._refresh_search()
 
     def on_add_button_clicked(self, widget):
         domain = self.domain_entry.get_text().strip()
@@ -136,47 +203,160 @@ class RoutesView(Gtk.Box):
             on_error=self.handle_route_add_error
         )
 
-    def on_remove_route_request(self, route_row):
+    def on_import_button_clicked(self, widget):
+        dialog = Gtk.FileDialog(title=_("Import Routes"))
+        file_filter = Gtk.FileFilter(name=_("Route lists (TXT, CSV, JSON)"))
+        for pattern in ("*.txt", "*.csv", "*.json", "*.list"):
+            file_filter.add_pattern(pattern)
+        filters = Gio.ListStore.new(Gtk.FileFilter)
+        filters.append(file_filter)
+        dialog.set_filters(filters)
+        dialog.open(self.get_root(), None, self.on_import_file_chosen)
+
+    def on_import_file_chosen(self, dialog, result):
+        try:
+            file = dialog.open_finish(result)
+        except GLib.Error:
+            return # O usuário cancelou o diálogo
+        if file is None or file.get_path() is None:
+            return
+        self.add_button.set_sensitive(False)
+        self.import_button.set_sensitive(False)
+        self.import_progress.set_fraction(0)
+        self.import_progress.set_text(_("Starting import..."))
+        self.import_progress.set_visible(True)
+
+        self.controller.request_import_routes(
+            file.get_path(),
+            on_progress=self.handle_import_progress,
+            on_success=self.handle_import_success,
+            on_error=self.handle_import_error
+        )
+
+    def on_remove_route_request(self, item):
+        item.busy = True
+        key = ("route", item.domain, item.address)
         self.controller.request_remove_route(
-            route_row.domain,
-            route_row.address,
-            on_success=route_row.on_remove_success,
-            on_error=route_row.on_remove_error
+            item.domain,
+            item.address,
+            on_success=lambda **kwargs: self.dispatcher.post(self._update_ui_on_remove_success, item, key=key),
+            on_error=lambda error_message: self.dispatcher.post(
+                self._update_ui_on_remove_error, item, error_message, key=key
+            )
         )
     
     def clear_routes_list(self):
         """Remove todas as rotas da lista visual."""
-        # Itera sobre os filhos da ListBox e os remove um por um
-        # É mais seguro fazer isso em um loop while, pois a lista muda a cada remoção
-        child = self.routes_listbox.get_first_child()
-        while child:
-            self.routes_listbox.remove(child)
-            child = self.routes_listbox.get_first_child()
-        print("Lista de rotas visuais foi limpa.")
-
-    # Callbacks que são chamados pela thread do Controller
+        self._load_generation += 1
+        self._items.clear()
+        self.routes_store.remove_all()
+        self.search_store.remove_all()
+
+    # --- Busca ---
+    def on_search_changed(self, entry):
+        # O SearchEntry já espera o usuário parar de digitar antes de emitir
+        self._refresh_search()
+
+    def _refresh_search(self):
+        """Runs the current query again on the backend index (after the list changed)."""
+        if self.search_task is not None:
+            self.search_task.cancel()
+            self.search_task = None
+        query = self.search_entry.get_text().strip()
+        if not query:
+            self.sorted_routes.set_model(self.routes_store)
+            return
+        self.search_task = self.controller.request_search_routes(
+            query,
+            on_success=lambda routes, total: self.dispatcher.post(
+                self._apply_search_results, query, routes, key="route_search"
+            ),
+            on_error=lambda error_message: self.dispatcher.post(
+                self._apply_search_results, query, [], key="route_search"
+            )
+        )
+
+    def _apply_search_results(self, query, routes):
+        if query != self.search_entry.get_text().strip():
+            return # Resultado de uma busca que já foi substituída
+        self.search_task = None
+        items = [self._items[key] for key in ((r["domain"], r["ip"]) for r in routes) if key in self._items]
+        self.search_store.splice(0, self.search_store.get_n_items(), items)
+        self.sorted_routes.set_model(self.search_store)
+
+    # Callbacks que são chamados pela thread do Controller.
+    # O dispatcher aplica tudo na thread principal, uma vez por quadro; eventos
+    # com a mesma chave se fundem (só o mais recente é aplicado).
+    def handle_routes_loaded(self, routes):
+        self.dispatcher.post(self.load_routes, routes, key="load_routes")
+
+    def handle_routes_load_error(self, error_message):
+        self.dispatcher.post(self.show_error_dialog, _("Error Loading Routes"), error_message)
+
     def handle_route_add_success(self, status, addresses):
-        # Usa GLib.idle_add para garantir que a UI seja atualizada na thread principal
-        GLib.idle_add(self._update_ui_on_add_success, addresses)
+        self.dispatcher.post(self._update_ui_on_add_success, addresses)
 
     def handle_route_add_error(self, error_message):
-        GLib.idle_add(self._update_ui_on_add_error, error_message)
+        self.dispatcher.post(self._update_ui_on_add_error, error_message)
         
+    def handle_import_progress(self, state):
+        self.dispatcher.post(self._update_import_progress, state, key="import_progress")
+
+    def handle_import_success(self, status, imported, failed, stats):
+        self.dispatcher.post(self._update_ui_on_import_success, imported, failed)
+
+    def handle_import_error(self, error_message):
+        self.dispatcher.post(self._update_ui_on_import_error, error_message)
+
     # Funções auxiliares que fazem o trabalho real na UI
+    def _update_ui_on_remove_success(self, item):
+        self._items.pop((item.domain, item.address), None)
+        for store in (self.routes_store, self.search_store):
+            found, position = store.find(item)
+            if found:
+                store.remove(position)
+
+    def _update_ui_on_remove_error(self, item, error_message):
+        item.busy = False
+        self.show_error_dialog(_("Error Removing Route"), error_message)
+
+    def _update_import_progress(self, state):
+        self.import_progress.pulse()
+        self.import_progress.set_text(
+            _("{installed} routes installed, {failed} failed ({read} entries read)").format(**state)
+        )
+
+    def _finish_import(self):
+        self.import_progress.set_visible(False)
+        self.add_button.set_sensitive(True)
+        self.import_button.set_sensitive(True)
+
+    def _update_ui_on_import_success(self, imported, failed):
+        self._finish_import()
+        self.controller.request_load_routes(self)
+        message = _("{count} entries imported.").format(count=imported)
+        if failed:
+            sample = "\n".join(f"{entry}: {reason}" for entry, reason in list(failed.items())[:10])
+            message += "\n\n" + _("{count} entries failed:").format(count=len(failed)) + "\n" + sample
+        self.show_info_dialog(_("Import Finished"), message)
+
+    def _update_ui_on_import_error(self, error_message):
+        self._finish_import()
+        self.show_error_dialog(_("Failed to Import Routes"), error_message)
+
     def _update_ui_on_add_success(self, addresses):
         self.add_spinner.stop()
         self.add_button.set_sensitive(True)
         domain = self.domain_entry.get_text().strip() # Pega o texto de novo aqui dentro
         self.domain_entry.set_text("")
-        for addr in addresses:
-            self.add_route_to_list(domain, addr)
-        return False # Remove a tarefa da fila do GLib
+        # Uma única inserção no modelo para todos os endereços
+        self._append_routes((domain, addr) for addr in addresses)
+        self._refresh_search()
 
     def _update_ui_on_add_error(self, error_message):
         self.add_spinner.stop()
         self.add_button.set_sensitive(True)
         self.show_error_dialog(_("Failed to Add Route"), error_message)
-        return False # Remove a tarefa da fila do GLib
 
     def show_info_dialog(self, title, message):
         dialog = Adw.MessageDialog(
@@ -4,9 +4,8 @@ gi.require_version("Gtk", "4.0")
 gi.require_version("Adw", "1")
 from gi.repository import Gtk, Adw
 from .login_view import LoginView
-from .routes_view import RoutesView
+from .dispatcher import UiDispatcher
 from .widgets import ThemeSwitcher # <-- A IMPORTAÇÃO FOI CORRIGIDA AQUI
-from back_end import Utils
 
 import gettext
 _ = gettext.gettext
@@ -14,7 +13,6 @@ _ = gettext.gettext
 class MainWindow(Gtk.ApplicationWindow):
     def __init__(self, controller, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        utils = Utils()
         self.controller = controller
         self.set_default_size(450, 550)
 
@@ -29,13 +27,11 @@ class MainWindow(Gtk.ApplicationWindow):
         self.set_child(main_box)
 
         self.login_view = LoginView(self.controller)
-        self.routes_view = RoutesView(self.controller)
+        self.routes_view = None # Criada no primeiro login (ver _ensure_routes_view)
 
         self.stack.add_named(self.login_view, "login")
-        self.stack.add_named(self.routes_view, "routes")
         
         self.login_view.connect("login-success", self.show_routes_view)
-        self.routes_view.connect("disconnected", self.show_login_view)
 
         self.show_login_view()
     
@@ -88,6 +84,41 @@ class MainWindow(Gtk.ApplicationWindow):
         check_box.set_margin_bottom(12)
         content_box.append(check_box)
 
+        aggregate_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12, margin_start=12, margin_end=12)
+        aggregate_label = Gtk.Label(label=_("Aggregate routes"), xalign=0, hexpand=True)
+        aggregate_label.set_tooltip_text(_("Install saved addresses as the fewest possible network prefixes"))
+        self.aggregate_routes_switch = Gtk.Switch(active=self.controller.get_route_aggregation_status())
+        self.aggregate_routes_switch.set_valign(Gtk.Align.CENTER)
+        self.aggregate_routes_switch.connect("notify::active", self.on_aggregate_routes_toggled)
+
+        aggregate_box.append(aggregate_label)
+        aggregate_box.append(self.aggregate_routes_switch)
+        aggregate_box.set_margin_bottom(12)
+        content_box.append(aggregate_box)
+
+        policy_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12, margin_start=12, margin_end=12)
+        policy_label = Gtk.Label(label=_("Dedicated route table"), xalign=0, hexpand=True)
+        policy_label.set_tooltip_text(_("Keep VPN routes in their own routing table, removed all at once on disconnect"))
+        self.policy_routing_switch = Gtk.Switch(active=self.controller.get_policy_routing_status())
+        self.policy_routing_switch.set_valign(Gtk.Align.CENTER)
+        self.policy_routing_switch.connect("notify::active", self.on_policy_routing_toggled)
+
+        policy_box.append(policy_label)
+        policy_box.append(self.policy_routing_switch)
+        policy_box.set_margin_bottom(12)
+        content_box.append(policy_box)
+
+        reconnect_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=12, margin_start=12, margin_end=12)
+        reconnect_label = Gtk.Label(label=_("Reconnect automatically"), xalign=0, hexpand=True)
+        self.auto_reconnect_switch = Gtk.Switch(active=self.controller.get_auto_reconnect_status())
+        self.auto_reconnect_switch.set_valign(Gtk.Align.CENTER)
+        self.auto_reconnect_switch.connect("notify::active", self.on_auto_reconnect_toggled)
+
+        reconnect_box.append(reconnect_label)
+        reconnect_box.append(self.auto_reconnect_switch)
+        reconnect_box.set_margin_bottom(12)
+        content_box.append(reconnect_box)
+
         content_box.append(Gtk.Separator())
 
         disconnect_button = Gtk.Button(label=_("Disconnect"))
@@ -95,7 +126,21 @@ class MainWindow(Gtk.ApplicationWindow):
         disconnect_button.connect("clicked", self.on_disconnect_clicked)
         content_box.append(disconnect_button)
 
+    def _ensure_routes_view(self):
+        """Builds the routes view on first use, so it doesn't delay the login screen."""
+        if self.routes_view is None:
+            from .routes_view import RoutesView
+            self.routes_view = RoutesView(self.controller)
+            self.stack.add_named(self.routes_view, "routes")
+            self.routes_view.connect("disconnected", self.show_login_view)
+        return self.routes_view
+
+    def _clear_routes(self):
+        if self.routes_view is not None:
+            self.routes_view.clear_routes_list()
+
     def show_routes_view(self, widget, office_ip):
+        self._ensure_routes_view()
         self.stack.set_visible_child_name("routes")
         self.header.get_title_widget().set_title(_("Connected"))
         self.menu_button.set_visible(True)
@@ -106,18 +151,46 @@ class MainWindow(Gtk.ApplicationWindow):
         self.title_widget.set_title(_("Login"))
         self.menu_button.set_visible(False)
 
+    def on_tunnel_state_changed(self, connected):
+        """Chamado (na thread da UI) quando o monitor vê o túnel cair ou voltar."""
+        if connected or self.stack.get_visible_child_name() != "routes":
+            return
+        if self.controller.get_auto_reconnect_status():
+            # Fica na tela de rotas enquanto o supervisor tenta reconectar.
+            self.title_widget.set_title(_("Reconnecting..."))
+        else:
+            self._clear_routes()
+            self.show_login_view()
+
+    def on_reconnect_event(self, event):
+        """Chamado (na thread da UI) com o progresso da reconexão automática."""
+        if self.stack.get_visible_child_name() != "routes":
+            return
+        if event["state"] == "reconnecting":
+            self.title_widget.set_title(_("Reconnecting..."))
+            self.title_widget.set_subtitle(_("Attempt {}").format(event["attempt"]))
+        elif event["state"] == "recovered":
+            self.title_widget.set_title(_("Connected"))
+            self.title_widget.set_subtitle("")
+        elif event["state"] == "failed":
+            self.title_widget.set_subtitle("")
+            self._clear_routes()
+            self.show_login_view()
+
     def on_disconnect_clicked(self, widget):
         # Primeiro, fecha o popover para uma experiência mais fluida
         self.menu_button.get_popover().popdown()
         self.menu_button.set_sensitive(False)
+        # Os callbacks chegam na thread do worker: a interface só muda na main thread
+        dispatcher = UiDispatcher.default()
         self.controller.request_disconnect(
-            on_success=self.on_disconnect_success,
-            on_error=self.on_disconnect_error
+            on_success=lambda message: dispatcher.post(self.on_disconnect_success, message, key="disconnect"),
+            on_error=lambda error_message: dispatcher.post(self.on_disconnect_error, error_message, key="disconnect")
         )
 
     def on_disconnect_success(self, message):
         self.menu_button.set_sensitive(True)
-        self.routes_view.clear_routes_list()
+        self._clear_routes()
         self.show_login_view()
 
     def on_keep_routes_toggled(self, switch, gparam):
@@ -127,6 +200,28 @@ class MainWindow(Gtk.ApplicationWindow):
         self.controller.set_keep_routes_status(is_active)
 
 
+    def on_auto_reconnect_toggled(self, switch, gparam):
+        """Chamado quando o usuário clica no switch 'Reconnect automatically'."""
+        self.controller.set_auto_reconnect_status(switch.get_active())
+
+    def on_policy_routing_toggled(self, switch, gparam):
+        """Chamado quando o usuário clica no switch 'Dedicated route table'."""
+        switch.set_sensitive(False)
+        self.controller.request_set_policy_routing(
+            switch.get_active(),
+            on_success=lambda status: UiDispatcher.default().post(switch.set_sensitive, True, key=switch),
+            on_error=lambda error_message: UiDispatcher.default().post(switch.set_sensitive, True, key=switch)
+        )
+
+    def on_aggregate_routes_toggled(self, switch, gparam):
+        """Chamado quando o usuário clica no switch 'Aggregate routes'."""
+        switch.set_sensitive(False)
+        self.controller.request_set_route_aggregation(
+            switch.get_active(),
+            on_success=lambda status: UiDispatcher.default().post(switch.set_sensitive, True, key=switch),
+            on_error=lambda error_message: UiDispatcher.default().post(switch.set_sensitive, True, key=switch)
+        )
+
     def on_disconnect_error(self, error_message):
         self.menu_button.set_sensitive(True)
         self.show_login_view()
\ No newline at end of file
@@ -0,0 +1,211 @@
+# test_dns_resolver.py
+"""
+DnsResolver against stub DNS servers on the loopback (UDP and TCP).
+"""
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+from dns_resolver import DnsCache, DnsError, DnsResolver, FLAG_TC
+
+ANSWER_FLAGS = 0x8180
+NXDOMAIN_FLAGS = 0x8183
+
+
+def question_name(query):
+    labels, offset = [], 12
+    while query[offset]:
+        length = query[offset]
+        labels.append(query[offset + 1:offset + 1 + length].decode())
+        offset += 1 + length
+    return ".".join(labels), query[12:offset + 5]
+
+
+def build_reply(query, records, flags=ANSWER_FLAGS):
+    name, question = question_name(query)
+    answers = b"".join(
+        b"\xc0\x0c" + struct.pack("!HHIH", 1, 1, ttl, 4) + socket.inet_aton(address)
+        for address, ttl in records
+    )
+    return query[:2] + struct.pack("!HHHHH", flags, 1, len(records), 0, 0) + question + answers
+
+
+class StubDns:
+    """
+    Answers A queries from `zone` ({name: [(address, ttl)]}); other names get
+    NXDOMAIN. `truncate` answers UDP with TC set and no records (the full
+    answer only over TCP), `silent` never answers, `delay` waits first.
+    """
+    def __init__(self, address, port, zone, truncate=False, silent=False, delay=0.0):
+        self.zone = zone
+        self.truncate = truncate
+        self.silent = silent
+        self.delay = delay
+        self.queries = []  # (transporte, nome)
+        self.udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.udp.bind((address, port))
+        self.tcp = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.tcp.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.tcp.bind((address, self.udp.getsockname()[1]))
+        self.tcp.listen()
+        self.port = self.udp.getsockname()[1]
+        for target in (self._serve_udp, self._serve_tcp):
+            threading.Thread(target=target, daemon=True).start()
+
+    def reply(self, query, transport):
+        name, _ = question_name(query)
+        if name not in self.zone:
+            return build_reply(query, [], NXDOMAIN_FLAGS)
+        if self.truncate and transport == "udp":
+            return build_reply(query, [], ANSWER_FLAGS | FLAG_TC)
+        return build_reply(query, self.zone[name])
+
+    def _serve_udp(self):
+        while True:
+            try:
+                query, peer = self.udp.recvfrom(512)
+            except OSError:
+                return
+            self.queries.append(("udp", question_name(query)[0]))
+            if self.silent:
+                continue
+            time.sleep(self.delay)
+            try:
+                self.udp.sendto(self.reply(query, "udp"), peer)
+            except OSError:
+                return  # Fechado durante o atraso
+
+    def _serve_tcp(self):
+        while True:
+            try:
+                conn, _ = self.tcp.accept()
+            except OSError:
+                return
+            with conn:
+                length = struct.unpack("!H", conn.recv(2))[0]
+                query = conn.recv(length)
+                self.queries.append(("tcp", question_name(query)[0]))
+                response = self.reply(query, "tcp")
+                conn.sendall(struct.pack("!H", len(response)) + response)
+
+    def close(self):
+        self.udp.close()
+        self.tcp.close()
+
+
+def wait_for(condition, timeout=2.0):
+    """The stubs record queries on their own threads; polls until `condition()` holds."""
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def stubs(loopback):
+    servers = []
+
+    def start(address="127.0.0.1", port=0, **kwargs):
+        server = StubDns(address, port, **kwargs)
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+ZONE = {"multi.example": [("10.0.0.1", 300), ("10.0.0.2", 300), ("10.0.0.3", 60)]}
+
+
+def test_returns_every_a_record(stubs):
+    server = stubs(zone=ZONE)
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=1.0)
+    records = resolver.resolve("multi.example")
+    assert records == [
+        {"address": "10.0.0.1", "ttl": 300},
+        {"address": "10.0.0.2", "ttl": 300},
+        {"address": "10.0.0.3", "ttl": 60},
+    ]
+
+
+def test_cache_honours_the_ttl(stubs):
+    server = stubs(zone=ZONE)
+    now = [1000.0]
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=1.0,
+                           cache=DnsCache(clock=lambda: now[0]))
+    resolver.resolve("multi.example")
+    now[0] += 59
+    cached = resolver.resolve("multi.example")
+    assert len(server.queries) == 1
+    assert [r["ttl"] for r in cached] == [241, 241, 1]
+
+    now[0] += 1  # O menor TTL venceu: a entrada inteira expira
+    resolver.resolve("multi.example")
+    assert len(server.queries) == 2
+
+
+def test_truncated_answer_falls_back_to_tcp(stubs):
+    server = stubs(zone=ZONE, truncate=True)
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=1.0)
+    assert len(resolver.resolve("multi.example")) == 3
+    assert server.queries == [("udp", "multi.example"), ("tcp", "multi.example")]
+
+
+def test_nxdomain_raises(stubs):
+    server = stubs(zone=ZONE)
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=1.0)
+    with pytest.raises(DnsError, match="not found"):
+        resolver.resolve("missing.example")
+
+
+def test_timeout_raises(stubs):
+    server = stubs(zone=ZONE, silent=True)
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=0.2)
+    start = time.monotonic()
+    with pytest.raises(DnsError, match="Failed to resolve"):
+        resolver.resolve("multi.example")
+    assert time.monotonic() - start < 1.0
+    assert resolver.server_stats()["127.0.0.1"]["failures"] == 1
+
+
+def test_race_takes_the_first_answer(stubs):
+    slow = stubs("127.0.0.2", zone={"app.corp": [("10.1.1.1", 60)]}, delay=0.3)
+    fast = stubs("127.0.0.3", slow.port, zone={"app.corp": [("10.2.2.2", 60)]})
+    dead = stubs("127.0.0.4", slow.port, zone={}, silent=True)
+    resolver = DnsResolver(["127.0.0.2", "127.0.0.3", "127.0.0.4"], port=slow.port,
+                           timeout=2.0, race=True)
+    start = time.monotonic()
+    assert resolver.resolve("app.corp") == [{"address": "10.2.2.2", "ttl": 60}]
+    assert time.monotonic() - start < 0.25
+    assert wait_for(lambda: fast.queries and slow.queries and dead.queries)  # Todos receberam a consulta
+    assert resolver.server_stats()["127.0.0.3"]["answers"] == 1
+
+
+def test_race_falls_back_to_the_system_resolver(stubs):
+    tunnel = stubs("127.0.0.2", zone={"app.corp": [("10.1.1.1", 60)]})
+    stubs("127.0.0.3", tunnel.port, zone={}, silent=True)
+    system = stubs("127.0.0.5", tunnel.port, zone={"public.example": [("192.0.2.10", 60)]})
+    resolver = DnsResolver(["127.0.0.2", "127.0.0.3"], port=tunnel.port, timeout=2.0, race=True,
+                           fallback=DnsResolver(["127.0.0.5"], port=tunnel.port, timeout=1.0))
+    start = time.monotonic()
+    assert resolver.resolve("public.example") == [{"address": "192.0.2.10", "ttl": 60}]
+    # O servidor mudo só ganha a janela de tolerância, não o timeout inteiro
+    assert time.monotonic() - start < 1.0
+    assert wait_for(lambda: system.queries == [("udp", "public.example")])
+
+    resolver.resolve("public.example")
+    assert len(system.queries) == 1  # Resposta do fallback também vai para o cache
+
+
+def test_invalid_names_fail_without_breaking_a_batch(stubs):
+    server = stubs(zone=ZONE)
+    resolver = DnsResolver(["127.0.0.1"], port=server.port, timeout=1.0)
+    resolved, failed = resolver.resolve_many(["multi.example", "x" * 70 + ".example"])
+    assert list(resolved) == ["multi.example"]
+    assert "Invalid domain name" in failed["x" * 70 + ".example"]
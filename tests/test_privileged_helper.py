@@ -0,0 +1,250 @@
+# test_privileged_helper.py
+"""
+HelperServer on a socket in a temp dir, with a fake route engine injected into
+HelperService: authentication (token and SO_PEERCRED), request validation,
+result shapes and the checks on the socket directory.
+"""
+import errno
+import os
+import socket
+import stat
+import threading
+
+import pytest
+
+import privileged_helper
+from netlink_routes import route_result
+from privileged_helper import (
+    HelperError, HelperServer, HelperService, SOCKET_NAME,
+    check_socket_dir, make_socket_dir, recv_message, send_message, serve,
+)
+
+TOKEN = "s3cret"
+
+
+class FakeEngine:
+    """Records the calls; destinations in `missing` fail to delete with ESRCH."""
+    def __init__(self, missing=()):
+        self.calls = []
+        self.missing = set(missing)
+
+    def add_routes(self, destinations, gateway, table=None):
+        self.calls.append(("add", list(destinations), gateway, table))
+        return [route_result(d) for d in destinations]
+
+    def delete_routes(self, destinations, gateway, table=None):
+        self.calls.append(("delete", list(destinations), gateway, table))
+        return [route_result(d, errno.ESRCH if d in self.missing else 0) for d in destinations]
+
+
+class Helper:
+    def __init__(self, socket_dir, engine, sysctls):
+        service = HelperService(engine, sysctl_writer=lambda name, value: sysctls.append((name, value)))
+        self.server = HelperServer(str(socket_dir), TOKEN, os.getuid(), service)
+        self.path = self.server.server_address
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(5)
+        sock.connect(self.path)
+        return sock
+
+    def request(self, request_type, token=TOKEN, **fields):
+        with self.connect() as sock:
+            send_message(sock, dict(fields, type=request_type, token=token, id=7))
+            return recv_message(sock)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join(2)
+
+
+@pytest.fixture
+def engine():
+    return FakeEngine(missing={"203.0.113.9"})
+
+
+@pytest.fixture
+def sysctls():
+    return []
+
+
+@pytest.fixture
+def helper(tmp_path, engine, sysctls):
+    socket_dir = tmp_path / "helper"
+    socket_dir.mkdir(mode=0o711)
+    helper = Helper(socket_dir, engine, sysctls)
+    yield helper
+    helper.close()
+
+
+def test_good_token_is_served(helper):
+    response = helper.request("ping")
+    assert response == {"ok": True, "result": {"pid": os.getpid()}, "id": 7}
+
+
+def test_wrong_token_is_refused(helper, engine):
+    with helper.connect() as sock:
+        send_message(sock, {"type": "add_routes", "token": "guess", "gateway": "10.0.0.1",
+                            "destinations": ["192.0.2.1"]})
+        assert recv_message(sock) == {"ok": False, "error": "Invalid token."}
+        with pytest.raises(EOFError):
+            recv_message(sock)  # E a conexão é fechada
+    assert engine.calls == []
+
+
+def test_wrong_uid_is_dropped_before_reading(helper, engine, monkeypatch):
+    monkeypatch.setattr(privileged_helper, "peer_credentials", lambda sock: (1234, 4242, 4242))
+    helper.server.allowed_uid = 1000
+    with helper.connect() as sock:
+        send_message(sock, {"type": "ping", "token": TOKEN})
+        with pytest.raises((EOFError, ConnectionResetError)):
+            recv_message(sock)
+    assert engine.calls == []
+
+
+def test_root_is_always_accepted(helper, monkeypatch):
+    monkeypatch.setattr(privileged_helper, "peer_credentials", lambda sock: (1, 0, 0))
+    helper.server.allowed_uid = 1000
+    assert helper.request("ping")["ok"]
+
+
+@pytest.mark.parametrize("name, value, error", [
+    ("kernel.core_pattern", 1, "not allowed"),
+    ("net.ipv6.conf.all.disable_ipv6", 2, "must be 0 or 1"),
+])
+def test_sysctl_outside_the_allow_list_is_rejected(helper, sysctls, name, value, error):
+    response = helper.request("set_sysctl", name=name, value=value)
+    assert not response["ok"] and error in response["error"]
+    assert sysctls == []
+
+
+def test_allowed_sysctl_is_written(helper, sysctls):
+    assert helper.request("set_sysctl", name="net.ipv6.conf.all.disable_ipv6", value=1)["ok"]
+    assert sysctls == [("net.ipv6.conf.all.disable_ipv6", 1)]
+
+
+def test_route_results_keep_their_shape(helper, engine):
+    added = helper.request("add_routes", gateway="10.0.0.1", destinations=["192.0.2.1", "203.0.113.9"])
+    assert added == {"ok": True, "id": 7, "result": [
+        {"destination": "192.0.2.1", "ok": True, "errno": 0, "error": None},
+        {"destination": "203.0.113.9", "ok": True, "errno": 0, "error": None},
+    ]}
+
+    deleted = helper.request("delete_routes", gateway="10.0.0.1", destinations=["192.0.2.1", "203.0.113.9"])
+    assert deleted["ok"]
+    assert deleted["result"][0] == {"destination": "192.0.2.1", "ok": True, "errno": 0, "error": None}
+    assert deleted["result"][1] == {"destination": "203.0.113.9", "ok": False, "errno": errno.ESRCH,
+                                    "error": os.strerror(errno.ESRCH)}
+    assert engine.calls == [
+        ("add", ["192.0.2.1", "203.0.113.9"], "10.0.0.1", None),
+        ("delete", ["192.0.2.1", "203.0.113.9"], "10.0.0.1", None),
+    ]
+
+
+def test_flush_deletes_only_this_session_routes(helper, engine):
+    helper.request("add_routes", gateway="10.0.0.1", destinations=["192.0.2.1"], table=100)
+    helper.request("add_routes", gateway="10.0.0.2", destinations=["192.0.2.2"])
+    flushed = helper.request("flush")["result"]
+    assert sorted(r["destination"] for r in flushed) == ["192.0.2.1", "192.0.2.2"]
+    assert ("delete", ["192.0.2.1"], "10.0.0.1", 100) in engine.calls
+    assert helper.request("flush")["result"] == []
+
+
+@pytest.mark.parametrize("fields, error", [
+    ({"gateway": "not-an-ip", "destinations": ["192.0.2.1"]}, "does not appear to be"),
+    ({"gateway": "10.0.0.1", "destinations": "192.0.2.1"}, "list of strings"),
+    ({"destinations": ["192.0.2.1"]}, "'gateway' is required"),
+    ({"gateway": "10.0.0.1", "destinations": ["192.0.2.1"], "table": 254}, "reserved"),
+])
+def test_invalid_route_requests_are_rejected(helper, engine, fields, error):
+    response = helper.request("add_routes", **fields)
+    assert not response["ok"] and error in response["error"]
+    assert engine.calls == []
+
+
+def test_unknown_request_type(helper):
+    assert helper.request("reboot") == {"ok": False, "error": "Unknown request type: reboot", "id": 7}
+
+
+# --- Diretório do socket ---
+def test_socket_is_private_to_its_owner(helper):
+    st = os.lstat(helper.path)
+    assert stat.S_ISSOCK(st.st_mode)
+    assert stat.S_IMODE(st.st_mode) == 0o600
+
+
+def test_server_close_removes_the_socket_and_its_dir(tmp_path, engine, sysctls):
+    socket_dir = tmp_path / "helper"
+    socket_dir.mkdir(mode=0o711)
+    Helper(socket_dir, engine, sysctls).close()
+    assert not socket_dir.exists()
+
+
+def test_made_socket_dir_is_owned_and_not_writable_by_others():
+    path = make_socket_dir()
+    try:
+        st = os.lstat(path)
+        assert stat.S_ISDIR(st.st_mode)
+        assert stat.S_IMODE(st.st_mode) == 0o711
+        assert st.st_uid == os.geteuid()
+    finally:
+        os.rmdir(path)
+
+
+@pytest.mark.parametrize("mode", [0o777, 0o731, 0o713])
+def test_writable_socket_dir_is_refused(tmp_path, engine, mode):
+    socket_dir = tmp_path / "helper"
+    socket_dir.mkdir()
+    os.chmod(socket_dir, mode)
+    with pytest.raises(HelperError, match="Unsafe directory"):
+        HelperServer(str(socket_dir), TOKEN, os.getuid(), HelperService(engine))
+    assert not (socket_dir / SOCKET_NAME).exists()
+
+
+def test_symlinked_socket_dir_is_refused(tmp_path, engine):
+    target = tmp_path / "target"
+    target.mkdir(mode=0o711)
+    link = tmp_path / "helper"
+    link.symlink_to(target)
+    with pytest.raises(HelperError, match="Unsafe directory"):
+        HelperServer(str(link), TOKEN, os.getuid(), HelperService(engine))
+    assert not (target / SOCKET_NAME).exists()
+
+
+def test_socket_dir_of_another_owner_is_refused(tmp_path):
+    st = os.lstat(tmp_path)
+    check_socket_dir(st, {st.st_uid}, str(tmp_path))
+    with pytest.raises(HelperError, match="Unsafe directory"):
+        check_socket_dir(st, {st.st_uid + 1}, str(tmp_path))
+
+
+def test_serve_announces_the_socket_and_exits_when_stdin_closes(tmp_path, engine):
+    socket_dir = tmp_path / "helper"
+    socket_dir.mkdir(mode=0o711)
+    stdin_r, stdin_w = os.pipe()
+    stdout_r, stdout_w = os.pipe()
+    with os.fdopen(stdin_r) as stdin, os.fdopen(stdout_w, "w") as stdout, \
+            os.fdopen(stdin_w, "w") as app_in, os.fdopen(stdout_r) as app_out:
+        result = []
+        thread = threading.Thread(
+            target=lambda: result.append(serve(os.getuid(), stdin, stdout, HelperService(engine), str(socket_dir))),
+            daemon=True,
+        )
+        thread.start()
+        app_in.write(TOKEN + "\n")
+        app_in.flush()
+        assert app_out.readline() == f"READY {socket_dir / SOCKET_NAME}\n"
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(str(socket_dir / SOCKET_NAME))
+            send_message(sock, {"type": "ping", "token": TOKEN})
+            assert recv_message(sock)["ok"]
+
+        app_in.close()
+        thread.join(5)
+    assert result == [0]
+    assert not socket_dir.exists()
@@ -0,0 +1,98 @@
+# test_reconnect.py
+"""
+Auto-reconnect against the fake snx (tools/simulator): the tunnel is killed
+under a connected VpnManager and must come back, with its routes.
+"""
+import threading
+
+import pytest
+
+from conftest import ip
+from netlink_routes import NetlinkRouteEngine, RTPROT_SNX_CONNECT
+from reconnect import Backoff
+
+ROUTES = {"a.example": ["192.0.2.7", "192.0.2.8"], "net.example": ["198.51.100.0/24"]}
+
+
+def installed_routes():
+    engine = NetlinkRouteEngine()
+    return {r["destination"] for r in engine.list_routes() if r["protocol"] == RTPROT_SNX_CONNECT}
+
+
+@pytest.fixture
+def manager(netns, home, monkeypatch):
+    from back_end import VpnManager
+    monkeypatch.setenv("SNX_SIM_TUNNEL", "1")
+    manager = VpnManager()
+    with manager.config.update() as data:
+        data["routes"] = ROUTES
+        data["routesVersion"] = 2
+        data["autoReconnect"] = True
+        data["keepAddr"] = True  # Sem isso o connect não instala as rotas salvas
+    manager.reconnector.backoff = Backoff(base=0.05, max_delay=0.2)
+    yield manager
+    manager.disconnect()
+
+
+class Events:
+    def __init__(self, manager):
+        self.states = []
+        self.started = threading.Event()
+        self.finished = threading.Event()
+        manager.add_reconnect_listener(self._on_event)
+
+    def _on_event(self, event):
+        self.states.append(event["state"])
+        self.started.set()
+        if event["state"] in ("recovered", "failed", "cancelled"):
+            self.finished.set()
+
+
+def test_recovers_after_a_drop(manager):
+    manager.connect("gateway", "user", "secret", False)
+    assert installed_routes() == {"192.0.2.7/32", "192.0.2.8/32", "198.51.100.0/24"}
+    events = Events(manager)
+
+    ip("link", "del", "tunsnx")
+
+    assert events.finished.wait(10)
+    assert events.states[0] == "reconnecting"
+    assert events.states[-1] == "recovered"
+    assert installed_routes() == {"192.0.2.7/32", "192.0.2.8/32", "198.51.100.0/24"}
+    incident = manager.get_reconnect_history()[-1]
+    assert incident["state"] == "recovered"
+    assert incident["time_to_recovery"] > 0
+
+
+def test_retries_until_snx_comes_back(manager, home, monkeypatch):
+    failures = home / "failures"
+    monkeypatch.setenv("SNX_SIM_FAILURES", str(failures))
+    manager.connect("gateway", "user", "secret", False)
+    events = Events(manager)
+
+    failures.write_text("2")
+    ip("link", "del", "tunsnx")
+
+    assert events.finished.wait(10)
+    assert events.states == ["reconnecting"] * 3 + ["recovered"]
+    incident = manager.get_reconnect_history()[-1]
+    assert incident["attempts"] == 3
+    assert incident["error"]
+    assert "192.0.2.7/32" in installed_routes()
+
+
+def test_disconnect_cancels_the_recovery(manager, home, monkeypatch):
+    failures = home / "failures"
+    monkeypatch.setenv("SNX_SIM_FAILURES", str(failures))
+    manager.connect("gateway", "user", "secret", False)
+    events = Events(manager)
+
+    failures.write_text("100")
+    ip("link", "del", "tunsnx")
+    assert events.started.wait(5)
+    manager.disconnect()
+
+    assert events.finished.wait(10)
+    assert events.states[-1] == "cancelled"
+    assert not manager.reconnector.is_active()
+    assert installed_routes() == set()
@@ -0,0 +1,105 @@
+# test_tunnel_monitor.py
+"""
+TunnelWatcher against a real interface in the test namespace: drops must be
+reported from netlink events, well before the fallback poll, and route
+changes on the tunnel must not look like drops.
+"""
+import threading
+import time
+
+import pytest
+
+from conftest import ip
+from netlink_routes import NetlinkRouteEngine, RTPROT_SNX_CONNECT
+from tunnel_monitor import TunnelWatcher
+
+IFNAME = "tunsnx"
+ADDRESS = "10.9.0.5"
+MAX_REACTION = 0.5  # segundos; o poll de fallback do teste é de 60 s
+
+
+class Recorder:
+    """Collects (time, connected) transitions from a watcher running on a thread."""
+    def __init__(self, watcher):
+        self.watcher = watcher
+        self.events = []
+        self.changed = threading.Event()
+        self.thread = threading.Thread(target=watcher.watch, args=(self._on_change, True), daemon=True)
+
+    def _on_change(self, connected):
+        self.events.append((time.monotonic(), connected))
+        self.changed.set()
+
+    def __enter__(self):
+        self.thread.start()
+        time.sleep(0.05)  # Deixa o socket de eventos assinar os grupos
+        return self
+
+    def __exit__(self, *exc):
+        self.watcher.stop()
+        self.thread.join(2)
+        self.watcher.close()
+
+    def reaction(self, action, expected):
+        """Seconds between `action()` and the transition to `expected`."""
+        self.changed.clear()
+        start = time.monotonic()
+        action()
+        assert self.changed.wait(5), "no transition reported"
+        at, connected = self.events[-1]
+        assert connected is expected
+        return at - start
+
+
+@pytest.fixture
+def tunnel(make_link):
+    make_link(IFNAME)
+    ip("addr", "add", ADDRESS, "dev", IFNAME)
+    ip("link", "set", IFNAME, "up")
+    return IFNAME
+
+
+@pytest.mark.parametrize("drop", [
+    lambda: ip("link", "set", IFNAME, "down"),
+    lambda: ip("addr", "flush", "dev", IFNAME),
+    lambda: ip("link", "del", IFNAME),
+], ids=["link-down", "address-removed", "link-deleted"])
+def test_drop_is_reported_from_events(tunnel, drop):
+    watcher = TunnelWatcher(IFNAME, poll_interval=60)
+    assert watcher.is_connected()
+    with Recorder(watcher) as recorder:
+        assert recorder.reaction(drop, False) < MAX_REACTION
+    assert not TunnelWatcher(IFNAME).is_connected()
+
+
+def test_recovery_is_reported(tunnel):
+    watcher = TunnelWatcher(IFNAME, poll_interval=60)
+    with Recorder(watcher) as recorder:
+        recorder.reaction(lambda: ip("link", "set", IFNAME, "down"), False)
+        assert recorder.reaction(lambda: ip("link", "set", IFNAME, "up"), True) < MAX_REACTION
+
+
+def test_route_changes_are_not_drops(tunnel):
+    engine = NetlinkRouteEngine()
+    destinations = [f"192.0.2.{i}" for i in range(1, 51)]
+    watcher = TunnelWatcher(IFNAME, poll_interval=60)
+    with Recorder(watcher) as recorder:
+        start = time.perf_counter()
+        added = engine.add_routes(destinations, ADDRESS)
+        add_time = time.perf_counter() - start
+        assert all(result["ok"] for result in added)
+
+        installed = {r["destination"] for r in engine.list_routes() if r["protocol"] == RTPROT_SNX_CONNECT}
+        assert installed == {f"{d}/32" for d in destinations}
+        assert f"192.0.2.1 via {ADDRESS} dev {IFNAME}" in ip("route", "show", "proto", str(RTPROT_SNX_CONNECT))
+
+        start = time.perf_counter()
+        removed = engine.delete_routes(destinations, ADDRESS)
+        delete_time = time.perf_counter() - start
+        assert all(result["ok"] for result in removed)
+        assert not [r for r in engine.list_routes() if r["protocol"] == RTPROT_SNX_CONNECT]
+
+        time.sleep(0.1)
+    assert recorder.events == []
+    # Um lote de 50 rotas é uma transação netlink, não 50 processos `ip`
+    assert add_time < MAX_REACTION and delete_time < MAX_REACTION
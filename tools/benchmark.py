@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# benchmark.py
+"""
+End-to-end benchmarks for the backend, against the fake snx/pkexec in
+tools/simulator. Nothing touches the real network: the script re-runs itself
+inside `unshare -rn` (a throwaway user + network namespace), where the fake
+snx creates a real tunsnx interface and routes go into the namespace's table.
+
+Measured for every route count (10, 1000 and 10000 by default):
+    connect      connect() with N saved routes to auto-add (plus its phases)
+    add_route    single add_route() calls on top of the N routes
+    bulk_load    import_routes() of N new addresses
+    remove_route single remove_route() calls
+    disconnect   disconnect(), which deletes every route
+
+Results are written to tools/bench-results/<timestamp>.json and compared
+with the previous run:
+
+    python3 tools/benchmark.py [--sizes 10,1000] [--repeat 3] [--pkexec]
+"""
+import argparse
+import ipaddress
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(TOOLS_DIR), "src")
+SIMULATOR_DIR = os.path.join(TOOLS_DIR, "simulator")
+RESULTS_DIR = os.path.join(TOOLS_DIR, "bench-results")
+NETNS_MARKER = "SNX_BENCH_NETNS"
+
+SINGLE_OPS = 50  # add_route/remove_route individuais por rodada
+
+
+def addresses(network, count):
+    base = ipaddress.ip_network(network)
+    return [str(base.network_address + 1 + i) for i in range(count)]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def describe(samples):
+    """Latency summary in milliseconds."""
+    return {
+        "count": len(samples),
+        "median_ms": statistics.median(samples) * 1000,
+        "p95_ms": percentile(samples, 0.95) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+class Bench:
+    def __init__(self, size, use_pkexec, workdir):
+        self.size = size
+        self.use_pkexec = use_pkexec
+        self.home = os.path.join(workdir, f"home-{size}")
+        self.workdir = workdir
+
+    def setup(self):
+        shutil.rmtree(self.home, ignore_errors=True)
+        config_dir = os.path.join(self.home, ".config", "snx-connect")
+        os.makedirs(config_dir)
+        saved = {f"host{i}.bench": [a] for i, a in enumerate(addresses("172.16.0.0/12", self.size))}
+        with open(os.path.join(config_dir, "snx-data.json"), "w") as f:
+            json.dump({"routes": saved, "routesVersion": 2, "keepAddr": True}, f)
+        os.environ["HOME"] = self.home
+        os.environ["SNX_SIM_STATE"] = os.path.join(self.home, "snx-sim")
+
+        from config_store import ConfigStore
+        from back_end import VpnManager
+        from privileged_helper import PrivilegedSession
+        ConfigStore._instances.clear()  # Cada rodada começa com um HOME novo
+        manager = VpnManager()
+        if self.use_pkexec:
+            session = PrivilegedSession()
+            session.local_service = None  # Força o caminho pkexec + helper
+            manager.privileged = session
+        return manager
+
+    def run(self):
+        manager = self.setup()
+        result = {}
+
+        start = time.perf_counter()
+        manager.connect("gateway.bench", "bench", "secret", False)
+        result["connect"] = {"seconds": time.perf_counter() - start}
+        trace = manager.get_connect_timings(limit=1)[-1]
+        result["connect"]["phases_ms"] = {s["name"]: s["duration"] * 1000 for s in trace["spans"]}
+
+        singles = addresses("198.18.0.0/15", SINGLE_OPS)
+        samples = []
+        for address in singles:
+            start = time.perf_counter()
+            manager.add_route(address)
+            samples.append(time.perf_counter() - start)
+        result["add_route"] = describe(samples)
+
+        bulk_file = os.path.join(self.workdir, f"bulk-{self.size}.txt")
+        with open(bulk_file, "w") as f:
+            f.write("\n".join(addresses("100.64.0.0/10", self.size)) + "\n")
+        start = time.perf_counter()
+        imported = manager.import_routes(bulk_file)
+        elapsed = time.perf_counter() - start
+        result["bulk_load"] = {
+            "seconds": elapsed,
+            "routes": imported["imported"],
+            "routes_per_second": imported["imported"] / elapsed if elapsed else None,
+        }
+
+        samples = []
+        for address in singles:
+            start = time.perf_counter()
+            manager.remove_route(address, address)
+            samples.append(time.perf_counter() - start)
+        result["remove_route"] = describe(samples)
+
+        installed = len(manager.get_saved_routes())
+        start = time.perf_counter()
+        manager.disconnect()
+        elapsed = time.perf_counter() - start
+        result["disconnect"] = {
+            "seconds": elapsed,
+            "routes": installed,
+            "routes_per_second": installed / elapsed if elapsed else None,
+        }
+        return result
+
+
+def merge_runs(runs):
+    """Median of every numeric field over the repeated runs."""
+    merged = {}
+    for key in runs[0]:
+        values = [run[key] for run in runs]
+        if isinstance(values[0], dict):
+            merged[key] = merge_runs(values)
+        elif isinstance(values[0], (int, float)) and not isinstance(values[0], bool):
+            merged[key] = statistics.median(v for v in values if v is not None)
+        else:
+            merged[key] = values[0]
+    return merged
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=TOOLS_DIR,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_result(helper):
+    """Latest stored run made with the same helper mode, if any."""
+    if not os.path.isdir(RESULTS_DIR):
+        return None
+    for name in sorted((n for n in os.listdir(RESULTS_DIR) if n.endswith(".json")), reverse=True):
+        with open(os.path.join(RESULTS_DIR, name)) as f:
+            document = json.load(f)
+        if document.get("helper") == helper:
+            return document
+    return None
+
+
+def headline(result):
+    """(metric, value, unit) rows for the report, lower is better for all of them."""
+    return [
+        ("connect", result["connect"]["seconds"] * 1000, "ms"),
+        ("add_route p50", result["add_route"]["median_ms"], "ms"),
+        ("bulk_load", result["bulk_load"]["seconds"] * 1000, "ms"),
+        ("remove_route p50", result["remove_route"]["median_ms"], "ms"),
+        ("disconnect", result["disconnect"]["seconds"] * 1000, "ms"),
+    ]
+
+
+def report(results, previous):
+    old_sizes = (previous or {}).get("sizes", {})
+    for size, result in results.items():
+        print(f"\n== {size} routes ==")
+        old = dict((name, value) for name, value, _ in headline(old_sizes[size])) if size in old_sizes else {}
+        for name, value, unit in headline(result):
+            line = f"  {name:<18}{value:>10.2f} {unit}"
+            if name in old and old[name]:
+                line += f"   ({(value - old[name]) / old[name] * 100:+.1f}% vs {previous['revision']})"
+            print(line)
+
+
+def run_benchmarks(args):
+    sys.path.insert(0, SRC_DIR)
+    os.environ["PATH"] = SIMULATOR_DIR + os.pathsep + os.environ.get("PATH", "")
+    os.environ["SNX_SIM_TUNNEL"] = "1"
+    workdir = tempfile.mkdtemp(prefix="snx-bench-")
+    os.environ["SNX_SIM_PKEXEC_LOG"] = os.path.join(workdir, "pkexec.log")
+
+    import logging
+    logging.basicConfig(level=logging.WARNING)
+    # O connect ecoa a saída do snx no stdout; silencia durante as rodadas.
+    real_stdout = sys.stdout
+    results = {}
+    try:
+        for size in args.sizes:
+            runs = []
+            for _ in range(args.repeat):
+                sys.stdout = open(os.devnull, "w")
+                try:
+                    runs.append(Bench(size, args.pkexec, workdir).run())
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = real_stdout
+            results[str(size)] = merge_runs(runs)
+            print(f"{size} routes: done ({args.repeat} run(s))")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    document = {
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "kernel": platform.release(),
+        "helper": "pkexec" if args.pkexec else "in-process",
+        "repeat": args.repeat,
+        "sizes": results,
+    }
+    previous = previous_result(document["helper"])
+    report(results, previous)
+    if not args.no_save:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        path = os.path.join(RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+        with open(path, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"\nResults saved to {path}")
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Backend benchmarks against the snx simulator.")
+    parser.add_argument("--sizes", default="10,1000,10000",
+                        type=lambda s: [int(x) for x in s.split(",")],
+                        help="comma separated route counts (default: 10,1000,10000)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per size, the median is kept")
+    parser.add_argument("--pkexec", action="store_true",
+                        help="go through the fake pkexec and the helper process instead of in-process")
+    parser.add_argument("--no-save", action="store_true", help="do not store the results")
+    return parser.parse_args(argv)
+
+
+def main(argv):
+    args = parse_args(argv)
+    if os.environ.get(NETNS_MARKER) != "1":
+        if shutil.which("unshare") is None:
+            sys.exit("unshare (util-linux) is required to run the benchmarks in a network namespace.")
+        env = dict(os.environ, **{NETNS_MARKER: "1"})
+        command = ["unshare", "-rn", sys.executable, os.path.abspath(__file__)] + argv
+        os.execvpe(command[0], command, env)
+    run_benchmarks(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
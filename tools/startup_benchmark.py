@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# startup_benchmark.py
+"""
+Cold-start benchmark for the GUI, with a time budget.
+
+Measures, over fresh interpreters:
+    backend_import_ms  import back_end + controller and build the VpnManager
+    ui_import_ms       import ui.application (GTK4/libadwaita), if gi is installed
+    first_frame_ms     from process spawn to the first painted frame of the
+                       login window (needs gi and a display)
+
+Exits with 1 when a median goes over its budget, so it can gate changes:
+
+    python3 tools/startup_benchmark.py [--runs 5] [--max-import-ms 120] [--max-first-frame-ms 1500]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(os.path.dirname(TOOLS_DIR), "src")
+
+# Executado num interpretador novo a cada rodada (nada em cache no processo).
+IMPORT_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import back_end, controller
+manager = back_end.VpnManager()
+controller.Controller({"manager": manager})
+backend = time.perf_counter() - start
+ui = None
+try:
+    import gi
+except ImportError:
+    pass
+else:
+    start = time.perf_counter()
+    import ui.application
+    ui = time.perf_counter() - start
+print(json.dumps({"backend": backend, "ui": ui}))
+"""
+
+
+def measure_imports(env):
+    output = subprocess.run(
+        [sys.executable, "-c", IMPORT_PROBE], cwd=SRC_DIR, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def measure_first_frame(env, timeout=30):
+    env = dict(env, SNX_CONNECT_STARTUP_PROBE=repr(time.time()))
+    process = subprocess.run(
+        [sys.executable, "main.py"], cwd=SRC_DIR, env=env,
+        capture_output=True, text=True, timeout=timeout
+    )
+    for line in process.stdout.splitlines():
+        if line.startswith("first_frame_ms="):
+            return float(line.split("=", 1)[1])
+    raise RuntimeError(f"The app exited without painting a frame:\n{process.stderr[-2000:]}")
+
+
+def has_display():
+    return bool(os.environ.get("WAYLAND_DISPLAY") or os.environ.get("DISPLAY"))
+
+
+def gi_available():
+    return subprocess.run([sys.executable, "-c", "import gi"], capture_output=True).returncode == 0
+
+
+def median_ms(values):
+    return statistics.median(values) * 1000 if values else None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="GUI cold-start benchmark.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-import-ms", type=float, default=120.0,
+                        help="budget for the backend import + VpnManager (median)")
+    parser.add_argument("--max-ui-import-ms", type=float, default=400.0,
+                        help="budget for importing the GTK application (median)")
+    parser.add_argument("--max-first-frame-ms", type=float, default=1500.0,
+                        help="budget for spawn -> first frame (median)")
+    args = parser.parse_args(argv)
+
+    home = tempfile.mkdtemp(prefix="snx-startup-")  # Config vazio, como numa primeira execução
+    env = dict(os.environ, HOME=home)
+    try:
+        backend, ui, frames = [], [], []
+        for _ in range(args.runs):
+            result = measure_imports(env)
+            backend.append(result["backend"])
+            if result["ui"] is not None:
+                ui.append(result["ui"])
+        if gi_available() and has_display():
+            for _ in range(args.runs):
+                frames.append(measure_first_frame(env) / 1000)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    checks = [
+        ("backend_import_ms", median_ms(backend), args.max_import_ms),
+        ("ui_import_ms", median_ms(ui), args.max_ui_import_ms),
+        ("first_frame_ms", median_ms(frames), args.max_first_frame_ms),
+    ]
+    failed = False
+    for name, value, budget in checks:
+        if value is None:
+            print(f"{name:<20}   skipped (needs gi{' and a display' if name == 'first_frame_ms' else ''})")
+            continue
+        over = value > budget
+        failed |= over
+        print(f"{name:<20}{value:>9.1f} ms  (budget {budget:.0f} ms){'  OVER BUDGET' if over else ''}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))